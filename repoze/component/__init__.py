@@ -1,8 +1,10 @@
 from repoze.component.registry import Registry # API
+from repoze.component.registry import ConcurrentRegistry # API
 from repoze.component.registry import providedby # API
 from repoze.component.registry import directlyprovidedby # API
 from repoze.component.registry import provides # API
 from repoze.component.registry import onlyprovides # API
 from repoze.component.registry import ALL # API
+from repoze.component.registry import Lazy # API
 
     
@@ -0,0 +1,260 @@
+""" Benchmarks for repoze.component.  Run ``python -m
+repoze.component.bench`` to run them all, or pass the names of the
+benchmarks to run; the results are printed as JSON.  Unless they are
+labelled otherwise, the results are the time in seconds taken by one
+call; results whose names end in ``_bytes`` are sizes in bytes. """
+
+import sys
+import timeit
+
+try:
+    import cPickle as pickle
+except ImportError: # pragma: no cover
+    import pickle
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from repoze.component.registry import Registry
+from repoze.component.registry import _Registrations
+from repoze.component.registry import provides
+
+def best(func, repeat=5):
+    """ Return the shortest time in seconds taken by ``func`` over
+    ``repeat`` calls """
+    timer = timeit.default_timer
+    times = []
+    for i in range(repeat):
+        start = timer()
+        func()
+        times.append(timer() - start)
+    return min(times)
+
+def per_call(func, repeat=3, mintime=0.02):
+    """ Return the time in seconds taken by one call to ``func``.
+    ``func`` is called repeatedly until the calls take at least
+    ``mintime`` seconds, and the best of ``repeat`` such runs is
+    used. """
+    timer = timeit.default_timer
+    number = 1
+    while 1:
+        start = timer()
+        for i in xrange(number):
+            func()
+        if timer() - start >= mintime:
+            break
+        number *= 2
+    def run():
+        for i in xrange(number):
+            func()
+    return best(run, repeat) / number
+
+def registrations(count):
+    """ Return ``count`` registrations (for ``register_many``) for 100
+    provides values, half of them with one requires value and half
+    with two """
+    result = []
+    for i in xrange(count):
+        if i % 2:
+            requires = ('type%d' % i,)
+        else:
+            requires = ('type%d' % i, 'context%d' % (i % 10))
+        result.append(('provides%d' % (i % 100), 'component%d' % i,
+                       requires))
+    return result
+
+def make_registry(count, **kw):
+    """ Return a registry holding ``registrations(count)`` """
+    registry = Registry(**kw)
+    for provides, component, requires in registrations(count):
+        registry.register(provides, component, *requires)
+    return registry
+
+def bench_pickle(count=10000):
+    registry = make_registry(count)
+    protocol = pickle.HIGHEST_PROTOCOL
+    dumped = pickle.dumps(registry, protocol)
+    return {
+        'registrations':count,
+        'size':len(dumped),
+        # the registration tree, as pickling the registry's attributes
+        # would store it (without its caches, which cannot be pickled)
+        'data_size':len(pickle.dumps(registry.data, protocol)),
+        'dump_seconds':best(lambda: pickle.dumps(registry, protocol)),
+        'load_seconds':best(lambda: pickle.loads(dumped)),
+        }
+
+def bench_lookup(count=1000):
+    # warm lookups are answered from the lookup cache, cold lookups
+    # (with the cache disabled) search the requires combinations
+    results = {}
+    for label, size in (('warm', 1000), ('cold', 0)):
+        registry = make_registry(count, lookup_cache_size=size)
+        results[label] = per_call(
+            lambda: registry.lookup('provides8', 'type8', 'context8'))
+        results[label + '_notfound'] = per_call(
+            lambda: registry.lookup('provides8', 'type9', 'context8',
+                                    default=None))
+    return results
+
+def make_types(count):
+    """ Return a class whose instances supply ``count`` component types
+    (as well as their class and ``None``) """
+    cls = type('Supplies%d' % count, (object,), {})
+    provides(cls, *[ 'type%d' % i for i in range(count) ])
+    return cls
+
+def bench_resolve(types=(1, 5, 10), positions=(1, 2, 3, 4)):
+    # the component is registered for the least specific type at each
+    # position, so a cold resolve tries most of the combinations
+    results = {}
+    for typecount in types:
+        cls = make_types(typecount)
+        for positioncount in positions:
+            objects = [ cls() for i in range(positioncount) ]
+            requires = ('type%d' % (typecount - 1),) * positioncount
+            for label, size in (('warm', 1000), ('cold', 0)):
+                registry = Registry(lookup_cache_size=size)
+                registry.register('view', 'component', *requires)
+                resolve = registry.resolve
+                results['%s_%d_types_%d_positions' % (
+                    label, typecount, positioncount)] = per_call(
+                    lambda: resolve('view', *objects))
+    return results
+
+def bench_register(count=10000):
+    # registering ``count`` components into an indexed registry which
+    # has cached lookups, one by one and with register_many
+    items = registrations(count)
+    def setup():
+        registry = Registry(indexed=True)
+        for i in range(100):
+            registry.lookup('provides%d' % i, 'type%d' % i, default=None)
+        return registry
+    def register():
+        registry = setup()
+        for provides, component, requires in items:
+            registry.register(provides, component, *requires)
+    def register_many():
+        setup().register_many(items)
+    return {'registrations':count,
+            'seconds':best(register, 3),
+            'register_many_seconds':best(register_many, 3),
+            }
+
+def bench_subscribe(count=100):
+    # subscribing and then unsubscribing one subscriber when ``count``
+    # subscribers are already subscribed
+    registry = Registry()
+    for i in range(count):
+        registry.subscribe(lambda *arg: None, 'event')
+    def subscriber(*arg):
+        pass
+    def churn():
+        registry.subscribe(subscriber, 'event')
+        registry.unsubscribe(subscriber, 'event')
+    return {'subscribers':count,
+            'churn':per_call(churn),
+            }
+
+def bench_notify(fanouts=(1, 10, 100)):
+    # notifying ``fanout`` subscribers to one of the types of an event
+    cls = make_types(5)
+    event = cls()
+    results = {}
+    for fanout in fanouts:
+        registry = Registry()
+        for i in range(fanout):
+            registry.subscribe(lambda *arg: None, 'type0')
+        results['%d_subscribers' % fanout] = per_call(
+            lambda: registry.notify(event))
+    return results
+
+def bench_copy(count=10000):
+    # copying a registry holding ``count`` components, and changing
+    # the copy once
+    registry = make_registry(count)
+    def copy_register():
+        registry.copy().register('provides0', 'other', 'type0')
+    return {'registrations':count,
+            'copy':per_call(registry.copy),
+            'copy_register':per_call(copy_register),
+            }
+
+def layout_size(obj, seen=None):
+    """ Return the number of bytes used by the dictionaries, lists,
+    tuples and registration records making up ``obj``, not counting
+    the values (strings, components) they hold """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, dict):
+        size = sys.getsizeof(obj)
+        for key, value in obj.items():
+            size += layout_size(key, seen) + layout_size(value, seen)
+        return size
+    if isinstance(obj, (list, tuple)):
+        size = sys.getsizeof(obj)
+        for item in obj:
+            size += layout_size(item, seen)
+        return size
+    if isinstance(obj, _Registrations):
+        return (sys.getsizeof(obj) + layout_size(obj.entries, seen) +
+                layout_size(obj.all, seen))
+    return 0
+
+def bench_memory(counts=(10000, 100000)):
+    # the size of the registrations of a registry with the default
+    # layout and with compact=True, holding components registered for
+    # requires tuples of their own and holding named utilities (which
+    # share the empty requires tuple)
+    results = {}
+    for count in counts:
+        for label, compact in (('default', False), ('compact', True)):
+            registry = make_registry(count, compact=compact)
+            results['%s_%d_bytes' % (label, count)] = layout_size(
+                registry.data)
+            registry = Registry(compact=compact)
+            for i in xrange(count):
+                registry.register('utility', 'component%d' % i,
+                                  name='name%d' % i)
+            results['%s_shared_%d_bytes' % (label, count)] = layout_size(
+                registry.data)
+    return results
+
+benchmarks = [
+    ('lookup', bench_lookup),
+    ('resolve', bench_resolve),
+    ('register', bench_register),
+    ('subscribe', bench_subscribe),
+    ('notify', bench_notify),
+    ('copy', bench_copy),
+    ('pickle', bench_pickle),
+    ('memory', bench_memory),
+    ]
+
+def run(names=None):
+    """ Run the benchmarks named in ``names`` (all of them if it is
+    ``None``) and return a dictionary of their results """
+    results = {}
+    for name, benchmark in benchmarks:
+        if names is None or name in names:
+            results[name] = benchmark()
+    return results
+
+def main(argv=sys.argv, out=sys.stdout):
+    names = argv[1:] or None
+    known = [ name for name, benchmark in benchmarks ]
+    for name in names or ():
+        if name not in known:
+            raise ValueError('Unknown benchmark %r (choose from %s)' % (
+                name, ', '.join(known)))
+    json.dump(run(names), out, indent=2, sort_keys=True)
+    out.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+""" Cached configurations, which save a process the cost of parsing
+YAML configuration files and running their directives each time it
+starts.
+
+``dump(registry, sources, path)`` writes the registrations of a
+registry populated by executing a configuration to a file, together
+with a digest of each of the configuration files (``sources``) it was
+made from.  ``load(registry, path)`` registers them again in another
+registry, as long as none of the sources have changed since.
+``execute(filename, registry, path)`` does both: it loads the cached
+registrations if it can, and otherwise executes the configuration
+using :mod:`repoze.configuration` and writes a new cache file.
+
+Components are stored by reference (as the :mod:`pickle` module
+stores classes and functions), so they must be importable; ``Lazy``
+placeholders are stored as placeholders, and are still only imported
+when they are first looked up after the cache is loaded.  The
+registrations are stored in an order which gives ``name=ALL`` lookups
+the same components in the same order after the cache is loaded,
+including components replaced by a later registration under the same
+name. """
+
+import os
+
+try:
+    import cPickle as pickle
+except ImportError: # pragma: no cover
+    import pickle
+
+try:
+    from hashlib import sha1
+except ImportError: # pragma: no cover
+    from sha import sha as sha1
+
+from repoze.component.registry import ALL
+from repoze.component.registry import Lazy
+from repoze.component.registry import Registry
+from repoze.component.registry import _dottedname
+from repoze.component.registry import _subscribers
+
+_magic = 'RCCFG002'
+
+def digest(filename):
+    """ Return a digest of the contents of the file ``filename`` """
+    f = open(filename, 'rb')
+    try:
+        return sha1(f.read()).hexdigest()
+    finally:
+        f.close()
+
+def _portable(component):
+    # the component to store for ``component``: placeholders which
+    # are loaded by a resolver (such as a configuration declaration's)
+    # are replaced by placeholders which import the component by its
+    # full dotted name
+    if component.__class__ is Lazy:
+        obj = component.load()
+        dottedname = _dottedname(obj)
+        if dottedname is None:
+            raise ValueError(
+                '%r cannot be stored in a configuration cache; lazily '
+                'registered components must be module-level classes or '
+                'functions' % (obj,))
+        return Lazy(dottedname)
+    if component.__class__ is list:
+        return [ _portable(item) for item in component ]
+    return component
+
+def _calls(provides, named, all):
+    # the (name, component) registrations which, made in turn, leave
+    # the components in ``named`` (a dictionary) registered under their
+    # names with ``all`` as the ALL list for ``provides``; components in
+    # ``all`` which were replaced are registered under a name which is
+    # registered again later
+    positions = {}
+    for i, component in enumerate(all):
+        positions.setdefault(id(component), []).append(i)
+    names = {}
+    for name, component in named.items():
+        candidates = positions.get(id(component))
+        if not candidates:
+            raise ValueError(
+                'The registrations of %r cannot be stored in a '
+                'configuration cache' % (provides,))
+        names[candidates.pop()] = name
+    latest = max(names or [-1])
+    calls = []
+    for i, component in enumerate(all):
+        name = names.get(i)
+        if name is None:
+            if i > latest:
+                raise ValueError(
+                    'The registrations of %r cannot be stored in a '
+                    'configuration cache' % (provides,))
+            name = names[latest]
+        calls.append((name, component))
+    return calls
+
+def _registrations(registry):
+    # the registrations of ``registry``, in an order which registers
+    # the components for each requires tuple and provides value in the
+    # order of its ALL list
+    registrations = []
+    for requires, info in registry.data.items():
+        byprovides = {}
+        for (provides, name), component in info.items():
+            named = byprovides.setdefault(provides, {})
+            if name is not ALL:
+                named[name] = component
+        for provides, named in byprovides.items():
+            all = info.get((provides, ALL), [])
+            for name, component in _calls(provides, named, all):
+                registrations.append(
+                    (provides, _portable(component), requires, name))
+    return registrations
+
+def dump(registry, sources, path):
+    """ Write the registrations of ``registry`` to the file ``path``
+    along with a digest of each of the files named in ``sources``,
+    which are the configuration files the registrations were made
+    from.  Lazily registered components are loaded to find out their
+    dotted names. """
+    _write(path, sources, _registrations(registry))
+
+def _write(path, sources, registrations):
+    digests = [ (os.path.abspath(filename), digest(filename))
+                for filename in sources ]
+    # write a new file and rename it so that a process loading the
+    # old file never sees a partly written one
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    f = open(temp, 'wb')
+    try:
+        try:
+            pickle.dump((_magic, digests, registrations), f,
+                        pickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+    except:
+        os.remove(temp)
+        raise
+    os.rename(temp, path)
+
+def _read(path):
+    # the contents of the cache file ``path`` if it exists and its
+    # sources are unchanged, otherwise None
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            cached = pickle.load(f)
+        except Exception:
+            return None
+    finally:
+        f.close()
+    if not isinstance(cached, tuple) or cached[:1] != (_magic,):
+        return None
+    magic, digests, registrations = cached
+    for filename, filedigest in digests:
+        try:
+            if digest(filename) != filedigest:
+                return None
+        except IOError:
+            return None
+    return registrations
+
+def load(registry, path):
+    """ Register the registrations stored in the file ``path`` by
+    ``dump`` in ``registry`` and return ``True``.  If the file doesn't
+    exist, can't be read, or any of the configuration files it was
+    made from has changed, nothing is registered and ``False`` is
+    returned. """
+    registrations = _read(path)
+    if registrations is None:
+        return False
+    _replay(registry, registrations)
+    return True
+
+def _replay(registry, registrations):
+    with registry.batch():
+        for provides, component, requires, name in registrations:
+            if provides is _subscribers and component.__class__ is list:
+                for subscriber in component:
+                    registry.subscribe(subscriber, *requires, **{'name':name})
+            else:
+                registry.register(provides, component, *requires,
+                                  **{'name':name})
+
+def _configure(filename, registry):
+    # execute a configuration file with repoze.configuration
+    from repoze.configuration import Context
+    from repoze.configuration import execute
+    context = Context(registry)
+    execute(filename, context=context)
+
+def execute(filename, registry, path, sources=None):
+    """ Populate ``registry`` from the configuration file
+    ``filename``, using the cache file ``path`` if none of the
+    configuration files have changed since it was written.  Otherwise
+    the configuration is executed with :mod:`repoze.configuration`
+    and a new cache file is written.  ``sources`` is the list of
+    configuration files whose changes make the cache out of date; it
+    defaults to ``filename`` alone, so the files it includes should be
+    listed too.  Return ``True`` if the cache was used. """
+    if load(registry, path):
+        return True
+    if sources is None:
+        sources = [filename]
+    configured = Registry()
+    _configure(filename, configured)
+    registrations = _registrations(configured)
+    _write(path, sources, registrations)
+    _replay(registry, registrations)
+    return False
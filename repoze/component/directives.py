@@ -1,3 +1,4 @@
+from repoze.component.registry import Lazy
 from repoze.component.registry import _subscribers
 
 def component(declaration):
@@ -20,7 +21,11 @@ def component(declaration):
 
     override = declaration.boolean('override', False)
 
-    component = declaration.resolve(component)
+    if declaration.boolean('lazy', False):
+        # imported when it is first looked up
+        component = Lazy(component, declaration.resolve)
+    else:
+        component = declaration.resolve(component)
 
     name = declaration.string('name', '')
     kw = dict(name=name)
@@ -0,0 +1,336 @@
+""" Read-only registry snapshots in files which many processes can map
+into memory at once.
+
+``export(registry, path)`` writes the registrations of a registry to a
+file.  Each worker process then opens it as a ``MappedRegistry``,
+which answers ``lookup``, ``resolve`` and ``notify`` by searching the
+tables in the file instead of a tree of Python objects, so the pages
+holding the tables are shared between all the processes which map the
+file rather than being copied into each of them once reference counts
+change after a fork.
+
+Provides values, names and requires values are stored once each and
+referred to by number.  They may be strings, integers, ``None`` or
+objects which can be imported by dotted name (classes and functions
+defined at the top level of a module).  Components may be any of
+these or lists of them; components which are imported are imported
+in each process the first time they are returned.  ``Lazy``
+placeholders are loaded by ``export`` and stored as the components
+they load. """
+
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from repoze.component.registry import ALL
+from repoze.component.registry import FrozenRegistry
+from repoze.component.registry import Lazy
+from repoze.component.registry import _subscribers
+
+_magic = 'RCMAP001'
+_header = struct.Struct('<8s11I')
+_maxids = 10000
+
+def _hash(bytes):
+    return zlib.crc32(bytes) & 0xffffffff
+
+def _words(values):
+    return struct.pack('<%dI' % len(values), *values)
+
+def _encode(value, intern=None):
+    # return the string stored in a snapshot for ``value`` or None if
+    # the value cannot be stored; ``intern`` returns the number of an
+    # item of a list (lists are never looked up, only returned)
+    if value.__class__ is Lazy:
+        # stored as the component it loads, which is imported again
+        # when it is first returned
+        value = value.load()
+    if value is None:
+        return 'N'
+    if value is ALL:
+        return 'A'
+    if value is _subscribers:
+        return 'S'
+    kind = type(value)
+    if kind is str:
+        return 's' + value
+    if kind is unicode:
+        try:
+            # equal to (and found in the same place as) the str
+            return 's' + value.encode('ascii')
+        except UnicodeError:
+            return 'u' + value.encode('utf-8')
+    if kind in (int, long):
+        return 'i' + str(value)
+    if kind is list:
+        if intern is None:
+            return None
+        return 'l' + _words([ intern(item) for item in value ])
+    module = getattr(value, '__module__', None)
+    name = getattr(value, '__name__', None)
+    if module and name:
+        if getattr(sys.modules.get(module), name, None) is value:
+            return 'o%s.%s' % (module, name)
+    return None
+
+class _Writer(object):
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def intern(self, value):
+        encoded = _encode(value, self.intern)
+        if encoded is None:
+            raise ValueError(
+                '%r cannot be stored in a registry snapshot; only strings, '
+                'integers, None, module-level classes and functions and '
+                'lists of these can be' % (value,))
+        id = self.ids.get(encoded)
+        if id is None:
+            id = len(self.values)
+            self.values.append(encoded)
+            self.ids[encoded] = id
+        return id
+
+def _hashtable(hashes):
+    # open addressing with linear probing; slots hold an item number
+    # plus one, zero marks an empty slot
+    size = 2
+    while size < len(hashes) * 2:
+        size *= 2
+    mask = size - 1
+    slots = [0] * size
+    for number, hashed in enumerate(hashes):
+        slot = hashed & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = number + 1
+    return slots
+
+def export(registry, path):
+    """ Write the registrations of ``registry`` to the file ``path``,
+    which can then be opened as a ``MappedRegistry``.  Raises a
+    ``ValueError`` if a provides value, name, requires value or
+    component cannot be stored (see the module documentation). """
+    writer = _Writer()
+    intern = writer.intern
+    words = []
+    keyhashes = []
+    offsets = []
+    members = []
+    for requires, info in registry.data.items():
+        rids = [ intern(value) for value in requires ]
+        for (provides, name), component in info.items():
+            key = [intern(provides), intern(name)] + rids
+            offsets.append(len(words))
+            if not requires and name == '':
+                members.append(len(words))
+            words.append(len(rids))
+            words.extend(key)
+            words.append(intern(component))
+            keyhashes.append(_hash(_words(key)))
+    entryslots = [ offsets[number - 1] + 1 if number else 0
+                   for number in _hashtable(keyhashes) ]
+    values = writer.values
+    valueslots = _hashtable([ _hash(value) for value in values ])
+    valueoffsets = [0]
+    for value in values:
+        valueoffsets.append(valueoffsets[-1] + len(value))
+
+    sections = [_words(valueoffsets), _words(valueslots), _words(words),
+                _words(entryslots), _words(members), ''.join(values)]
+    starts = []
+    position = _header.size
+    for section in sections:
+        starts.append(position)
+        position += len(section)
+    header = _header.pack(_magic, int(registry.listener_registered),
+                          len(values), starts[0], starts[1],
+                          len(valueslots), starts[2], starts[3],
+                          len(entryslots), starts[4], len(members),
+                          starts[5])
+    # write a new file and rename it so that processes which have the
+    # old file mapped are not disturbed
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    f = open(temp, 'wb')
+    try:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    finally:
+        f.close()
+    os.rename(temp, path)
+
+class _MappedTable(object):
+    # stands in for the (provides, name) -> {requires:component} table
+    # of a FrozenRegistry
+    def __init__(self, registry):
+        self.registry = registry
+
+    def get(self, regkey, default=None):
+        registry = self.registry
+        provides, name = regkey
+        pid = registry._valueid(provides)
+        nid = registry._valueid(name)
+        if pid is None or nid is None:
+            return default
+        return _MappedRequires(registry, pid, nid)
+
+class _MappedRequires(object):
+    def __init__(self, registry, pid, nid):
+        self.registry = registry
+        self.key = (pid, nid)
+
+    def get(self, requires, default=None):
+        registry = self.registry
+        key = list(self.key)
+        for value in requires:
+            id = registry._valueid(value)
+            if id is None:
+                return default
+            key.append(id)
+        return registry._find(key, default)
+
+class MappedRegistry(FrozenRegistry):
+    """ A read-only registry whose registrations are in a file written
+    by ``export``, mapped into memory.  It supports the read-only API
+    of a ``FrozenRegistry``; any attempt to change it raises a
+    ``TypeError``.  Lookup results are cached by each process, as
+    they are by a ``FrozenRegistry``; ``lookup_cache_size`` sets the
+    size of that cache.
+
+    A mapped registry is pickled as the name of its file, which is
+    opened again when it is unpickled."""
+    def __init__(self, path, lookup_cache_size=1000):
+        self.path = path
+        f = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        if len(self._map) < _header.size:
+            self._map.close()
+            raise ValueError('%s is not a registry snapshot' % path)
+        (magic, flags, nvalues, self._valueoffsets, self._valueslots,
+         self._nvalueslots, self._entries, self._entryslots,
+         self._nentryslots, members, nmembers,
+         self._valuedata) = _header.unpack_from(self._map, 0)
+        if magic != _magic:
+            self._map.close()
+            raise ValueError('%s is not a registry snapshot' % path)
+        self._ids = {}
+        self._objects = {}
+        self._table = _MappedTable(self)
+        self._dictmembers = {}
+        for i in range(nmembers):
+            offset = self._readword(members + 4 * i)
+            provides, name, component = self._readwords(
+                self._entries + 4 * offset + 4, 3)
+            self._dictmembers[self._object(provides)] = self._object(
+                component)
+        self._plans = {}
+        self._plansize = lookup_cache_size
+        self._executors = {}
+        self._lkpcache = {}
+        self._lkpcachesize = lookup_cache_size
+        self._combocache = {}
+        self._indexed = False
+        self.listener_registered = bool(flags & 1)
+        self.reset_stats()
+
+    def __reduce__(self):
+        return (self.__class__, (self.path, self._lkpcachesize))
+
+    def __cmp__(self, other):
+        if isinstance(other, MappedRegistry):
+            other = other._dictmembers
+        return cmp(self._dictmembers, other)
+
+    def close(self):
+        """ Unmap the file.  The registry cannot be used afterwards. """
+        self._map.close()
+
+    def _readword(self, position):
+        return struct.unpack_from('<I', self._map, position)[0]
+
+    def _readwords(self, position, count):
+        return struct.unpack_from('<%dI' % count, self._map, position)
+
+    def _value(self, id):
+        start, end = self._readwords(self._valueoffsets + 4 * id, 2)
+        return self._map[self._valuedata + start:self._valuedata + end]
+
+    def _valueid(self, value):
+        # the number of ``value`` in the file, or None if it isn't there
+        ids = self._ids
+        try:
+            return ids[value]
+        except KeyError:
+            pass
+        id = None
+        encoded = _encode(value)
+        if encoded is not None:
+            mask = self._nvalueslots - 1
+            slot = _hash(encoded) & mask
+            while 1:
+                number = self._readword(self._valueslots + 4 * slot)
+                if not number:
+                    break
+                if self._value(number - 1) == encoded:
+                    id = number - 1
+                    break
+                slot = (slot + 1) & mask
+        if len(ids) >= _maxids:
+            ids.clear()
+        ids[value] = id
+        return id
+
+    def _find(self, key, default):
+        # the component registered for a key of value numbers
+        # (provides, name, requires...)
+        count = len(key)
+        mask = self._nentryslots - 1
+        slot = _hash(_words(key)) & mask
+        while 1:
+            number = self._readword(self._entryslots + 4 * slot)
+            if not number:
+                return default
+            position = self._entries + 4 * (number - 1)
+            if self._readword(position) == count - 2:
+                record = self._readwords(position + 4, count + 1)
+                if list(record[:count]) == key:
+                    return self._object(record[count])
+            slot = (slot + 1) & mask
+
+    def _object(self, id):
+        # the value numbered ``id``, importing it if necessary; each
+        # value is made only once
+        try:
+            return self._objects[id]
+        except KeyError:
+            pass
+        encoded = self._value(id)
+        kind, rest = encoded[:1], encoded[1:]
+        if kind == 'N':
+            value = None
+        elif kind == 'A':
+            value = ALL
+        elif kind == 'S':
+            value = _subscribers
+        elif kind == 's':
+            value = rest
+        elif kind == 'u':
+            value = rest.decode('utf-8')
+        elif kind == 'i':
+            value = int(rest)
+        elif kind == 'l':
+            items = struct.unpack('<%dI' % (len(rest) // 4), rest)
+            value = [ self._object(item) for item in items ]
+        else:
+            module, name = rest.rsplit('.', 1)
+            __import__(module)
+            value = getattr(sys.modules[module], name)
+        self._objects[id] = value
+        return value
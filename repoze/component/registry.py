@@ -1,7 +1,15 @@
 import inspect
 import sys
+import threading
+import timeit
+
+from contextlib import contextmanager
+
+from types import ClassType
+from types import MemberDescriptorType
+
+from operator import itemgetter
 
-from repoze.lru import lru_cache
 from repoze.lru import LRUCache
 
 from repoze.component.advice import addClassAdvisor
@@ -10,12 +18,17 @@ ALL = object()
 _marker = object()
 _notfound = object()
 _missing = object()
+_classtypes = (type, ClassType)
 
-class Subscribers:
+class Subscribers(object):
     def __repr__(self):
         return '<subscriber>'
     __str__ = __repr__
 
+    def __reduce__(self):
+        # pickled by reference, so it is still the same object
+        return '_subscribers'
+
 _subscribers = Subscribers()
 
 try:
@@ -68,9 +81,436 @@ def augmented_product(args, default_list):
         for combo in product(*default_list):
             yield combo
 
-@lru_cache(1000)
-def cached_augmented_product(args, default_list):
-    return tuple(augmented_product(args, default_list))
+def combination_precedence(combo, args, default_list):
+    """ Return a value which sorts lower the earlier ``combo`` is
+    produced by ``augmented_product(args, default_list)``, or ``None``
+    if it is not produced at all.  This avoids generating the
+    combinations which precede ``combo``."""
+    largs = len(args)
+    indexes = _indexes(combo, args)
+    if None not in indexes:
+        # one of the directly supplied product combos
+        return (0, tuple(indexes))
+    if default_list:
+        ldef = len(default_list[0])
+        if ldef:
+            # a single hole filled with the first default (the
+            # remaining defaults are never used in these holes)
+            for num in range(largs-1, -1, -1):
+                if combo[num] != default_list[num][0]:
+                    continue
+                holes = [ x for x in indexes if x is None ]
+                if len(holes) == 1 and indexes[num] is None:
+                    return (1, largs-1-num, tuple(indexes[:num]) +
+                            tuple(indexes[num+1:]))
+            # a single supplied value among the defaults
+            for i in range(ldef):
+                for j in range(largs):
+                    if indexes[j] is None:
+                        continue
+                    for k in range(largs):
+                        if k != j and combo[k] != default_list[k][i]:
+                            break
+                    else:
+                        return (2, i, j, indexes[j])
+        # all defaults
+        dindexes = _indexes(combo, default_list)
+        if None not in dindexes:
+            return (3, tuple(dindexes))
+    return None
+
+def _indexes(combo, seqs):
+    indexes = []
+    for value, seq in zip(combo, seqs):
+        try:
+            indexes.append(seq.index(value))
+        except ValueError:
+            indexes.append(None)
+    return indexes
+
+def combination_template(shape):
+    """ Return a tuple of callables, one per combination produced by
+    ``augmented_product``, in the same order.  Each callable accepts
+    the ``flatten_requires`` tuple of the ``args`` and
+    ``default_list`` which would have been passed to
+    ``augmented_product`` and returns that combination.  ``shape`` is
+    the ``requires_shape`` of those arguments; the template depends
+    only on it and not on the values themselves, so the combinations
+    can be made one at a time as they are needed."""
+    arglengths, deflengths = shape
+    args = []
+    offset = 0
+    for length in arglengths:
+        args.append(tuple(range(offset, offset + length)))
+        offset += length
+    if deflengths is None:
+        default_list = None
+    else:
+        default_list = []
+        for length in deflengths:
+            default_list.append(tuple(range(offset, offset + length)))
+            offset += length
+    template = []
+    seen = set()
+    for indexes in augmented_product(args, default_list):
+        if indexes in seen:
+            continue
+        seen.add(indexes)
+        if len(indexes) == 1:
+            getter = itemgetter(slice(indexes[0], indexes[0] + 1))
+        elif indexes:
+            getter = itemgetter(*indexes)
+        else:
+            getter = itemgetter(slice(0, 0))
+        template.append(getter)
+    return tuple(template)
+
+def requires_shape(args, default_list):
+    """ Return the shape of the ``args`` and ``default_list`` arguments
+    to ``augmented_product``: the lengths of their elements """
+    arglengths = tuple([ len(x) for x in args ])
+    if default_list:
+        return arglengths, tuple([ len(x) for x in default_list ])
+    return arglengths, None
+
+def flatten_requires(args, default_list):
+    """ Return the values in ``args`` followed by the values in
+    ``default_list`` as a single tuple """
+    flat = ()
+    for values in args:
+        flat += values
+    if default_list:
+        for values in default_list:
+            flat += values
+    return flat
+
+class UnboundedCache(object):
+    """ A cache with the ``LRUCache`` interface which never evicts """
+    size = None
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def put(self, key, val):
+        self.data[key] = val
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+class NullCache(object):
+    """ A cache with the ``LRUCache`` interface which never stores """
+    size = 0
+
+    def get(self, key, default=None):
+        return default
+
+    def put(self, key, val):
+        pass
+
+    def invalidate(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+def makecache(size):
+    """ Return a cache holding at most ``size`` entries.  A ``size`` of
+    ``None`` returns a cache which is never pruned, a ``size`` of ``0``
+    returns a cache which stores nothing."""
+    if size is None:
+        return UnboundedCache()
+    if size == 0:
+        return NullCache()
+    return LRUCache(size)
+
+def _evictions(cache):
+    return getattr(cache, 'evictions', 0)
+
+class Lazy(object):
+    """ A placeholder which may be registered in place of a component
+    so that the component is only imported when it is needed.  The
+    component is loaded the first time a ``lookup``, ``resolve`` or
+    ``notify`` finds the placeholder (or a list holding it), and that
+    call returns or calls the component itself; it is then kept, so
+    it is only loaded once.  If loading raises an exception, the call
+    raises it and the component is loaded again by the next call.
+    ``unregister`` and ``unsubscribe`` accept either the placeholder
+    or the component it has loaded.
+
+    ``dottedname`` names the component, either as ``module.name`` or
+    as ``module:name``.  ``resolve``, if supplied, is called with the
+    dotted name to load the component instead.  Pickling a placeholder
+    with a ``resolve`` of its own loads the component and stores its
+    full dotted name instead of ``resolve``, if it is a module-level
+    class or function."""
+    def __init__(self, dottedname, resolve=None):
+        self.dottedname = dottedname
+        if resolve is None:
+            resolve = _importname
+        self._resolve = resolve
+        self._object = _marker
+
+    def load(self):
+        """ Return the component, loading it if it hasn't been loaded """
+        obj = self._object
+        if obj is _marker:
+            obj = self._object = self._resolve(self.dottedname)
+        return obj
+
+    def __reduce__(self):
+        # the component is loaded again after unpickling; a component
+        # loaded by a resolver of its own (such as the bound method of a
+        # configuration declaration, which can't be pickled) is loaded
+        # now and stored by its full dotted name if it has one
+        if self._resolve is _importname:
+            return (self.__class__, (self.dottedname,))
+        dottedname = _dottedname(self.load())
+        if dottedname is None:
+            return (self.__class__, (self.dottedname, self._resolve))
+        return (self.__class__, (dottedname,))
+
+    def __repr__(self):
+        return '<Lazy %s>' % self.dottedname
+
+def _importname(dottedname):
+    if ':' in dottedname:
+        module, attrs = dottedname.split(':', 1)
+    else:
+        module, attrs = dottedname.rsplit('.', 1)
+    __import__(module)
+    obj = sys.modules[module]
+    for attr in attrs.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+def _dottedname(obj):
+    # the ``module:name`` which imports ``obj``, or None if it isn't a
+    # module-level class or function
+    module = getattr(obj, '__module__', None)
+    name = getattr(obj, '__name__', None)
+    if module and name:
+        if getattr(sys.modules.get(module), name, None) is obj:
+            return '%s:%s' % (module, name)
+    return None
+
+def _islazy(component):
+    if component.__class__ is Lazy:
+        return True
+    if component.__class__ is list:
+        for item in component:
+            if item.__class__ is Lazy:
+                return True
+    return False
+
+def _unlazy(component):
+    # the registered component with Lazy placeholders (also those in
+    # lists, such as subscriber lists and ALL lists) loaded
+    cls = component.__class__
+    if cls is Lazy:
+        return component.load()
+    if cls is list:
+        loaded = [ _unlazy(item) for item in component ]
+        for item, loadeditem in zip(component, loaded):
+            if item is not loadeditem:
+                return loaded
+    return component
+
+# the most registrations a compact registry keeps for one requires
+# tuple in a ``_Registrations`` record; beyond this the record is
+# replaced by an ordinary dictionary
+_compactlimit = 8
+
+class _Registrations(object):
+    """ The registrations for one requires tuple in a compact registry.
+    It stands in for the dictionary a ``Registry`` otherwise keeps
+    for each requires tuple, mapping ``(provides, name)`` to a
+    component and ``(provides, ALL)`` to the list of components
+    registered for ``provides``, but keeps the registrations in a
+    flat tuple of ``provides, name, component`` triples.  The
+    ``(provides, ALL)`` lists are made when they are asked for; the
+    ``provides, component`` pairs they are made from are only kept
+    in ``all`` when they differ from those in ``entries`` (when a
+    registration has been replaced).  Finding a registration means
+    scanning the tuple, so a registry only keeps the registrations
+    for a requires tuple in a record while there are no more than
+    ``_compactlimit`` of them."""
+    __slots__ = ('entries', 'all')
+
+    def __init__(self, info=None):
+        self.entries = ()
+        self.all = None
+        if info:
+            entries = []
+            all = []
+            for (provides, name), component in info.items():
+                if name is ALL:
+                    for component in component:
+                        all.extend((provides, component))
+                else:
+                    entries.extend((provides, name, component))
+            self.entries = tuple(entries)
+            self._setall(tuple(all))
+
+    def _pairs(self):
+        if self.all is not None:
+            return self.all
+        entries = self.entries
+        pairs = []
+        for i in xrange(0, len(entries), 3):
+            pairs.append(entries[i])
+            pairs.append(entries[i+2])
+        return tuple(pairs)
+
+    def _setall(self, all):
+        entries = self.entries
+        if len(all) * 3 == len(entries) * 2:
+            for i in xrange(0, len(all), 2):
+                j = i // 2 * 3
+                if all[i] != entries[j] or all[i+1] is not entries[j+2]:
+                    break
+            else:
+                all = None
+        self.all = all
+
+    def _find(self, provides, name):
+        entries = self.entries
+        for i in xrange(0, len(entries), 3):
+            if entries[i] == provides and entries[i+1] == name:
+                return i
+        return -1
+
+    def add(self, provides, name, component):
+        all = self._pairs() + (provides, component)
+        entries = self.entries
+        i = self._find(provides, name)
+        if i < 0:
+            self.entries = entries + (provides, name, component)
+        else:
+            self.entries = entries[:i+2] + (component,) + entries[i+3:]
+        self._setall(all)
+
+    def remove(self, provides, name, component):
+        i = self._find(provides, name)
+        if i < 0:
+            raise KeyError((provides, name))
+        entries = self.entries
+        all = list(self._pairs())
+        for j in xrange(0, len(all), 2):
+            if all[j] == provides and _registered(all[j+1], component):
+                break
+        else:
+            for j in xrange(0, len(all), 2):
+                if all[j] == provides and all[j+1] == component:
+                    break
+            else:
+                raise ValueError('%r is not registered' % (component,))
+        del all[j:j+2]
+        self.entries = entries[:i] + entries[i+3:]
+        self._setall(tuple(all))
+
+    def __getitem__(self, key):
+        provides, name = key
+        if name is ALL:
+            pairs = self._pairs()
+            result = [ pairs[i+1] for i in xrange(0, len(pairs), 2)
+                       if pairs[i] == provides ]
+            if not result:
+                raise KeyError(key)
+            return result
+        i = self._find(provides, name)
+        if i < 0:
+            raise KeyError(key)
+        return self.entries[i+2]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        entries = self.entries
+        keys = [ (entries[i], entries[i+1])
+                 for i in xrange(0, len(entries), 3) ]
+        pairs = self._pairs()
+        seen = []
+        for i in xrange(0, len(pairs), 2):
+            if pairs[i] not in seen:
+                seen.append(pairs[i])
+                keys.append((pairs[i], ALL))
+        return keys
+
+    def items(self):
+        return [ (key, self[key]) for key in self.keys() ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, _Registrations):
+            other = dict(other.items())
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __cmp__(self, other):
+        if isinstance(other, _Registrations):
+            other = dict(other.items())
+        return cmp(dict(self.items()), other)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+def _copyinfo(info):
+    # a copy of the registrations for one requires tuple which can be
+    # changed without changing ``info``: the (provides, ALL) lists and
+    # the subscriber lists, which are changed in place, are copied
+    # (keeping each subscriber list the same object in the ALL list)
+    copies = {}
+    def copied(provides, component):
+        if provides is not _subscribers:
+            return component
+        new = copies.get(id(component))
+        if new is None:
+            new = copies[id(component)] = list(component)
+        return new
+    if info.__class__ is _Registrations:
+        new = _Registrations()
+        entries = list(info.entries)
+        for i in xrange(0, len(entries), 3):
+            entries[i+2] = copied(entries[i], entries[i+2])
+        new.entries = tuple(entries)
+        if info.all is not None:
+            all = list(info.all)
+            for i in xrange(0, len(all), 2):
+                all[i+1] = copied(all[i], all[i+1])
+            new.all = tuple(all)
+        return new
+    new = {}
+    for (provides, name), component in info.items():
+        if name is ALL:
+            new[(provides, name)] = [ copied(provides, item)
+                                      for item in component ]
+        else:
+            new[(provides, name)] = copied(provides, component)
+    return new
 
 class Registry(object):
     """ A component registry.  The component registry supports the
@@ -78,25 +518,188 @@ class Registry(object):
     dictionary.  It also support more advanced registrations and
     lookups that include a ``requires`` argument and a ``name`` via
     its ``register`` and ``lookup`` methods.  It may be treated as an
-    component registry by using its ``resolve`` method."""
+    component registry by using its ``resolve`` method.
+
+    The ``lookup_cache_size`` and ``combination_cache_size`` keyword
+    arguments to the constructor are not treated as registrations;
+    they set the number of lookup results and of requires combination
+    templates (see ``combination_template``) cached by the registry.
+    Each defaults to 1000.  A value of ``None`` means the cache is
+    never pruned (appropriate for registries which don't change after
+    startup), a value of ``0`` disables the cache.
+
+    If the ``indexed`` constructor keyword argument is true, the
+    registry also indexes registrations by provides value, name and
+    each requires value.  Lookup cache misses are then answered by
+    ranking only the registrations which could match instead of
+    trying every combination of the requires values in turn, which
+    is faster when objects supply many component types.
+
+    If the ``compact`` constructor keyword argument is true, the
+    registrations for each requires tuple are kept in a small
+    ``__slots__`` object holding a flat tuple rather than in a
+    dictionary and lists, which uses much less memory for large
+    registries at the cost of slower changes.  Requires tuples with
+    many registrations (such as the empty one utilities are
+    registered for) keep a dictionary.
+
+    The ``bases`` constructor keyword argument is a sequence of other
+    registries (for example, one large registry shared by many small
+    ones holding per-site overrides).  A lookup which finds nothing
+    among the registrations of this registry consults each base in
+    turn and returns the first component found, and ``notify`` calls
+    the subscribers of the bases after those of this registry.  The
+    bases are not copied, and the lookup cache of this registry is
+    emptied whenever any of them changes.  The mapping API only sees
+    the registrations of this registry.
+
+    The ``generation`` attribute of a registry is a number which
+    increases whenever its registrations (or those of its bases)
+    change, and functions added with ``add_observer`` are told about
+    each change as it is made.
+
+    A ``Lazy`` placeholder may be registered instead of a component
+    to import the component only when it is first looked up; the
+    ``load_lazy`` method loads every such component at once.
+
+    A registry may be pickled.  Only its registrations and the
+    constructor arguments above are stored; its caches and indexes are
+    rebuilt when they are first needed after unpickling."""
+    _batching = 0 # the depth of batch() calls
+    _haslazy = False # at least one Lazy placeholder registered
+    _generation = 0 # incremented by each change to the registrations
+    _observers = ()
+    _bases = ()
+    # copy-on-write: after copy(), the requires tuples whose
+    # registrations this registry has copied since (None if it shares
+    # nothing), the keys of the index entries it has copied since, and
+    # whether ``data`` and ``_dictmembers`` are shared
+    _owned = None
+    _ownedindex = None
+    _sharedtop = False
+
     def __init__(self, dict=None, **kwargs):
-        self.data = {}
-        self._lkpcache = LRUCache(1000)
+        self._setup(kwargs.pop('lookup_cache_size', 1000),
+                    kwargs.pop('combination_cache_size', 1000),
+                    kwargs.pop('indexed', False),
+                    kwargs.pop('compact', False),
+                    kwargs.pop('bases', ()))
         if dict is not None:
             self.update(dict)
         if len(kwargs):
             self.update(kwargs)
-        self.listener_registered = False # at least one listener registered
-
-    @property
-    def _dictmembers(self):
-        D = {}
-        norequires = self.data.get((), {})
-        for k, v in norequires.items():
-            provides, name = k
+        # at least one listener registered (perhaps in a base)
+        self.listener_registered = bool(self._bases)
+
+    def _setup(self, lookup_cache_size, combination_cache_size, indexed,
+               compact, bases=()):
+        self._indexed = indexed
+        self._compact = compact
+        self._bases = tuple(bases)
+        self._basegenerations = [ base._currentgeneration()
+                                  for base in self._bases ]
+        self._regindex = {}
+        self.data = {}
+        self._lkpcache = makecache(lookup_cache_size)
+        self._lkpindex = {}
+        self._lkpindexing = lookup_cache_size != 0
+        # held while a lookup result is cached and indexed, and while
+        # _lkpindex is pruned, so that lookups may run in many threads
+        self._lkplock = threading.Lock()
+        # keys added to _lkpindex since it was last pruned of the keys
+        # of lookups the cache has evicted (see _pruneindex)
+        self._lkpindexcount = 0
+        if lookup_cache_size:
+            self._lkpindexlimit = 2 * lookup_cache_size
+        else:
+            self._lkpindexlimit = sys.maxint
+        self._combocache = makecache(combination_cache_size)
+        # subscribers called by notify, keyed on types and name
+        self._plans = {}
+        self._plansize = lookup_cache_size
+        self._executors = {}
+        # unnamed registrations without requires, for the mapping API
+        self._dictmembers = {}
+        self.reset_stats()
+
+    def __getstate__(self):
+        # each (provides, ALL) list is normally the components
+        # registered under each name for that provides value, in the
+        # order they were registered, so store the named registrations
+        # in that order and only store the list itself if it differs
+        registrations = []
+        for requires, info in self.data.items():
+            byprovides = {}
+            for (provides, name), component in info.items():
+                if name is not ALL:
+                    byprovides.setdefault(provides, []).append(
+                        (name, component))
+            for provides, named in byprovides.items():
+                all = info.get((provides, ALL), [])
+                if (len(named) == 1 and len(all) == 1 and
+                    all[0] is named[0][1]):
+                    registrations.append((requires, provides, named[0], None))
+                    continue
+                names = {}
+                for name, component in named:
+                    names.setdefault(id(component), []).append(name)
+                flat = []
+                for component in all:
+                    candidates = names.get(id(component))
+                    if not candidates:
+                        break
+                    flat.append(candidates.pop(0))
+                    flat.append(component)
+                # the list is only left out if it is made of each named
+                # component exactly once
+                if len(flat) == len(all) * 2 == len(named) * 2:
+                    all = None
+                else:
+                    flat = []
+                    for name, component in named:
+                        flat.append(name)
+                        flat.append(component)
+                    all = list(all)
+                registrations.append((requires, provides, tuple(flat), all))
+        return {'registrations':registrations,
+                'lookup_cache_size':self._plansize,
+                'combination_cache_size':getattr(self._combocache, 'size',
+                                                 None),
+                'indexed':self._indexed,
+                'compact':self._compact,
+                'bases':self._bases,
+                'listener_registered':self.listener_registered}
+
+    def __setstate__(self, state):
+        self._setup(state['lookup_cache_size'],
+                    state['combination_cache_size'],
+                    state['indexed'],
+                    state.get('compact', False),
+                    state.get('bases', ()))
+        data = self.data
+        for requires, provides, flat, all in state['registrations']:
+            info = data.setdefault(requires, {})
+            for i in xrange(0, len(flat), 2):
+                info[(provides, flat[i])] = flat[i+1]
+            if all is None:
+                all = list(flat[1::2])
+            info[(provides, ALL)] = all
+        if self._compact:
+            for requires, info in data.items():
+                names = [ name for provides, name in info if name is not ALL ]
+                if len(names) <= _compactlimit:
+                    data[requires] = _Registrations(info)
+        for (provides, name), component in data.get((), {}).items():
             if name == '':
-                D[provides] = v
-        return D
+                self._dictmembers[provides] = component
+        for info in data.values():
+            for regkey, component in info.items():
+                if _islazy(component):
+                    self._haslazy = True
+        if self._indexed:
+            # built by _indexsearch when it is first needed
+            self._regindex = None
+        self.listener_registered = state['listener_registered']
 
     def __cmp__(self, dict):
         if isinstance(dict, Registry):
@@ -108,42 +711,114 @@ class Registry(object):
         return len(self._dictmembers)
 
     def __getitem__(self, key):
-        notrequires = self.data.get((), {})
-        return notrequires[(key, '')]
+        if self._haslazy:
+            return _unlazy(self._dictmembers[key])
+        return self._dictmembers[key]
 
     def __setitem__(self, key, val):
         self.register(key, val)
 
     def __delitem__(self, key):
-        self._lkpcache.clear()
-        notrequires = self.data.get((), {})
-        try:
-            del notrequires[(key, '')]
-        except KeyError:
-            raise KeyError(key)
+        self.unregister(key, self._dictmembers[key])
 
     def clear(self, full=False):
         if full:
             self.data = {}
+            if self._regindex is not None:
+                self._regindex = {}
+            self._ownedindex = None
+            self._owned = None
+            self._sharedtop = False
+            self._invalidateall()
+            self._dictmembers = {}
+            self._generation += 1
+            for observer in self._observers:
+                observer(ALL, ALL, ALL)
         else:
-            notrequires = self.data.get((), {})
-            for k, v in notrequires.items():
-                provides, name = k
-                if name == '':
-                    del notrequires[k]
-        self._lkpcache.clear()
-
-    def copy(self):
-        import copy
-        return copy.copy(self)
+            for provides, component in self._dictmembers.items():
+                self.unregister(provides, component)
+
+    def copy(self, warm=False):
+        """ Return a copy of this registry.  Making a copy takes the
+        same short time however large the registry is: the copy
+        shares the registrations of this registry, and each of them
+        copies the registrations for a requires tuple only when it
+        first changes them.  The copy has a lookup cache of its own,
+        which is empty unless ``warm`` is true, in which case it
+        starts with the lookup results cached by this registry."""
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        # trace hooks (which call this registry), observers and
+        # batches aren't copied
+        for name in ('lookup', 'resolve', 'notify', '_observers',
+                     '_batching'):
+            new.__dict__.pop(name, None)
+        for registry in (self, new):
+            registry._owned = set()
+            registry._sharedtop = True
+        new._basegenerations = list(self._basegenerations)
+        new._lkpcache = makecache(self._plansize)
+        new._lkpindex = {}
+        new._lkplock = threading.Lock()
+        new._lkpindexcount = 0
+        new._combocache = makecache(getattr(self._combocache, 'size', None))
+        new._plans = {}
+        new._executors = {}
+        new.reset_stats()
+        if warm:
+            cache = self._lkpcache
+            for indexkey, keys in self._lkpindex.items():
+                for cachekey in keys:
+                    value = cache.get(cachekey, _marker)
+                    if value is not _marker:
+                        new._lkpcache.put(cachekey, value)
+                        new._lkpindex.setdefault(indexkey, set()).add(
+                            cachekey)
+                        new._lkpindexcount += 1
+            new._plans.update(self._plans)
+        return new
+
+    def _writable(self, requires):
+        # called before changing the registrations for ``requires`` of
+        # a registry which shares its registrations with a copy
+        if self._sharedtop:
+            self.data = dict(self.data)
+            self._dictmembers = dict(self._dictmembers)
+            if self._regindex is not None:
+                # the index is shared too; its entries are copied by
+                # _indexentry when they are first changed
+                self._regindex = dict(self._regindex)
+                self._ownedindex = set()
+            self._sharedtop = False
+        if requires not in self._owned:
+            info = self.data.get(requires)
+            if info is not None:
+                info = self.data[requires] = _copyinfo(info)
+                if not requires:
+                    # the mapping API returns the copied subscriber lists
+                    for (provides, name), component in info.items():
+                        if name == '':
+                            self._dictmembers[provides] = component
+            self._owned.add(requires)
+
+    def freeze(self):
+        """ Return a read-only snapshot of this registry (a
+        ``FrozenRegistry``).  Later changes to this registry are not
+        reflected in the snapshot."""
+        return FrozenRegistry(self)
 
     def items(self):
+        if self._haslazy:
+            return [ (key, _unlazy(value))
+                     for key, value in self._dictmembers.items() ]
         return self._dictmembers.items()
 
     def keys(self):
         return self._dictmembers.keys()
     
     def values(self):
+        if self._haslazy:
+            return map(_unlazy, self._dictmembers.values())
         return self._dictmembers.values()
 
     def iteritems(self):
@@ -181,7 +856,6 @@ class Registry(object):
             self.register(k, v)
 
     def setdefault(self, key, failobj=None):
-        self._lkpcache.clear()
         val = self.get(key, default=failobj)
         if val is failobj:
             self[key] = failobj
@@ -216,114 +890,1445 @@ class Registry(object):
         name = kw.get('name', '')
         if name is ALL:
             raise ValueError('ALL cannot be used in a registration as a name')
-        self._lkpcache.clear()
         if provides is _subscribers:
             self.listener_registered = True
-        info = self.data.setdefault(requires, {})
-        info[(provides, name)] =  component
-        all = info.setdefault((provides, ALL), [])
-        all.append(component)
+        if self._owned is not None:
+            self._writable(requires)
+        if not self._haslazy and _islazy(component):
+            self._haslazy = True
+        info = self.data.get(requires)
+        if info is None:
+            if self._compact:
+                info = _Registrations()
+            else:
+                info = {}
+            self.data[requires] = info
+        if info.__class__ is _Registrations:
+            info.add(provides, name, component)
+            if len(info.entries) > _compactlimit * 3:
+                self.data[requires] = dict(info.items())
+        else:
+            info[(provides, name)] =  component
+            all = info.setdefault((provides, ALL), [])
+            all.append(component)
+        if not requires and name == '':
+            self._dictmembers[provides] = component
+        if self._indexed:
+            self._index(provides, name, requires)
+        self._changed(provides, name, requires)
 
     def unregister(self, provides, component, *requires, **kw):
-        self._lkpcache.clear()
         name = kw.get('name', '')
+        if self._owned is not None:
+            self._writable(requires)
         if name is ALL:
-            del self.data[requires]
+            info = self.data.pop(requires)
+            for regprovides, regname in info:
+                if self._indexed:
+                    self._unindex(regprovides, regname, requires)
+                if regname is ALL:
+                    self._changed(regprovides, ALL, requires)
+                elif not requires and regname == '':
+                    del self._dictmembers[regprovides]
             return
         info = self.data.get(requires, {})
-        del info[(provides, name)]
-        all = info.get((provides, ALL), [])
-        all.remove(component)
-        if not all:
-            del self.data[requires]
+        if info.__class__ is _Registrations:
+            info.remove(provides, name, component)
+            if not (info.entries or info.all):
+                del self.data[requires]
+        else:
+            if (provides, name) not in info:
+                raise KeyError((provides, name))
+            # check that the component is registered before changing
+            # anything
+            all = info.get((provides, ALL), [])
+            i = _position(all, component)
+            del info[(provides, name)]
+            del all[i]
+            if not all:
+                info.pop((provides, ALL), None)
+            if not info:
+                del self.data[requires]
+        if not requires and name == '':
+            del self._dictmembers[provides]
+        if self._indexed:
+            self._unindex(provides, name, requires)
+            self._unindex(provides, ALL, requires)
+        self._changed(provides, name, requires)
+
+    def _indexentry(self, indexkey):
+        # the index entry for ``indexkey`` (or None), copied first if it
+        # is shared with a copy of this registry
+        positions = self._regindex.get(indexkey)
+        owned = self._ownedindex
+        if owned is not None and indexkey not in owned:
+            if positions is not None:
+                positions = [ dict([ (value, set(registered))
+                                     for value, registered in combos.items() ])
+                              for combos in positions ]
+                self._regindex[indexkey] = positions
+            owned.add(indexkey)
+        return positions
+
+    def _index(self, provides, name, requires):
+        if self._regindex is None:
+            return
+        for key in ((provides, name), (provides, ALL)):
+            indexkey = key + (len(requires),)
+            positions = self._indexentry(indexkey)
+            if positions is None:
+                positions = [ {} for x in requires ]
+                self._regindex[indexkey] = positions
+            for value, combos in zip(requires, positions):
+                combos.setdefault(value, set()).add(requires)
+
+    def _unindex(self, provides, name, requires):
+        # only remove index entries for registrations which are gone;
+        # entries which are left behind are ignored by _indexsearch
+        if self._regindex is None:
+            return
+        if (provides, name) in self.data.get(requires, ()):
+            return
+        positions = self._indexentry((provides, name, len(requires)))
+        if positions is None:
+            return
+        for value, combos in zip(requires, positions):
+            registered = combos.get(value)
+            if registered is not None:
+                registered.discard(requires)
+                if not registered:
+                    del combos[value]
+
+    def stats(self):
+        """ Return a dictionary of counters describing lookup cache
+        effectiveness since the registry was created or since
+        ``reset_stats`` was last called:
+
+        ``lookups``
+            the number of ``lookup`` and ``resolve`` calls.
+
+        ``hits``
+            the number of those answered by the lookup cache.
+
+        ``notfound_hits``
+            the number of cache hits which remembered that no
+            component matched.
+
+        ``misses``
+            the number of lookups not answered by the cache.
+
+        ``invalidations``
+            the number of cached lookup results dropped because a
+            registration changed.
+
+        ``evictions``
+            the number of cached lookup results pruned to keep the
+            lookup cache within its size.
+
+        ``combination_hits``, ``combination_misses``,
+        ``combination_evictions``
+            the same counters for the cache of requires combination
+            templates which is consulted on lookup cache misses.
+
+        ``combinations_tried``
+            the total number of requires combinations tried against
+            registrations on lookup cache misses.
+
+        ``average_combinations_tried``
+            ``combinations_tried`` divided by ``misses``.
+        """
+        hits = self._hits + self._notfound_hits
+        misses = self._misses
+        if misses:
+            average = float(self._combinations_tried) / misses
+        else:
+            average = 0.0
+        return {
+            'lookups':hits + misses,
+            'hits':hits,
+            'notfound_hits':self._notfound_hits,
+            'misses':misses,
+            'invalidations':self._invalidations,
+            'evictions':self._evictions + _evictions(self._lkpcache),
+            'combination_hits':self._combination_hits,
+            'combination_misses':self._combination_misses,
+            'combination_evictions':_evictions(self._combocache) -
+                                    self._combination_evictions,
+            'combinations_tried':self._combinations_tried,
+            'average_combinations_tried':average,
+            }
+
+    def reset_stats(self):
+        """ Reset the counters returned by ``stats`` to zero """
+        self._hits = 0
+        self._notfound_hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = -_evictions(self._lkpcache)
+        self._combination_hits = 0
+        self._combination_misses = 0
+        self._combination_evictions = _evictions(self._combocache)
+        self._combinations_tried = 0
+
+    def settrace(self, hook):
+        """ Call ``hook`` with a ``Trace`` describing each later call to
+        the ``lookup``, ``resolve`` and ``notify`` methods of this
+        registry, after the call has finished.  Pass ``None`` to stop
+        tracing.  Registries which aren't traced do no extra work."""
+        for name in ('lookup', 'resolve', 'notify'):
+            if hook is None:
+                self.__dict__.pop(name, None)
+            else:
+                setattr(self, name, _traced(self, name, hook))
+
+    def load_lazy(self):
+        """ Load each component registered as a ``Lazy`` placeholder
+        which hasn't been loaded yet, for example to check that every
+        component in a configuration can be imported when an
+        application starts.  Raises the first exception raised by
+        loading a component."""
+        if self._haslazy:
+            for info in self.data.values():
+                for regkey, component in info.items():
+                    _unlazy(component)
+
+    def _invalidateall(self):
+        for keys in self._lkpindex.values():
+            self._invalidations += len(keys)
+        # LRUCache.clear resets its eviction counter
+        self._evictions += _evictions(self._lkpcache)
+        self._lkpcache.clear()
+        self._lkpindex.clear()
+        self._lkpindexcount = 0
+        self._plans.clear()
+
+    def _pruneindex(self):
+        # drop the keys of the lookups which the cache has evicted from
+        # _lkpindex, so that it holds at most twice as many keys as the
+        # cache holds results and pruning costs O(1) per lookup miss;
+        # called with _lkplock held
+        resident = getattr(self._lkpcache, 'data', None)
+        count = 0
+        if resident is not None:
+            for indexkey, keys in self._lkpindex.items():
+                for cachekey in [ key for key in keys
+                                  if key not in resident ]:
+                    keys.discard(cachekey)
+                if keys:
+                    count += len(keys)
+                else:
+                    self._lkpindex.pop(indexkey, None)
+        self._lkpindexcount = count
+
+    def _changed(self, provides, name, requires):
+        # called after each change to the registrations
+        self._generation += 1
+        if self._batching:
+            # within batch(): forget everything cached, which is
+            # nothing after the first change unless lookups are made
+            # during the batch, and rebuild the index when it is next
+            # needed rather than maintaining it
+            if self._lkpindex or self._plans:
+                self._invalidateall()
+            if self._indexed:
+                self._regindex = None
+        else:
+            self._invalidate(provides, name, requires)
+        for observer in self._observers:
+            observer(provides, name, requires)
+
+    @property
+    def generation(self):
+        """ A number which is increased by every change to the
+        registrations of this registry (``register``, ``unregister``,
+        ``subscribe``, ``unsubscribe``, ``clear`` and so on) and by
+        every change to the registrations of its bases.  Code which
+        caches results derived from lookups can remember the
+        generation they were computed at and compare it with the
+        current one to find out whether they are still valid."""
+        return self._currentgeneration()
+
+    def add_observer(self, observer):
+        """ Call ``observer`` after each later change to the
+        registrations of this registry with the provides value, name
+        and requires tuple of the registration which changed.  When
+        ``unregister`` is called with a name of ``ALL`` the name is
+        ``ALL``; when the registry is cleared with ``clear(full=True)``
+        every argument is ``ALL``.  Changes to the bases of the
+        registry are not reported.  The observers of a registry are
+        not copied or pickled."""
+        self._observers = self._observers + (observer,)
+
+    def remove_observer(self, observer):
+        """ Stop calling ``observer`` (added with ``add_observer``) """
+        observers = list(self._observers)
+        if observer in observers:
+            observers.remove(observer)
+            self._observers = tuple(observers)
+
+    @contextmanager
+    def batch(self):
+        """ Return a context manager for making many changes at once,
+        for example when an application is configured.  Changes made
+        within it don't maintain the lookup cache or the index of an
+        indexed registry one by one; instead the lookup cache is
+        emptied when the first change is made and the index is rebuilt
+        when it is next needed.
+
+        .. code-block:: python
+
+           with registry.batch():
+               for provides, component, requires in registrations:
+                   registry.register(provides, component, *requires)
+        """
+        self._batching += 1
+        try:
+            yield self
+        finally:
+            self._batching -= 1
+
+    def register_many(self, registrations):
+        """ Register each of a sequence of registrations within
+        ``batch``.  Each registration is a tuple of the provides
+        value, the component, a tuple of requires values and
+        optionally a name."""
+        register = self.register
+        with self.batch():
+            for registration in registrations:
+                if len(registration) == 4:
+                    provides, component, requires, name = registration
+                else:
+                    provides, component, requires = registration
+                    name = ''
+                register(provides, component, *requires, **{'name':name})
+
+    def _currentgeneration(self):
+        # the generation of this registry, which also changes when one
+        # of its bases has changed
+        if self._bases:
+            self._checkbases()
+        return self._generation
+
+    def _checkbases(self):
+        # forget everything cached if a base has changed since it was
+        # cached
+        generations = self._basegenerations
+        changed = False
+        for i, base in enumerate(self._bases):
+            generation = base._currentgeneration()
+            if generation != generations[i]:
+                generations[i] = generation
+                changed = True
+        if changed:
+            self._invalidateall()
+            self._generation += 1
+
+    def _invalidate(self, provides, name, requires):
+        # Drop only the cached lookup results which a registration of
+        # ``provides`` under ``name`` for ``requires`` could change:
+        # those for the same provides value and number of requires
+        # positions, looked up by the same name (or by ALL), whose
+        # requires or defaults include each registered requires value
+        # at its position.  A ``name`` of ALL matches any name.
+        if provides is _subscribers and self._plans:
+            for plankey in list(self._plans):
+                krequires, kdefaults, kname = plankey
+                if _affects(name, requires, kname, krequires, kdefaults):
+                    self._plans.pop(plankey, None)
+        keys = self._lkpindex.get((provides, len(requires)))
+        if not keys:
+            return
+        for cachekey in list(keys):
+            kprovides, krequires, kname, kdefaults = cachekey
+            if _affects(name, requires, kname, krequires, kdefaults):
+                self._lkpcache.invalidate(cachekey)
+                self._invalidations += 1
+                keys.discard(cachekey)
 
     def subscribe(self, fn, *requires, **kw):
         name = kw.get('name', '')
         if name is ALL:
             raise ValueError('ALL may not be used as a name to subscribe')
-        newkw = {'name':name, 'default':_marker}
-        subscribers = self.lookup(_subscribers, *requires, **newkw)
-        if subscribers is _marker:
-            subscribers = []
-        subscribers.append(fn)
-        self.register(_subscribers, subscribers, *requires, **kw)
+        if self._owned is not None:
+            self._writable(requires)
+        # the subscribers for exactly these requires are registered as
+        # a single list, which is extended in place
+        subscribers = self.data.get(requires, {}).get((_subscribers, name))
+        if subscribers is None:
+            self.register(_subscribers, [fn], *requires, **kw)
+        else:
+            if fn.__class__ is Lazy:
+                self._haslazy = True
+            subscribers.append(fn)
+            self._changed(_subscribers, name, requires)
 
     def unsubscribe(self, fn, *requires, **kw):
         name = kw.get('name', '')
         if name is ALL:
             raise ValueError('ALL may not be used as a name to unsubscribe')
-        newkw = {'name':name, 'default':_marker}
-        subscribers = self.lookup(_subscribers, *requires, **newkw)
-        if subscribers is _marker:
-            subscribers = []
-        if fn in subscribers:
-            subscribers.remove(fn)
+        if self._owned is not None:
+            self._writable(requires)
+        subscribers = self.data.get(requires, {}).get((_subscribers, name))
+        if subscribers is None:
+            return
+        try:
+            i = _position(subscribers, fn)
+        except ValueError:
+            return
+        if len(subscribers) == 1:
+            self.unregister(_subscribers, subscribers, *requires, **kw)
+        else:
+            del subscribers[i]
+            self._changed(_subscribers, name, requires)
 
     def notify(self, *objects, **kw):
+        if 'executor' in kw:
+            return self._submit(objects, **kw)
         if not self.listener_registered:
             return # optimization
-        subscribers = self.resolve(_subscribers, *objects, **kw)
-        name = kw.get('name', '')
-        if subscribers is not None:
-            if name is ALL:
-                for subscriberlist in subscribers:
-                    for subscriber in subscriberlist:
-                        subscriber(*objects)
+        for subscriber in self._subscribersfor(objects, kw.get('name', '')):
+            subscriber(*objects)
+
+    def _submit(self, objects, executor, name='', ordered=False,
+                max_workers=None):
+        # notify(*objects, executor=...): run subscribers using a
+        # concurrent.futures executor and return a Notification
+        futures = _futures()
+        if executor in ('thread', 'process'):
+            executor = self._executor(futures, executor, max_workers)
+        if self.listener_registered:
+            subscribers = self._subscribersfor(objects, name)
+        else:
+            subscribers = ()
+        if isinstance(executor, futures.ProcessPoolExecutor):
+            for subscriber in subscribers:
+                _checkpicklable(subscriber, objects)
+        if ordered:
+            pending = [ futures.Future() for subscriber in subscribers ]
+            _submitordered(executor, subscribers, objects, pending, 0)
+        else:
+            pending = [ executor.submit(_callsubscriber, subscriber, objects)
+                        for subscriber in subscribers ]
+        return Notification(subscribers, pending)
+
+    def _executor(self, futures, kind, max_workers):
+        executor = self._executors.get(kind)
+        if executor is None:
+            if kind == 'thread':
+                executor = futures.ThreadPoolExecutor(max_workers)
             else:
-                for subscriber in subscribers:
-                    subscriber(*objects)
+                executor = futures.ProcessPoolExecutor(max_workers)
+            self._executors[kind] = executor
+        return executor
+
+    def shutdown(self, wait=True):
+        """ Shut down the thread and process pools created by calling
+        ``notify`` with ``executor='thread'`` or
+        ``executor='process'``.  New pools are created if ``notify``
+        is called with those arguments again."""
+        # the dictionary may be shared with frozen copies of this registry
+        executors = self._executors
+        while executors:
+            kind, executor = executors.popitem()
+            executor.shutdown(wait)
+
+    def anotify(self, *objects, **kw):
+        """ Notify subscribers like ``notify``, for use with
+        ``asyncio`` (or ``trollius`` under Python 2).  Subscribers are
+        called in order; those which return a coroutine or future
+        (for example, coroutine functions) are run as tasks on the
+        event loop, at most ``concurrency`` of them at once if that
+        keyword argument is supplied.  Returns a future which is done
+        when every subscriber has finished.
+
+        If a subscriber raises an exception, no further subscribers
+        are called or started, and the future raises the exception
+        once the tasks already running have finished.  The ``loop``
+        keyword argument is the event loop to use; it defaults to the
+        current event loop."""
+        asyncio = _asyncio()
+        loop = kw.get('loop')
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        concurrency = kw.get('concurrency')
+        result = asyncio.Future(loop=loop)
+        waiting = []
+        errors = []
+        running = [0]
+
+        if self.listener_registered:
+            for subscriber in self._subscribersfor(objects,
+                                                   kw.get('name', '')):
+                try:
+                    value = subscriber(*objects)
+                except Exception, e:
+                    errors.append(e)
+                    break
+                if _isawaitable(asyncio, value):
+                    waiting.append(value)
+
+        def start():
+            while waiting and not errors:
+                if concurrency is not None and running[0] >= concurrency:
+                    return
+                task = asyncio.ensure_future(waiting.pop(0), loop=loop)
+                running[0] += 1
+                task.add_done_callback(finished)
+            if not running[0] and not result.done():
+                for awaitable in waiting:
+                    # never started
+                    close = getattr(awaitable, 'close', None)
+                    if close is not None:
+                        close()
+                if errors:
+                    result.set_exception(errors[0])
+                else:
+                    result.set_result(None)
+
+        def finished(task):
+            running[0] -= 1
+            if not task.cancelled() and task.exception() is not None:
+                errors.append(task.exception())
+            start()
+
+        start()
+        return result
+
+    def _subscribersfor(self, objects, name):
+        requires, extras = zip(*map(typesignature, objects)) or ((), ())
+        if self._bases:
+            self._checkbases()
+        plankey = (requires, extras, name)
+        plan = self._plans.get(plankey)
+        if plan is None:
+            plan = self._plan(plankey)
+        return plan
+
+    def _planfor(self, plankey):
+        # the subscribers for a plan key, used by registries which
+        # have this registry as a base
+        if self._bases:
+            self._checkbases()
+        plan = self._plans.get(plankey)
+        if plan is None:
+            plan = self._plan(plankey)
+        return plan
+
+    def _plan(self, plankey):
+        # compute (and remember) the tuple of subscribers notify calls
+        # for objects with the given types
+        requires, extras, name = plankey
+        subscribers = self._lookup(_subscribers, name, None, requires, extras)
+        if subscribers is None:
+            plan = ()
+        elif name is ALL:
+            plan = tuple([ subscriber for subscriberlist in subscribers
+                           for subscriber in subscriberlist ])
+        else:
+            plan = tuple(subscribers)
+        for base in self._bases:
+            plan += base._planfor(plankey)
+        size = self._plansize
+        if size is not None and len(self._plans) >= size:
+            self._plans.clear()
+        if size != 0:
+            self._plans[plankey] = plan
+        return plan
 
     def _lookup(self, provides, name, default, requires, default_requires):
         # the requires and default_requires arguments *must* be
         # hashable sequences of tuples composed of hashable objects
-        reg = self.data
-
+        if self._bases:
+            self._checkbases()
         cachekey = (provides, requires, name, default_requires)
         cached = self._lkpcache.get(cachekey, _marker)
 
         if cached is _marker:
-            combinations = cached_augmented_product(requires, default_requires)
-            regkey = (provides, name)
-            for combo in combinations:
+            self._misses += 1
+            if self._indexed:
+                result = self._indexsearch(provides, name, requires,
+                                           default_requires)
+            else:
+                result = self._productsearch(provides, name, requires,
+                                             default_requires)
+            if result is _notfound and provides is not _subscribers:
+                # (notify combines the subscribers of each base itself)
+                for base in self._bases:
+                    result = base._lookup(provides, name, _notfound,
+                                          requires, default_requires)
+                    if result is not _notfound:
+                        break
+            if self._haslazy and result is not _notfound:
+                result = _unlazy(result)
+            if self._lkpindexing:
+                # the result is cached and indexed at once, so pruning
+                # (perhaps by another thread) never finds it cached but
+                # not indexed, or indexed but not yet cached
+                indexkey = (provides, len(requires))
+                self._lkplock.acquire()
                 try:
-                    result = reg[combo][regkey]
+                    keys = self._lkpindex.get(indexkey)
+                    if keys is None:
+                        keys = self._lkpindex[indexkey] = set()
+                    keys.add(cachekey)
                     self._lkpcache.put(cachekey, result)
-                    return result
-                except KeyError:
-                    pass
-
-            self._lkpcache.put(cachekey, _notfound)
-            cached = _notfound
-            
-        if cached is _notfound:
-            if default is _missing:
-                raise LookupError(
-                    "Couldn't find a component providing %s for requires "
-                    "args %r with name `%s`" % (provides, list(requires), name))
-            return default
+                    self._lkpindexcount += 1
+                    if self._lkpindexcount > self._lkpindexlimit:
+                        self._pruneindex()
+                finally:
+                    self._lkplock.release()
+            else:
+                self._lkpcache.put(cachekey, result)
+            if result is not _notfound:
+                return result
 
-        return cached
+        elif cached is _notfound:
+            self._notfound_hits += 1
 
-    def lookup(self, provides, *requires, **kw):
-        req = []
-        for val in requires:
-            if not hasattr(val, '__iter__'):
-                req.append((val,))
+        else:
+            self._hits += 1
+            return cached
+
+        if default is _missing:
+            raise LookupError(
+                "Couldn't find a component providing %s for requires "
+                "args %r with name `%s`" % (provides, list(requires), name))
+        return default
+
+    def _productsearch(self, provides, name, requires, default_requires):
+        reg = self.data
+        template = self._template(requires, default_requires)
+        flat = flatten_requires(requires, default_requires)
+        regkey = (provides, name)
+        for tried, getter in enumerate(template):
+            try:
+                result = reg[getter(flat)][regkey]
+            except KeyError:
+                continue
+            self._combinations_tried += tried + 1
+            return result
+        self._combinations_tried += len(template)
+        return _notfound
+
+    def _findcombo(self, provides, name, requires, default_requires):
+        # the requires combination a lookup finds a registration for
+        reg = self.data
+        regkey = (provides, name)
+        flat = flatten_requires(requires, default_requires)
+        for getter in combination_template(
+            requires_shape(requires, default_requires)):
+            combo = getter(flat)
+            if regkey in reg.get(combo, ()):
+                return combo
+
+    def _indexsearch(self, provides, name, requires, default_requires):
+        reg = self.data
+        regkey = (provides, name)
+        if not requires:
+            return reg.get((), {}).get(regkey, _notfound)
+        if self._regindex is None:
+            self._regindex = {}
+            self._ownedindex = None
+            for regrequires, info in reg.items():
+                for regprovides, regname in info:
+                    if regname is not ALL:
+                        self._index(regprovides, regname, regrequires)
+        positions = self._regindex.get((provides, name, len(requires)))
+        if positions is None:
+            return _notfound
+        # intersect the registrations which accept any of the supplied
+        # or default values at each requires position
+        candidates = None
+        for i, combos in enumerate(positions):
+            found = set()
+            for value in requires[i]:
+                registered = combos.get(value)
+                if registered:
+                    found.update(registered)
+            if default_requires:
+                for value in default_requires[i]:
+                    registered = combos.get(value)
+                    if registered:
+                        found.update(registered)
+            if candidates is None:
+                candidates = found
             else:
-                req.append(tuple(val))
+                candidates &= found
+            if not candidates:
+                return _notfound
+        self._combinations_tried += len(candidates)
+        best = bestrank = None
+        for combo in candidates:
+            if regkey not in reg.get(combo, ()):
+                continue
+            rank = combination_precedence(combo, requires, default_requires)
+            if rank is not None and (best is None or rank < bestrank):
+                best, bestrank = combo, rank
+        if best is None:
+            return _notfound
+        return reg[best][regkey]
+
+    def _template(self, requires, default_requires):
+        shape = requires_shape(requires, default_requires)
+        template = self._combocache.get(shape)
+        if template is None:
+            self._combination_misses += 1
+            template = combination_template(shape)
+            self._combocache.put(shape, template)
+        else:
+            self._combination_hits += 1
+        return template
+
+    def lookup(self, provides, *requires, **kw):
+        req = [ _requiresvalues(val) for val in requires ]
         name = kw.get('name', '')
         extras = ((None,),) * len(req)
         default = kw.get('default', _missing)
         return self._lookup(provides, name, default, tuple(req), extras)
 
     def resolve(self, provides, *objects, **kw):
-        requires = tuple(
-            [directlyprovidedby(obj)+alsoprovidedby(obj) for obj in objects ])
-        extras = tuple([defaultprovidedby(obj) for obj in objects])
+        requires, extras = zip(*map(typesignature, objects)) or ((), ())
         name = kw.get('name', '')
         default = kw.get('default', _missing)
         return self._lookup(provides, name, default, requires, extras)
 
+    def lookup_many(self, provides, requires_list, *requires, **kw):
+        """ Return a list containing the result of ``lookup(provides,
+        value, *requires, **kw)`` for each ``value`` in
+        ``requires_list``, in the same order.  Each distinct ``value``
+        is looked up only once."""
+        name = kw.get('name', '')
+        default = kw.get('default', _missing)
+        req = [ _requiresvalues(val) for val in requires ]
+        extras = ((None,),) * (len(req) + 1)
+        results = []
+        found = {}
+        for val in requires_list:
+            first = _requiresvalues(val)
+            result = found.get(first, _marker)
+            if result is _marker:
+                result = self._lookup(provides, name, default,
+                                      tuple([first] + req), extras)
+                found[first] = result
+            results.append(result)
+        return results
+
+    def resolve_many(self, provides, objects, *others, **kw):
+        """ Return a list containing the result of ``resolve(provides,
+        obj, *others, **kw)`` for each ``obj`` in ``objects``, in the
+        same order.  Objects which supply the same component types
+        (such as instances of the same class which haven't had
+        ``provides`` applied to them) are resolved only once."""
+        name = kw.get('name', '')
+        default = kw.get('default', _missing)
+        requires, extras = zip(*map(typesignature, others)) or ((), ())
+        results = []
+        found = {}
+        for obj in objects:
+            key = _typeskey(obj)
+            result = found.get(key, _marker)
+            if result is _marker:
+                objrequires, objextras = typesignature(obj)
+                result = self._lookup(provides, name, default,
+                                      (objrequires,) + requires,
+                                      (objextras,) + extras)
+                if key is not None:
+                    found[key] = result
+            results.append(result)
+        return results
+
+class Notification(object):
+    """ The result of calling ``notify`` with an ``executor``.  The
+    ``subscribers`` attribute is the sequence of subscribers being
+    notified and the ``futures`` attribute is a ``concurrent.futures``
+    future for each of them, in the same order."""
+    def __init__(self, subscribers, futures):
+        self.subscribers = subscribers
+        self.futures = futures
+
+    def done(self):
+        """ Return true if every subscriber has finished """
+        for future in self.futures:
+            if not future.done():
+                return False
+        return True
+
+    def wait(self, timeout=None):
+        """ Wait up to ``timeout`` seconds (forever if ``timeout`` is
+        ``None``) for every subscriber to finish.  Return true if they
+        have."""
+        _futures().wait(self.futures, timeout)
+        return self.done()
+
+    def errors(self, timeout=None):
+        """ Wait like ``wait``, then return a list of ``(subscriber,
+        exception)`` pairs, one for each subscriber which raised an
+        exception."""
+        self.wait(timeout)
+        errors = []
+        for subscriber, future in zip(self.subscribers, self.futures):
+            if future.done() and not future.cancelled():
+                exception = future.exception()
+                if exception is not None:
+                    errors.append((subscriber, exception))
+        return errors
+
+class Trace(object):
+    """ A description of a call to the ``lookup``, ``resolve`` or
+    ``notify`` method of a registry, passed to the hook installed with
+    its ``settrace`` method.
+
+    ``method`` is the name of the method called.  ``provides`` and
+    ``name`` are the provides value and name looked up (``notify``
+    looks up subscribers, whose provides value is
+    ``repoze.component.registry._subscribers``).  ``requires`` and
+    ``default_requires`` are the requires signature: a tuple holding a
+    tuple of the component types supplied by each requires argument,
+    and a tuple holding a tuple of the default component types of
+    each.  ``hit`` is true if the result was already cached.
+    ``combinations`` is the number of requires combinations (or, for
+    an indexed registry, candidate registrations) tried to find it.
+    ``elapsed`` is the time taken by the call in seconds, including
+    the time taken by subscribers for ``notify``.  ``combo`` is the
+    requires combination of the registration which was found, or
+    ``None``; it is worked out when it is first used, so it should be
+    used before the registry is changed.
+
+    When a registry is used by several threads at once, ``hit`` and
+    ``combinations`` may include the work done by other threads."""
+    def __init__(self, registry, method, provides, name, requires,
+                 default_requires, hit, combinations, elapsed):
+        self.registry = registry
+        self.method = method
+        self.provides = provides
+        self.name = name
+        self.requires = requires
+        self.default_requires = default_requires
+        self.hit = hit
+        self.combinations = combinations
+        self.elapsed = elapsed
+
+    @property
+    def combo(self):
+        combo = self.registry._findcombo(self.provides, self.name,
+                                         self.requires, self.default_requires)
+        self.__dict__['combo'] = combo
+        return combo
+
+def _traced(registry, method, hook):
+    # a replacement for the lookup, resolve or notify method of a
+    # registry which calls hook after calling the method
+    call = getattr(registry.__class__, method).__get__(registry)
+    timer = timeit.default_timer
+    def traced(*arg, **kw):
+        if method == 'lookup':
+            provides, values = arg[0], arg[1:]
+            requires = tuple([ _requiresvalues(val) for val in values ])
+            default_requires = ((None,),) * len(requires)
+            name = kw.get('name', '')
+        else:
+            if method == 'resolve':
+                provides, objects = arg[0], arg[1:]
+            else:
+                provides, objects = _subscribers, arg
+            requires, default_requires = (
+                zip(*map(typesignature, objects)) or ((), ()))
+            name = kw.get('name', '')
+        misses = registry._misses
+        tried = registry._combinations_tried
+        start = timer()
+        try:
+            return call(*arg, **kw)
+        finally:
+            elapsed = timer() - start
+            hook(Trace(registry, method, provides, name, requires,
+                       default_requires, registry._misses == misses,
+                       registry._combinations_tried - tried, elapsed))
+    traced.__name__ = method
+    return traced
+
+def _futures():
+    try:
+        from concurrent import futures
+    except ImportError:
+        raise ImportError('notify with an executor requires concurrent.futures '
+                          '(the "futures" package under Python 2)')
+    return futures
+
+def _callsubscriber(subscriber, objects):
+    return subscriber(*objects)
+
+def _submitordered(executor, subscribers, objects, pending, i):
+    # run the subscribers one after another, starting each when the
+    # previous one has finished
+    if i == len(subscribers):
+        return
+    def finished(future):
+        exception = future.exception()
+        if exception is None:
+            pending[i].set_result(future.result())
+        else:
+            pending[i].set_exception(exception)
+        _submitordered(executor, subscribers, objects, pending, i + 1)
+    try:
+        future = executor.submit(_callsubscriber, subscribers[i], objects)
+    except Exception, e:
+        # e.g. the executor has been shut down
+        for future in pending[i:]:
+            future.set_exception(e)
+        return
+    future.add_done_callback(finished)
+
+def _checkpicklable(subscriber, objects):
+    import pickle
+    try:
+        pickle.dumps((subscriber, objects), pickle.HIGHEST_PROTOCOL)
+    except Exception, e:
+        raise TypeError(
+            'Subscriber %r and the objects %r must be picklable to notify '
+            'them using a process pool: %s' % (subscriber, objects, e))
+
+def _asyncio():
+    try:
+        import asyncio
+    except ImportError:
+        try:
+            import trollius as asyncio
+        except ImportError:
+            raise ImportError('anotify requires asyncio (or trollius under '
+                              'Python 2)')
+    return asyncio
+
+def _isawaitable(asyncio, value):
+    return (asyncio.iscoroutine(value) or isinstance(value, asyncio.Future)
+            or hasattr(value, '__await__'))
+
+def _affects(name, requires, kname, krequires, kdefaults):
+    # Could a registration under ``name`` for ``requires`` change the
+    # result of a lookup by ``kname`` for ``krequires`` and
+    # ``kdefaults``?  A ``name`` of ALL matches any name.
+    if name is not ALL and kname is not ALL and kname != name:
+        return False
+    if len(requires) != len(krequires):
+        return False
+    for i, value in enumerate(requires):
+        if value not in krequires[i] and value not in kdefaults[i]:
+            return False
+    return True
+
+def _registered(registered, component):
+    # whether the registered component ``registered`` is ``component``
+    # or a Lazy placeholder which has loaded ``component`` (which is
+    # what lookups return for it)
+    return registered is component or (
+        registered.__class__ is Lazy and registered._object is component)
+
+def _position(components, component):
+    # the position of ``component`` in a list of registered components,
+    # preferring the same object (or a placeholder which loaded it) to
+    # an equal one
+    for i, registered in enumerate(components):
+        if _registered(registered, component):
+            return i
+    try:
+        return components.index(component)
+    except ValueError:
+        raise ValueError('%r is not registered' % (component,))
+
+def _requiresvalues(val):
+    if not hasattr(val, '__iter__'):
+        return (val,)
+    return tuple(val)
+
+def _typeskey(obj):
+    # Return a value which is the same for any two objects which
+    # supply the same component types, or None if we can't tell
+    # cheaply.  Types are supplied by a class itself, or by the class
+    # of an instance unless the instance has its own types.
+    if isinstance(obj, _classtypes):
+        return obj
+    try:
+        instancetypes = obj.__dict__.get('__component_types__')
+    except AttributeError:
+        return None
+    return (obj.__class__, instancetypes)
+
+def _freezeinfo(info):
+    # a dictionary holding the registrations of ``info`` for a
+    # FrozenRegistry: subscriber lists are changed in place by
+    # subscribe, so the snapshot has its own copies (also in the ALL
+    # lists)
+    frozeninfo = {}
+    copies = {}
+    for regkey, component in info.items():
+        if regkey[0] is _subscribers and regkey[1] is not ALL:
+            copies[id(component)] = list(component)
+    for regkey, component in info.items():
+        if regkey[1] is ALL:
+            component = [ copies.get(id(item), item) for item in component ]
+        elif regkey[0] is _subscribers:
+            component = copies[id(component)]
+        frozeninfo[regkey] = component
+    return frozeninfo
+
+class FrozenRegistry(Registry):
+    """ A read-only snapshot of a registry, made by calling its
+    ``freeze`` method.  Any attempt to change it raises a
+    ``TypeError``.
+
+    Registrations are kept in a table keyed on provides value and name
+    holding the registered requires combinations, so a lookup for a
+    provides value and name which was never registered doesn't search
+    at all, and the lookup cache is a plain dictionary which needs no
+    locking because it never has to be invalidated.  It is emptied
+    whenever it reaches the size of the lookup cache of the original
+    registry.
+
+    If ``previous`` is an earlier snapshot of the same registry and
+    ``changes`` lists the ``(provides, name, requires)`` of each
+    change made to the registry since, only the registrations for the
+    requires tuples in ``changes`` are copied; the rest are shared
+    with ``previous``."""
+    def __init__(self, registry, previous=None, changes=None):
+        if previous is None or changes is None:
+            data = {}
+            table = {}
+            changed = registry.data.keys()
+            previous = None
+        else:
+            data = dict(previous.data)
+            table = dict(previous._table)
+            changed = set([ requires for provides, name, requires
+                            in changes ])
+        # the entries of ``table`` which are not shared with ``previous``
+        # and so may be changed
+        copied = set()
+        for requires in changed:
+            old = data.pop(requires, None)
+            if old is not None:
+                for regkey in old:
+                    registered = table[regkey]
+                    if regkey not in copied:
+                        registered = table[regkey] = dict(registered)
+                        copied.add(regkey)
+                    del registered[requires]
+                    if not registered:
+                        del table[regkey]
+            info = registry.data.get(requires)
+            if info is None:
+                continue
+            frozeninfo = data[requires] = _freezeinfo(info)
+            for regkey, component in frozeninfo.items():
+                registered = table.get(regkey)
+                if registered is None:
+                    registered = table[regkey] = {}
+                    copied.add(regkey)
+                elif regkey not in copied:
+                    registered = table[regkey] = dict(registered)
+                    copied.add(regkey)
+                registered[requires] = component
+        self.data = data
+        self._table = table
+        self._dictmembers = dict(registry._dictmembers)
+        self._plans = {}
+        self._plansize = registry._plansize
+        self._executors = registry._executors
+        self._lkpcache = {}
+        self._lkpcachesize = registry._lkpcache.size
+        self._combocache = {}
+        self._indexed = False
+        self._compact = False
+        self._haslazy = registry._haslazy
+        # bases are frozen too, so they never change; the snapshots of
+        # bases which haven't changed since ``previous`` are reused
+        bases = []
+        for i, base in enumerate(registry._bases):
+            generation = base._currentgeneration()
+            if (previous is not None and
+                previous._basegenerations[i] == generation):
+                bases.append(previous._bases[i])
+            else:
+                bases.append(base.freeze())
+        self._bases = tuple(bases)
+        self._basegenerations = [ base._generation for base in self._bases ]
+        self._generation = registry._generation
+        self.listener_registered = registry.listener_registered
+        self.reset_stats()
+
+    def __setstate__(self, state):
+        registry = Registry.__new__(Registry)
+        registry.__setstate__(state)
+        self.__init__(registry)
+
+    def _frozen(self, *arg, **kw):
+        raise TypeError('A frozen registry cannot be changed')
+
+    __setitem__ = __delitem__ = clear = update = setdefault = _frozen
+    pop = popitem = register = unregister = subscribe = unsubscribe = _frozen
+    register_many = _frozen
+
+    def freeze(self):
+        return self
+
+    def copy(self, warm=False):
+        # a frozen registry never changes
+        return self
+
+    def _lookup(self, provides, name, default, requires, default_requires):
+        cachekey = (provides, requires, name, default_requires)
+        cache = self._lkpcache
+        cached = cache.get(cachekey, _marker)
+
+        if cached is _marker:
+            self._misses += 1
+            result = _notfound
+            registered = self._table.get((provides, name))
+            if registered:
+                template = self._template(requires, default_requires)
+                flat = flatten_requires(requires, default_requires)
+                for tried, getter in enumerate(template):
+                    result = registered.get(getter(flat), _notfound)
+                    if result is not _notfound:
+                        break
+                self._combinations_tried += tried + 1
+            if result is _notfound and provides is not _subscribers:
+                # (notify combines the subscribers of each base itself)
+                for base in self._bases:
+                    result = base._lookup(provides, name, _notfound,
+                                          requires, default_requires)
+                    if result is not _notfound:
+                        break
+            if self._haslazy and result is not _notfound:
+                result = _unlazy(result)
+            size = self._lkpcachesize
+            if size is not None and len(cache) >= size:
+                self._evictions += len(cache)
+                cache.clear()
+            if size != 0:
+                cache[cachekey] = result
+            if result is not _notfound:
+                return result
+
+        elif cached is _notfound:
+            self._notfound_hits += 1
+
+        else:
+            self._hits += 1
+            return cached
+
+        if default is _missing:
+            raise LookupError(
+                "Couldn't find a component providing %s for requires "
+                "args %r with name `%s`" % (provides, list(requires), name))
+        return default
+
+    def _findcombo(self, provides, name, requires, default_requires):
+        registered = self._table.get((provides, name))
+        if registered:
+            flat = flatten_requires(requires, default_requires)
+            for getter in combination_template(
+                requires_shape(requires, default_requires)):
+                combo = getter(flat)
+                if registered.get(combo, _notfound) is not _notfound:
+                    return combo
+
+    def _template(self, requires, default_requires):
+        shape = requires_shape(requires, default_requires)
+        template = self._combocache.get(shape)
+        if template is None:
+            self._combination_misses += 1
+            template = combination_template(shape)
+            self._combocache[shape] = template
+        else:
+            self._combination_hits += 1
+        return template
+
+class _RecordingRegistry(Registry):
+    # A registry which remembers the (provides, name, requires) of each
+    # registration change since ``changes`` was last reset; ``changes``
+    # is None after the registry has been cleared entirely (or before
+    # recording starts).
+    changes = None
+
+    def _changed(self, provides, name, requires):
+        if self.changes is not None:
+            self.changes.append((provides, name, requires))
+        Registry._changed(self, provides, name, requires)
+
+    def clear(self, full=False):
+        Registry.clear(self, full)
+        if full:
+            self.changes = None
+
+def _reader(name):
+    def read(self, *arg, **kw):
+        return getattr(self._snapshot(), name)(*arg, **kw)
+    read.__name__ = name
+    read.__doc__ = getattr(Registry, name).__doc__
+    return read
+
+def _writer(name):
+    def write(self, *arg, **kw):
+        self._lock.acquire()
+        try:
+            try:
+                return getattr(self._master, name)(*arg, **kw)
+            finally:
+                if not self._master._batching:
+                    self._publish()
+        finally:
+            self._lock.release()
+    write.__name__ = name
+    write.__doc__ = getattr(Registry, name).__doc__
+    return write
+
+class ConcurrentRegistry(object):
+    """ A registry which may be used from many threads at once.  It
+    supports the same API as ``Registry``.
+
+    Lookups, resolves, notifications and the read-only mapping methods
+    are served by an immutable ``FrozenRegistry`` snapshot without
+    taking any lock.  Each change (``register``, ``subscribe``,
+    ``update``, item assignment and so on) takes a lock, is applied to
+    a private mutable registry, and then a new snapshot is made and
+    put in place with a single assignment, so a reader sees either
+    all of a change or none of it.  Cached lookup results which the
+    change cannot affect are carried over to the new snapshot.
+
+    A new snapshot shares the registrations the change didn't touch
+    with the previous one, so only the registrations for the requires
+    tuples which changed are copied; still, changes are slower than
+    they are to a ``Registry``, so use ``batch`` or ``register_many``
+    to make many changes at once.  Lookup statistics are reset each
+    time a snapshot is made."""
+    _observers = ()
+
+    def __init__(self, dict=None, **kwargs):
+        self._lock = threading.RLock()
+        self._master = _RecordingRegistry(dict, **kwargs)
+        self._master.changes = []
+        self._current = self._master.freeze()
+        self._tracehook = None
+
+    @classmethod
+    def fromkeys(cls, iterable, value=None):
+        return cls(dict([ (key, value) for key in iterable ]))
+
+    @property
+    def listener_registered(self):
+        return self._current.listener_registered
+
+    def _snapshot(self):
+        # the current snapshot, replaced first if one of the bases has
+        # changed since it was made
+        current = self._current
+        bases = self._master._bases
+        if bases:
+            generations = current._basegenerations
+            for i, base in enumerate(bases):
+                if base._currentgeneration() != generations[i]:
+                    self._lock.acquire()
+                    try:
+                        if self._current is current:
+                            self._publish()
+                        return self._current
+                    finally:
+                        self._lock.release()
+        return current
+
+    def _publish(self):
+        # called with the lock held
+        master = self._master
+        changes = master.changes
+        master.changes = []
+        old = self._current
+        # (this also counts changes to the bases in the generation)
+        master._currentgeneration()
+        new = FrozenRegistry(master, old, changes)
+        # every cached result may have come from a base which changed
+        if (changes is not None and
+            new._basegenerations == old._basegenerations):
+            for cachekey, value in old._lkpcache.items():
+                provides, requires, name, defaults = cachekey
+                for cprovides, cname, crequires in changes:
+                    if cprovides == provides and _affects(
+                        cname, crequires, name, requires, defaults):
+                        break
+                else:
+                    new._lkpcache[cachekey] = value
+            for plankey, plan in old._plans.items():
+                requires, defaults, name = plankey
+                for cprovides, cname, crequires in changes:
+                    if cprovides is _subscribers and _affects(
+                        cname, crequires, name, requires, defaults):
+                        break
+                else:
+                    new._plans[plankey] = plan
+        if self._tracehook is not None:
+            new.settrace(self._tracehook)
+        self._current = new
+        if self._observers:
+            if changes is None:
+                changes = [(ALL, ALL, ALL)]
+            for provides, name, requires in changes:
+                for observer in self._observers:
+                    observer(provides, name, requires)
+
+    def freeze(self):
+        """ Return the current read-only snapshot of this registry """
+        return self._snapshot()
+
+    def __getstate__(self):
+        self._lock.acquire()
+        try:
+            return self._master.__getstate__()
+        finally:
+            self._lock.release()
+
+    def __setstate__(self, state):
+        self._lock = threading.RLock()
+        self._master = _RecordingRegistry.__new__(_RecordingRegistry)
+        self._master.__setstate__(state)
+        self._master.changes = []
+        self._current = self._master.freeze()
+        self._tracehook = None
+
+    @contextmanager
+    def batch(self):
+        """ Return a context manager for making many changes at once.
+        The lock is held until the block ends, and a single new
+        snapshot is made then, so readers see all of the changes made
+        within the block at the same time."""
+        self._lock.acquire()
+        try:
+            try:
+                self._master._batching += 1
+                try:
+                    yield self
+                finally:
+                    self._master._batching -= 1
+            finally:
+                if not self._master._batching:
+                    self._publish()
+        finally:
+            self._lock.release()
+
+    def settrace(self, hook):
+        """ Call ``hook`` with a ``Trace`` describing each later call to
+        the ``lookup``, ``resolve`` and ``notify`` methods of this
+        registry, after the call has finished.  Pass ``None`` to stop
+        tracing."""
+        self._lock.acquire()
+        try:
+            self._tracehook = hook
+            self._current.settrace(hook)
+        finally:
+            self._lock.release()
+
+    def _currentgeneration(self):
+        # the generation of the current snapshot, for registries which
+        # have this registry as a base
+        return self._snapshot()._currentgeneration()
+
+    @property
+    def generation(self):
+        """ The ``generation`` of the current snapshot (see
+        ``Registry.generation``) """
+        return self._snapshot()._currentgeneration()
+
+    def add_observer(self, observer):
+        """ Call ``observer`` after each later change to the
+        registrations of this registry, as ``Registry.add_observer``
+        does.  Observers are called once the snapshot including the
+        change has been put in place, with the lock held. """
+        self._lock.acquire()
+        try:
+            self._observers = self._observers + (observer,)
+        finally:
+            self._lock.release()
+
+    def remove_observer(self, observer):
+        """ Stop calling ``observer`` (added with ``add_observer``) """
+        self._lock.acquire()
+        try:
+            observers = list(self._observers)
+            if observer in observers:
+                observers.remove(observer)
+                self._observers = tuple(observers)
+        finally:
+            self._lock.release()
+
+    def _lookup(self, *arg):
+        return self._snapshot()._lookup(*arg)
+
+    def _planfor(self, plankey):
+        return self._snapshot()._planfor(plankey)
+
+    def copy(self, warm=False):
+        """ Return a new ``ConcurrentRegistry`` with the same
+        registrations as this one.  The copy shares the registrations
+        of this registry until either of them is changed, as
+        ``Registry.copy`` does, but it has a snapshot of its own, which
+        takes time proportional to the size of the registry to make.
+        If ``warm`` is true, the lookup cache of the copy starts with
+        the lookup results cached by this registry."""
+        self._lock.acquire()
+        try:
+            new = self.__class__.__new__(self.__class__)
+            new._lock = threading.RLock()
+            new._master = self._master.copy()
+            new._master.changes = []
+            new._current = new._master.freeze()
+            new._tracehook = None
+            if warm:
+                current = self._snapshot()
+                new._current._lkpcache.update(current._lkpcache)
+                new._current._plans.update(current._plans)
+            return new
+        finally:
+            self._lock.release()
+
+    def __cmp__(self, other):
+        if isinstance(other, ConcurrentRegistry):
+            other = other._snapshot()
+        return self._snapshot().__cmp__(other)
+
+    __len__ = _reader('__len__')
+    __getitem__ = _reader('__getitem__')
+    __contains__ = _reader('__contains__')
+    __iter__ = _reader('__iter__')
+    has_key = _reader('has_key')
+    get = _reader('get')
+    items = _reader('items')
+    keys = _reader('keys')
+    values = _reader('values')
+    iteritems = _reader('iteritems')
+    iterkeys = _reader('iterkeys')
+    itervalues = _reader('itervalues')
+    lookup = _reader('lookup')
+    resolve = _reader('resolve')
+    lookup_many = _reader('lookup_many')
+    resolve_many = _reader('resolve_many')
+    notify = _reader('notify')
+    anotify = _reader('anotify')
+    stats = _reader('stats')
+    load_lazy = _reader('load_lazy')
+    reset_stats = _reader('reset_stats')
+    shutdown = _reader('shutdown')
+
+    __setitem__ = _writer('__setitem__')
+    __delitem__ = _writer('__delitem__')
+    clear = _writer('clear')
+    update = _writer('update')
+    setdefault = _writer('setdefault')
+    pop = _writer('pop')
+    popitem = _writer('popitem')
+    register = _writer('register')
+    unregister = _writer('unregister')
+    subscribe = _writer('subscribe')
+    unsubscribe = _writer('unsubscribe')
+    register_many = _writer('register_many')
+
 def directlyprovidedby(obj):
     try:
         return obj.__component_types__
@@ -343,6 +2348,39 @@ def defaultprovidedby(obj):
         # probably an oldstyle class
         return (type(obj), None)
 
+_signatures = {}
+_maxsignatures = 10000
+
+def typesignature(obj):
+    """ Return a tuple of the component types supplied by ``obj`` (as
+    used in the requires argument of a lookup) and its default
+    component types.  The result is computed only once for instances
+    of any given class which don't have types of their own; the cache
+    is emptied whenever ``provides`` or ``onlyprovides`` is applied
+    to a class."""
+    try:
+        cls = obj.__class__
+        instancetypes = '__component_types__' in obj.__dict__
+    except AttributeError:
+        # no instance dictionary, but types may still be in a slot
+        try:
+            cls = obj.__class__
+        except AttributeError:
+            cls = None
+        instancetypes = cls is None or isinstance(
+            getattr(cls, '__component_types__', None), MemberDescriptorType)
+    if instancetypes or isinstance(obj, _classtypes):
+        return (directlyprovidedby(obj)+alsoprovidedby(obj),
+                defaultprovidedby(obj))
+    signature = _signatures.get(cls)
+    if signature is None:
+        if len(_signatures) >= _maxsignatures:
+            _signatures.clear()
+        signature = (directlyprovidedby(obj)+alsoprovidedby(obj),
+                     defaultprovidedby(obj))
+        _signatures[cls] = signature
+    return signature
+
 def providedby(obj):
     """ Return a sequence of component types provided by obj ordered
     most specific to least specific.  """
@@ -437,9 +2475,11 @@ def _class_add_types(cls, types):
     alreadyprovides = alsoprovidedby(cls)
     alreadyprovides = tuple([ x for x in alreadyprovides if x not in types ])
     cls.__inherited_component_types__ = types + alreadyprovides
+    _signatures.clear()
 
 def _class_set_types(obj, types):
     obj.__inherited_component_types__ = types
+    _signatures.clear()
 
 def _classprovides_advice(cls):
     types, only = cls.__dict__['__implements_advice_data__']
@@ -0,0 +1,127 @@
+import unittest
+
+class TestBenchPickle(unittest.TestCase):
+    def _callFUT(self, count):
+        from repoze.component.bench import bench_pickle
+        return bench_pickle(count)
+
+    def test_it(self):
+        result = self._callFUT(10)
+        self.assertEqual(result['registrations'], 10)
+        self.failUnless(result['size'] > 0)
+        self.failUnless(result['data_size'] > 0)
+        self.failUnless(result['dump_seconds'] >= 0)
+        self.failUnless(result['load_seconds'] >= 0)
+
+class TestPerCall(unittest.TestCase):
+    def _callFUT(self, func, **kw):
+        from repoze.component.bench import per_call
+        return per_call(func, **kw)
+
+    def test_it(self):
+        L = []
+        result = self._callFUT(lambda: L.append(1), repeat=2, mintime=0)
+        self.failUnless(result >= 0)
+        # one call to calibrate, one for each repeat
+        self.assertEqual(len(L), 3)
+
+class TestBenchmarks(unittest.TestCase):
+    def test_lookup(self):
+        from repoze.component.bench import bench_lookup
+        result = bench_lookup(10)
+        self.assertEqual(sorted(result.keys()),
+                         ['cold', 'cold_notfound', 'warm', 'warm_notfound'])
+
+    def test_resolve(self):
+        from repoze.component.bench import bench_resolve
+        result = bench_resolve(types=(2,), positions=(1, 3))
+        self.assertEqual(sorted(result.keys()),
+                         ['cold_2_types_1_positions',
+                          'cold_2_types_3_positions',
+                          'warm_2_types_1_positions',
+                          'warm_2_types_3_positions'])
+
+    def test_register(self):
+        from repoze.component.bench import bench_register
+        result = bench_register(10)
+        self.assertEqual(result['registrations'], 10)
+        self.failUnless(result['seconds'] >= 0)
+
+    def test_subscribe(self):
+        from repoze.component.bench import bench_subscribe
+        result = bench_subscribe(3)
+        self.assertEqual(result['subscribers'], 3)
+        self.failUnless(result['churn'] >= 0)
+
+    def test_notify(self):
+        from repoze.component.bench import bench_notify
+        result = bench_notify((2,))
+        self.assertEqual(result.keys(), ['2_subscribers'])
+
+    def test_copy(self):
+        from repoze.component.bench import bench_copy
+        result = bench_copy(10)
+        self.assertEqual(sorted(result.keys()),
+                         ['copy', 'copy_register', 'registrations'])
+
+    def test_memory(self):
+        from repoze.component.bench import bench_memory
+        result = bench_memory((10,))
+        self.failUnless(result['compact_10_bytes'] <
+                        result['default_10_bytes'])
+        self.failUnless(result['compact_shared_10_bytes'] <=
+                        result['default_shared_10_bytes'])
+
+class TestLayoutSize(unittest.TestCase):
+    def _callFUT(self, obj):
+        from repoze.component.bench import layout_size
+        return layout_size(obj)
+
+    def test_it(self):
+        import sys
+        from repoze.component.registry import _Registrations
+        shared = ('a',)
+        info = _Registrations()
+        info.add('p', '', 'one')
+        obj = {shared:[shared, 'string'], 'key':info}
+        self.assertEqual(self._callFUT(obj),
+                         sys.getsizeof(obj) + sys.getsizeof(shared) +
+                         sys.getsizeof([shared, 'string']) +
+                         sys.getsizeof(info) + sys.getsizeof(info.entries))
+
+class TestMakeTypes(unittest.TestCase):
+    def test_it(self):
+        from repoze.component.bench import make_types
+        from repoze.component import providedby
+        cls = make_types(3)
+        self.assertEqual(providedby(cls()),
+                         ('type0', 'type1', 'type2', cls, None))
+
+class TestMain(unittest.TestCase):
+    def _callFUT(self, argv, out):
+        from repoze.component.bench import main
+        return main(argv, out)
+
+    def test_unknown_benchmark(self):
+        from StringIO import StringIO
+        out = StringIO()
+        self.assertRaises(ValueError, self._callFUT, ['bench', 'wrong'], out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_named_benchmark(self):
+        import json
+        from StringIO import StringIO
+        from repoze.component import bench
+        L = []
+        def dummy():
+            L.append(True)
+            return {'value':1}
+        old = bench.benchmarks
+        bench.benchmarks = [('dummy', dummy), ('other', None)]
+        try:
+            out = StringIO()
+            self._callFUT(['bench', 'dummy'], out)
+        finally:
+            bench.benchmarks = old
+        self.assertEqual(json.loads(out.getvalue()), {'dummy':{'value':1}})
+        self.assertEqual(L, [True])
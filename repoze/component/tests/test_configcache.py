@@ -0,0 +1,217 @@
+import unittest
+
+class ConfigCacheTestBase(unittest.TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, 'configure.yml')
+        self.path = os.path.join(self.tempdir, 'configure.cache')
+        self._writeSource('--- !component\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tempdir)
+
+    def _writeSource(self, text):
+        f = open(self.source, 'w')
+        try:
+            f.write(text)
+        finally:
+            f.close()
+
+    def _makeRegistry(self):
+        from repoze.component import Registry
+        from repoze.component.registry import _subscribers
+        registry = Registry()
+        registry.register('view', dummy_view, 'abc', 'def', name='name')
+        registry.register('view', 'string', 'abc')
+        registry.register('utility', 1)
+        registry.subscribe(dummy_subscriber, 'abc')
+        registry.register(_subscribers, dummy_subscriber, 'def')
+        return registry
+
+class TestDumpLoad(ConfigCacheTestBase):
+    def _dump(self, registry):
+        from repoze.component.configcache import dump
+        dump(registry, [self.source], self.path)
+
+    def _callFUT(self, registry):
+        from repoze.component.configcache import load
+        return load(registry, self.path)
+
+    def test_roundtrip(self):
+        from repoze.component import Registry
+        from repoze.component.registry import _subscribers
+        original = self._makeRegistry()
+        self._dump(original)
+        registry = Registry()
+        self.assertEqual(self._callFUT(registry), True)
+        self.assertEqual(registry, original)
+        self.assertEqual(registry.lookup('view', 'abc', 'def', name='name'),
+                         dummy_view)
+        self.assertEqual(registry.lookup('view', 'abc'), 'string')
+        self.assertEqual(registry['utility'], 1)
+        self.assertEqual(registry.lookup(_subscribers, 'abc'),
+                         [dummy_subscriber])
+        self.assertEqual(registry.lookup(_subscribers, 'def'),
+                         dummy_subscriber)
+        self.assertEqual(registry.listener_registered, True)
+
+    def test_subscribers_merged(self):
+        from repoze.component import Registry
+        from repoze.component.registry import _subscribers
+        self._dump(self._makeRegistry())
+        registry = Registry()
+        registry.subscribe('existing', 'abc')
+        self._callFUT(registry)
+        self.assertEqual(registry.lookup(_subscribers, 'abc'),
+                         ['existing', dummy_subscriber])
+
+    def test_no_file(self):
+        from repoze.component import Registry
+        registry = Registry()
+        self.assertEqual(self._callFUT(registry), False)
+        self.assertEqual(len(registry.data), 0)
+
+    def test_not_a_cache(self):
+        from repoze.component import Registry
+        f = open(self.path, 'wb')
+        f.write('garbage')
+        f.close()
+        self.assertEqual(self._callFUT(Registry()), False)
+
+    def test_source_changed(self):
+        from repoze.component import Registry
+        self._dump(self._makeRegistry())
+        self._writeSource('--- !subscriber\n')
+        registry = Registry()
+        self.assertEqual(self._callFUT(registry), False)
+        self.assertEqual(len(registry.data), 0)
+
+    def test_source_removed(self):
+        import os
+        from repoze.component import Registry
+        self._dump(self._makeRegistry())
+        os.remove(self.source)
+        self.assertEqual(self._callFUT(Registry()), False)
+
+    def test_all_order(self):
+        from repoze.component import Registry
+        from repoze.component.registry import ALL
+        original = Registry()
+        for name in ('zeta', 'alpha', 'mid', 'beta', 'omega'):
+            original.register('view', name, 'abc', name=name)
+            original.subscribe(name, 'abc', name=name)
+        self._dump(original)
+        registry = Registry()
+        self._callFUT(registry)
+        self.assertEqual(registry.lookup('view', 'abc', name=ALL),
+                         ['zeta', 'alpha', 'mid', 'beta', 'omega'])
+        self.assertEqual(registry.data, original.data)
+
+    def test_replaced(self):
+        from repoze.component import Registry
+        from repoze.component.registry import ALL
+        original = Registry()
+        original.register('p', 'old', 'b')
+        original.register('p', 'other', 'b', name='name')
+        original.register('p', 'new', 'b')
+        self._dump(original)
+        registry = Registry()
+        self._callFUT(registry)
+        self.assertEqual(registry.lookup('p', 'b'), 'new')
+        self.assertEqual(registry.lookup('p', 'b', name=ALL),
+                         ['old', 'other', 'new'])
+        self.assertEqual(registry, original)
+
+    def test_not_storable(self):
+        from repoze.component import Registry
+        registry = Registry()
+        registry.register('p', 'old', 'b', name='name')
+        registry.register('p', 'new', 'b', name='name')
+        registry.unregister('p', 'new', 'b', name='name')
+        self.assertRaises(ValueError, self._dump, registry)
+
+    def test_unpicklable_removes_temp_file(self):
+        import os
+        from repoze.component import Registry
+        registry = Registry()
+        registry.register('view', lambda context: None, 'abc')
+        self.assertRaises(Exception, self._dump, registry)
+        self.assertEqual(os.listdir(self.tempdir), ['configure.yml'])
+
+    def test_lazy(self):
+        from repoze.component import Registry
+        from repoze.component.registry import Lazy
+        resolved = []
+        def resolve(name):
+            resolved.append(name)
+            return dummy_view
+        original = Registry()
+        original.register('view', Lazy('.dummy_view', resolve), 'abc')
+        self._dump(original)
+        self.assertEqual(resolved, ['.dummy_view'])
+        registry = Registry()
+        self._callFUT(registry)
+        component = registry.data[('abc',)][('view', '')]
+        self.failUnless(isinstance(component, Lazy))
+        self.assertEqual(component.dottedname,
+            'repoze.component.tests.test_configcache:dummy_view')
+        self.assertEqual(registry.lookup('view', 'abc'), dummy_view)
+
+    def test_lazy_not_importable(self):
+        from repoze.component import Registry
+        from repoze.component.registry import Lazy
+        registry = Registry()
+        registry.register('view', Lazy('view', lambda name: object()), 'abc')
+        self.assertRaises(ValueError, self._dump, registry)
+
+class TestExecute(ConfigCacheTestBase):
+    def setUp(self):
+        from repoze.component import configcache
+        ConfigCacheTestBase.setUp(self)
+        self.configured = []
+        def configure(filename, registry):
+            self.configured.append(filename)
+            registry.register('view', dummy_view, 'abc')
+        self.old_configure = configcache._configure
+        configcache._configure = configure
+
+    def tearDown(self):
+        from repoze.component import configcache
+        configcache._configure = self.old_configure
+        ConfigCacheTestBase.tearDown(self)
+
+    def _callFUT(self, registry, sources=None):
+        from repoze.component.configcache import execute
+        return execute(self.source, registry, self.path, sources)
+
+    def test_miss_then_hit(self):
+        from repoze.component import Registry
+        registry = Registry()
+        self.assertEqual(self._callFUT(registry), False)
+        self.assertEqual(self.configured, [self.source])
+        self.assertEqual(registry.lookup('view', 'abc'), dummy_view)
+        registry = Registry()
+        self.assertEqual(self._callFUT(registry), True)
+        self.assertEqual(self.configured, [self.source])
+        self.assertEqual(registry.lookup('view', 'abc'), dummy_view)
+
+    def test_included_source_changed(self):
+        import os
+        from repoze.component import Registry
+        included = os.path.join(self.tempdir, 'included.yml')
+        open(included, 'w').write('one')
+        sources = [self.source, included]
+        self._callFUT(Registry(), sources)
+        self.assertEqual(self._callFUT(Registry(), sources), True)
+        open(included, 'w').write('two')
+        self.assertEqual(self._callFUT(Registry(), sources), False)
+        self.assertEqual(len(self.configured), 2)
+
+def dummy_view(context):
+    """ """
+
+def dummy_subscriber(event):
+    """ """
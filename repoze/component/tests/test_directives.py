@@ -77,6 +77,26 @@ class TestComponentDirective(unittest.TestCase):
         self.assertEqual(callback['kw'], {'name':'name'})
         self.assertEqual(override, True)
 
+    def test_lazy(self):
+        from repoze.component.registry import Lazy
+        structure = {'provides':'provides',
+                     'object':'object',
+                     'name':'name',
+                     'lazy':True}
+        declaration = DummyDeclaration(structure=structure)
+        self._callFUT(declaration)
+        actions = declaration.actions
+        self.assertEqual(len(actions), 1)
+        callback, discriminator, override = actions[0]
+        self.assertEqual(discriminator,
+                         ('component', (), 'provides', 'name') )
+        provides, component = callback['arg']
+        self.assertEqual(provides, 'provides')
+        self.failUnless(isinstance(component, Lazy))
+        self.assertEqual(declaration.resolved, [])
+        self.assertEqual(component.load(), 'object')
+        self.assertEqual(declaration.resolved, ['object'])
+
 class TestSubscriberDirective(unittest.TestCase):
     def _callFUT(self, declaration):
         from repoze.component.directives import subscriber
@@ -136,8 +156,10 @@ class DummyDeclaration:
         self.diff = kw.get('diff', False)
         self.badstructure = kw.get('badstructure', False)
         self.structure = kw.get('structure', {})
+        self.resolved = []
 
     def resolve(self, name):
+        self.resolved.append(name)
         return name
 
     def string(self, name, default=None):
@@ -0,0 +1,179 @@
+import unittest
+
+class TestMappedRegistry(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tempdir)
+
+    def _getTargetClass(self):
+        from repoze.component.mapped import MappedRegistry
+        return MappedRegistry
+
+    def _export(self, registry):
+        import os
+        from repoze.component.mapped import export
+        path = os.path.join(self.tempdir, 'registry.snapshot')
+        export(registry, path)
+        return path
+
+    def _makeOne(self, registry=None, **kw):
+        if registry is None:
+            registry = self._makeRegistry()
+        return self._getTargetClass()(self._export(registry), **kw)
+
+    def _makeRegistry(self):
+        from repoze.component import Registry
+        registry = Registry({'a':1, 'b':None})
+        registry.register('bladerunner', 'deckardvalue' , None, 'deckard')
+        registry.register('friend', 'luckmanvalue', 'luckman', name='name')
+        registry.register('friend', 'othervalue', 'luckman', name='other')
+        registry.register('fight', 'barrisluckmanvalue', 'barris', 'luckman')
+        registry.register('factory', dummy_factory, DummyClass)
+        registry.register('unicode', u'\N{SNOWMAN}', u'\N{COMET}', 7)
+        return registry
+
+    def test_lookup(self):
+        mapped = self._makeOne()
+        look = mapped.lookup
+        self.assertEqual(look('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+        self.assertEqual(look('bladerunner', 'abc', 'deckard'),
+                         'deckardvalue')
+        self.assertEqual(look('friend', 'luckman', name='name'),
+                         'luckmanvalue')
+        self.assertEqual(look('unicode', u'\N{COMET}', 7), u'\N{SNOWMAN}')
+        self.assertEqual(look('fight', 'barris', 'deckard', default=None),
+                         None)
+        self.assertEqual(look('notthere', 'barris', default=None), None)
+        self.assertEqual(look('fight', 'barris', object(), default=None),
+                         None)
+        self.assertRaises(LookupError, look, 'fight', 'deckard', 'barris')
+
+    def test_lookup_all(self):
+        from repoze.component import ALL
+        mapped = self._makeOne()
+        result = mapped.lookup('friend', 'luckman', name=ALL)
+        self.assertEqual(sorted(result), ['luckmanvalue', 'othervalue'])
+
+    def test_resolve(self):
+        mapped = self._makeOne()
+        self.assertEqual(mapped.resolve('factory', DummyClass()),
+                         dummy_factory)
+        self.assertEqual(mapped.stats()['hits'], 0)
+        self.assertEqual(mapped.resolve('factory', DummyClass()),
+                         dummy_factory)
+        self.assertEqual(mapped.stats()['hits'], 1)
+
+    def test_mapping(self):
+        mapped = self._makeOne()
+        self.assertEqual(sorted(mapped.items()), [('a', 1), ('b', None)])
+        self.assertEqual(mapped['a'], 1)
+        self.failUnless(mapped == {'a':1, 'b':None})
+        self.failUnless(mapped == self._makeOne())
+
+    def test_frozen(self):
+        mapped = self._makeOne()
+        self.assertRaises(TypeError, mapped.register, 'a', 'b')
+        self.assertRaises(TypeError, mapped.__setitem__, 'a', 'b')
+        self.failUnless(mapped.freeze() is mapped)
+
+    def test_notify(self):
+        from repoze.component import Registry
+        registry = Registry()
+        registry.subscribe(dummy_subscriber, 'dummy')
+        mapped = self._makeOne(registry)
+        self.assertEqual(mapped.listener_registered, True)
+        event = DummyEvent()
+        mapped.notify(event)
+        self.assertEqual(event.called, 1)
+
+    def test_lazy(self):
+        from repoze.component import Registry
+        from repoze.component.registry import Lazy
+        registry = Registry()
+        registry.register('factory', Lazy(
+            'repoze.component.tests.test_mapped:dummy_factory'), 'a')
+        registry.subscribe(Lazy(
+            'repoze.component.tests.test_mapped.dummy_subscriber'), 'dummy')
+        mapped = self._makeOne(registry)
+        self.assertEqual(mapped.lookup('factory', 'a'), dummy_factory)
+        event = DummyEvent()
+        mapped.notify(event)
+        self.assertEqual(event.called, 1)
+
+    def test_pickle(self):
+        import pickle
+        mapped = self._makeOne(lookup_cache_size=5)
+        loaded = pickle.loads(pickle.dumps(mapped))
+        self.assertEqual(loaded.path, mapped.path)
+        self.assertEqual(loaded._lkpcachesize, 5)
+        self.assertEqual(loaded.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+
+    def test_not_a_snapshot(self):
+        import os
+        path = os.path.join(self.tempdir, 'wrong')
+        f = open(path, 'wb')
+        f.write('x' * 100)
+        f.close()
+        self.assertRaises(ValueError, self._getTargetClass(), path)
+
+    def test_short_file(self):
+        import os
+        path = os.path.join(self.tempdir, 'short')
+        f = open(path, 'wb')
+        f.write('RCMAP001')
+        f.close()
+        self.assertRaises(ValueError, self._getTargetClass(), path)
+
+    def test_many_registrations(self):
+        from repoze.component import Registry
+        registry = Registry()
+        for i in range(500):
+            registry.register('p%d' % (i % 7), i, 'r%d' % i, 'q%d' % (i % 3))
+        mapped = self._makeOne(registry)
+        for i in range(500):
+            self.assertEqual(
+                mapped.lookup('p%d' % (i % 7), 'r%d' % i, 'q%d' % (i % 3)), i)
+
+class TestExport(unittest.TestCase):
+    def _callFUT(self, registry, path):
+        from repoze.component.mapped import export
+        return export(registry, path)
+
+    def test_unstorable_component(self):
+        import os
+        import tempfile
+        from repoze.component import Registry
+        registry = Registry()
+        registry.register('p', object(), 'a')
+        path = tempfile.mktemp()
+        self.assertRaises(ValueError, self._callFUT, registry, path)
+        self.failIf(os.path.exists(path))
+
+    def test_unstorable_requires(self):
+        import tempfile
+        from repoze.component import Registry
+        class Local(object):
+            pass
+        registry = Registry()
+        registry.register('p', 'value', Local)
+        self.assertRaises(ValueError, self._callFUT, registry,
+                          tempfile.mktemp())
+
+class DummyClass(object):
+    pass
+
+class DummyEvent(object):
+    __component_types__ = ('dummy',)
+    called = 0
+
+def dummy_factory(context):
+    return context
+
+def dummy_subscriber(event):
+    event.called += 1
@@ -14,6 +14,43 @@ class TestRegistry(unittest.TestCase):
         self.assertEqual(registry['a'], 1)
         self.assertEqual(registry['b'], 2)
 
+    def test_ctor_cache_sizes_not_registered(self):
+        registry = self._makeOne(lookup_cache_size=5,
+                                 combination_cache_size=6)
+        self.assertEqual(len(registry), 0)
+        self.assertEqual(registry._lkpcache.size, 5)
+        self.assertEqual(registry._combocache.size, 6)
+
+    def test_ctor_cache_sizes_default(self):
+        registry = self._makeOne()
+        self.assertEqual(registry._lkpcache.size, 1000)
+        self.assertEqual(registry._combocache.size, 1000)
+
+    def test_ctor_cache_unbounded(self):
+        from repoze.component.registry import UnboundedCache
+        registry = self._makeOne(lookup_cache_size=None,
+                                 combination_cache_size=None)
+        self.assertEqual(registry._lkpcache.__class__, UnboundedCache)
+        self.assertEqual(registry._combocache.__class__, UnboundedCache)
+        registry.register('foo', 'somevalue', 'a')
+        self.assertEqual(registry.lookup('foo', 'a'), 'somevalue')
+        self.assertEqual(registry.lookup('foo', 'a'), 'somevalue')
+        self.assertEqual(len(registry._lkpcache.data), 1)
+        self.assertEqual(len(registry._combocache.data), 1)
+
+    def test_ctor_cache_disabled(self):
+        from repoze.component.registry import NullCache
+        registry = self._makeOne(lookup_cache_size=0,
+                                 combination_cache_size=0)
+        self.assertEqual(registry._lkpcache.__class__, NullCache)
+        self.assertEqual(registry._combocache.__class__, NullCache)
+        registry.register('foo', 'somevalue', 'a')
+        self.assertEqual(registry.lookup('foo', 'a'), 'somevalue')
+        self.assertEqual(registry.lookup('foo', 'b', default=None), None)
+        registry.register('foo', 'othervalue', 'b')
+        self.assertEqual(registry.lookup('foo', 'b'), 'othervalue')
+        self.assertEqual(registry._lkpindex, {})
+
     def test_cmp_againstreg(self):
         registry1 = self._makeOne()
         registry2 = self._makeOne()
@@ -76,6 +113,142 @@ class TestRegistry(unittest.TestCase):
         registry2 = registry.copy()
         self.assertEqual(registry, registry2)
 
+    def test_copy_subscribers_without_requires(self):
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        registry.subscribe('f')
+        copy = registry.copy()
+        copy.subscribe('g')
+        self.assertEqual(copy[_subscribers], ['f', 'g'])
+        self.failUnless(copy[_subscribers] is copy.data[()][(_subscribers, '')])
+        registry.subscribe('h')
+        self.assertEqual(registry[_subscribers], ['f', 'h'])
+        self.assertEqual(copy[_subscribers], ['f', 'g'])
+
+    def test_copy_shares_registrations(self):
+        registry = self._makeOne({'a':1})
+        registry.register('p', 'one', 'a')
+        copy = registry.copy()
+        self.failUnless(copy.data is registry.data)
+        self.failUnless(copy._dictmembers is registry._dictmembers)
+        self.failIf(copy._lkpcache is registry._lkpcache)
+        copy.register('p', 'two', 'b')
+        self.failIf(copy.data is registry.data)
+        self.failUnless(copy.data[('a',)] is registry.data[('a',)])
+        copy.register('p', 'three', 'a', name='three')
+        self.failIf(copy.data[('a',)] is registry.data[('a',)])
+        self.assertEqual(sorted(registry.data.keys()), [(), ('a',)])
+
+    def test_copy_original_changed(self):
+        registry = self._makeOne({'a':1})
+        copy = registry.copy()
+        registry['b'] = 2
+        registry.unregister('a', 1)
+        self.assertEqual(copy, {'a':1})
+        self.assertEqual(registry, {'b':2})
+
+    def test_copy_subscribers(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        registry.subscribe('one', 'a')
+        copy = registry.copy()
+        copy.subscribe('two', 'a')
+        registry.unsubscribe('one', 'a')
+        self.assertEqual(copy.lookup(_subscribers, 'a'), ['one', 'two'])
+        self.assertEqual(copy.lookup(_subscribers, 'a', name=ALL),
+                         [['one', 'two']])
+        self.assertEqual(registry.lookup(_subscribers, 'a', default=None),
+                         None)
+
+    def test_copy_compact_subscribers(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne(compact=True)
+        registry.subscribe('one', 'a')
+        registry.register(_subscribers, ['other'], 'a', name='other')
+        copy = registry.copy()
+        copy.subscribe('two', 'a')
+        self.assertEqual(copy.lookup(_subscribers, 'a', name=ALL),
+                         [['one', 'two'], ['other']])
+        self.assertEqual(registry.lookup(_subscribers, 'a', name=ALL),
+                         [['one'], ['other']])
+
+    def test_copy_of_copy(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        copy = registry.copy()
+        copy.register('p', 'two', 'a')
+        copy2 = copy.copy()
+        copy2.register('p', 'three', 'a')
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        self.assertEqual(copy.lookup('p', 'a'), 'two')
+        self.assertEqual(copy2.lookup('p', 'a'), 'three')
+
+    def test_copy_indexed(self):
+        registry = self._makeOne(indexed=True)
+        registry.register('p', 'one', 'a', 'b')
+        registry.lookup('p', 'a', 'b')
+        copy = registry.copy()
+        copy.register('p', 'two', 'a', 'c')
+        registry.unregister('p', 'one', 'a', 'b')
+        self.assertEqual(copy.lookup('p', 'a', 'b'), 'one')
+        self.assertEqual(copy.lookup('p', 'a', 'c'), 'two')
+        self.assertEqual(registry.lookup('p', 'a', 'c', default=None), None)
+
+    def test_copy_indexed_copies_changed_entries(self):
+        registry = self._makeOne(indexed=True)
+        registry.register('p', 'one', 'a', 'b')
+        registry.register('q', 'two', 'a', 'b')
+        registry.lookup('p', 'a', 'b')
+        index = registry._regindex
+        copy = registry.copy()
+        copy.register('p', 'three', 'a', 'c')
+        self.failIf(copy._regindex is None)
+        self.failIf(copy._regindex is index)
+        self.failUnless(registry._regindex is index)
+        self.failUnless(copy._regindex[('q', '', 2)] is index[('q', '', 2)])
+        self.failIf(copy._regindex[('p', '', 2)] is index[('p', '', 2)])
+        self.assertEqual(index[('p', '', 2)][1], {'b':set([('a', 'b')])})
+        self.assertEqual(copy.lookup('p', 'a', 'c'), 'three')
+        self.assertEqual(registry.lookup('p', 'a', 'c', default=None), None)
+        copy.unregister('q', 'two', 'a', 'b')
+        self.assertEqual(index[('q', '', 2)][0], {'a':set([('a', 'b')])})
+        self.assertEqual(registry.lookup('q', 'a', 'b'), 'two')
+        self.assertEqual(copy.lookup('q', 'a', 'b', default=None), None)
+
+    def test_copy_cache(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.lookup('p', 'a')
+        copy = registry.copy()
+        self.assertEqual(copy.stats()['lookups'], 0)
+        copy.lookup('p', 'a')
+        self.assertEqual(copy.stats()['hits'], 0)
+        warm = registry.copy(warm=True)
+        self.assertEqual(warm.lookup('p', 'a'), 'one')
+        self.assertEqual(warm.stats()['hits'], 1)
+        warm.register('p', 'two', 'a')
+        self.assertEqual(warm.lookup('p', 'a'), 'two')
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+
+    def test_copy_not_observed(self):
+        registry = self._makeOne()
+        L = []
+        registry.add_observer(lambda *arg: L.append(arg))
+        copy = registry.copy()
+        copy.register('p', 'one', 'a')
+        self.assertEqual(L, [])
+        self.failUnless(copy.generation > registry.generation)
+
+    def test_copy_not_traced(self):
+        registry = self._makeOne()
+        traces = []
+        registry.settrace(traces.append)
+        copy = registry.copy()
+        copy.lookup('p', default=None)
+        self.assertEqual(traces, [])
+
     def test_items(self):
         d = {'a':1, 'b':2}
         registry = self._makeOne(d)
@@ -197,6 +370,7 @@ class TestRegistry(unittest.TestCase):
         from repoze.component.registry import ALL
         registry = self._makeOne()
         registry._lkpcache = DummyLRUCache()
+        registry.lookup('provides', 'a', 'b', 'c', name='foo', default=None)
         registry.register('provides', 'component', 'a', 'b', 'c', name='foo')
         registered = registry.data[('a', 'b', 'c')]
         self.assertEqual(registered[('provides', 'foo')], 'component')
@@ -205,7 +379,10 @@ class TestRegistry(unittest.TestCase):
         self.assertEqual(registered[('provides', 'bar')], 'component2')
         self.assertEqual(registered[('provides', ALL)],
                          ['component', 'component2'])
-        self.assertEqual(registry._lkpcache.cleared, True)
+        self.assertEqual(registry._lkpcache.invalidated,
+                         [('provides', (('a',), ('b',), ('c',)), 'foo',
+                           ((None,), (None,), (None,)))])
+        self.failIf(hasattr(registry._lkpcache, 'cleared'))
 
     def test_register_all_name_fails(self):
         from repoze.component.registry import ALL
@@ -227,8 +404,9 @@ class TestRegistry(unittest.TestCase):
             ('provides', 'bar'):'component2',
             ('provides', ALL):['component', 'component2'],
             }
+        registry.lookup('provides', 'a', 'b', 'c', name='foo', default=None)
         registry.unregister('provides', 'component', 'a', 'b', 'c', name='foo')
-        self.assertEqual(registry._lkpcache.cleared, True)
+        self.assertEqual(len(registry._lkpcache.invalidated), 1)
         registered = registry.data[('a', 'b', 'c')]
         self.assertEqual(registered,
                          {('provides', 'bar'): 'component2',
@@ -238,6 +416,94 @@ class TestRegistry(unittest.TestCase):
         registry.unregister('provides', 'component2', 'a', 'b', 'c', name='bar')
         self.failIf(('a', 'b', 'c') in registry.data)
 
+    def test_unregister_wrong_component(self):
+        registry = self._makeOne()
+        registry.register('p', 'x')
+        registry.lookup('p')
+        generation = registry.generation
+        self.assertRaises(ValueError, registry.unregister, 'p', 'WRONG')
+        self.assertEqual(registry.lookup('p'), 'x')
+        self.assertEqual(registry['p'], 'x')
+        self.assertEqual(registry.data[()][('p', '')], 'x')
+        self.assertEqual(registry.generation, generation)
+
+    def test_lookup_index_bounded(self):
+        registry = self._makeOne(lookup_cache_size=10)
+        registry.register('p', 'one', 'a')
+        for i in range(5000):
+            registry.lookup('p', i, default=None)
+        keys = registry._lkpindex[('p', 1)]
+        self.failUnless(len(keys) <= 20)
+        registry.lookup('p', 'a')
+        registry.register('p', 'two', 'a')
+        self.assertEqual(registry.lookup('p', 'a'), 'two')
+
+    def test_lookup_index_pruned_keeps_new_result(self):
+        registry = self._makeOne(lookup_cache_size=1)
+        registry.lookup('a', default=None)
+        registry.lookup('b', default=None)
+        registry.lookup('p', default=None)
+        registry.register('p', 'new')
+        self.assertEqual(registry.lookup('p', default=None), 'new')
+
+    def test_lookup_index_pruned_by_many_threads(self):
+        import sys
+        import threading
+        registry = self._makeOne(lookup_cache_size=2)
+        errors = []
+        def lookups(step):
+            try:
+                for i in range(2000):
+                    registry.lookup('p%d' % (i * step % 50), default=None)
+            except Exception, e:
+                errors.append(e)
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            threads = [ threading.Thread(target=lookups, args=(step,))
+                        for step in range(1, 7) ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        self.assertEqual(errors, [])
+        registry.register('p1', 'one')
+        self.assertEqual(registry.lookup('p1'), 'one')
+
+    def test_unregister_keeps_other_provides(self):
+        from repoze.component.registry import ALL
+        registry = self._makeOne()
+        registry.register('provides', 'component', 'a')
+        registry.register('provides2', 'component2', 'a')
+        registry.unregister('provides', 'component', 'a')
+        self.assertEqual(registry.data[('a',)],
+                         {('provides2', ''):'component2',
+                          ('provides2', ALL):['component2']})
+
+    def test_unregister_updates_mapping(self):
+        registry = self._makeOne({'a':1, 'b':2})
+        registry.unregister('a', 1)
+        self.assertEqual(registry._dictmembers, {'b':2})
+        registry.register('a', 1, name='foo')
+        registry.register('a', 2, 'c')
+        self.assertEqual(registry._dictmembers, {'b':2})
+
+    def test_register_updates_mapping(self):
+        registry = self._makeOne()
+        registry.register('a', 1)
+        self.assertEqual(registry._dictmembers, {'a':1})
+        registry.register('a', 2)
+        self.assertEqual(registry._dictmembers, {'a':2})
+
+    def test_delitem_removes_from_all(self):
+        from repoze.component.registry import ALL
+        registry = self._makeOne({'a':1})
+        registry.register('a', 2, name='foo')
+        del registry['a']
+        self.assertEqual(registry.lookup('a', name=ALL), [2])
+
     def test_unregister_all(self):
         from repoze.component.registry import ALL
         registry = self._makeOne()
@@ -246,9 +512,18 @@ class TestRegistry(unittest.TestCase):
             ('provides', 'foo'):'component',
             ('provides', ALL):['component', 'component2'],
             }
+        registry.lookup('provides', 'a', 'b', 'c', name='bar', default=None)
         registry.unregister('provides', 'component', 'a', 'b', 'c', name=ALL)
         self.failIf(('a', 'b', 'c') in registry.data)
-        self.assertEqual(registry._lkpcache.cleared, True)
+        self.assertEqual(len(registry._lkpcache.invalidated), 1)
+
+    def test_unregister_all_norequires_updates_mapping(self):
+        from repoze.component.registry import ALL
+        registry = self._makeOne({'a':1})
+        registry.register('b', 2, name='foo')
+        registry.unregister('a', 1, name=ALL)
+        self.assertEqual(registry._dictmembers, {})
+        self.assertEqual(len(registry), 0)
 
     def test_subscribe(self):
         from repoze.component.registry import _subscribers
@@ -278,8 +553,42 @@ class TestRegistry(unittest.TestCase):
         result = registry.lookup(_subscribers, 'a', 'b', 'c', name='foo')
         self.assertEqual(result, [subscriber])
         registry.unsubscribe(subscriber, 'a', 'b', 'c', name='foo')
-        result = registry.lookup(_subscribers, 'a', 'b', 'c', name='foo')
-        self.assertEqual(result, [])
+        result = registry.lookup(_subscribers, 'a', 'b', 'c', name='foo',
+                                 default=None)
+        self.assertEqual(result, None)
+        self.assertEqual(registry.data, {})
+
+    def test_subscribe_registers_one_list(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        for i in range(3):
+            registry.subscribe(i, 'a')
+        registry.subscribe('other', 'a', name='other')
+        info = registry.data[('a',)]
+        self.assertEqual(info[(_subscribers, '')], [0, 1, 2])
+        self.assertEqual(info[(_subscribers, ALL)], [[0, 1, 2], ['other']])
+        registry.unsubscribe(1, 'a')
+        self.assertEqual(info[(_subscribers, ALL)], [[0, 2], ['other']])
+
+    def test_subscribe_does_not_extend_more_general_subscribers(self):
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        registry.subscribe('general', None)
+        registry.subscribe('specific', 'a')
+        self.assertEqual(registry.lookup(_subscribers, None), ['general'])
+        self.assertEqual(registry.lookup(_subscribers, 'a'), ['specific'])
+        registry.unsubscribe('general', 'a')
+        self.assertEqual(registry.lookup(_subscribers, None), ['general'])
+
+    def test_unsubscribe_last_removes_only_its_list(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        registry.register(_subscribers, [], 'a', name='empty')
+        registry.subscribe('one', 'a', name='one')
+        registry.unsubscribe('one', 'a', name='one')
+        self.assertEqual(registry.data[('a',)][(_subscribers, ALL)], [[]])
 
     def test_unsubscribe_all(self):
         from repoze.component.registry import ALL
@@ -354,6 +663,94 @@ class TestRegistry(unittest.TestCase):
         registry.notify(what, name=ALL)
         self.assertEqual(what.called, 4)
 
+    def test_notify_all_after_many_subscriptions(self):
+        from repoze.component.registry import ALL
+        class What:
+            __component_types__ = ('abc',)
+        what = What()
+        registry = self._makeOne()
+        L = []
+        registry.subscribe(L.append, 'abc')
+        registry.subscribe(L.append, 'abc')
+        registry.subscribe(L.append, 'abc', name='foo')
+        registry.notify(what, name=ALL)
+        self.assertEqual(L, [what, what, what])
+
+    def test_notify_no_matching_subscribers(self):
+        class What:
+            __component_types__ = ('abc',)
+        registry = self._makeOne()
+        registry.subscribe(lambda what: None, 'def')
+        registry.notify(What())
+        # doesn't blow up
+
+    def test_notify_caches_plan(self):
+        L = []
+        class What:
+            __component_types__ = ('abc',)
+        registry = self._makeOne()
+        registry.subscribe(L.append, 'abc')
+        what = What()
+        registry.notify(what)
+        self.assertEqual(registry._plans.values(), [(L.append,)])
+        registry._plans[registry._plans.keys()[0]] = ()
+        registry.notify(what)
+        self.assertEqual(L, [what])
+
+    def test_subscribe_invalidates_affected_plans(self):
+        L = []
+        class ABC:
+            __component_types__ = ('abc',)
+        class DEF:
+            __component_types__ = ('def',)
+        abc = ABC()
+        registry = self._makeOne()
+        registry.subscribe(L.append, 'abc')
+        registry.notify(abc)
+        registry.notify(DEF())
+        self.assertEqual(len(registry._plans), 2)
+        registry.subscribe(L.append, 'def')
+        self.assertEqual(len(registry._plans), 1)
+        registry.subscribe(L.append, 'abc', name='foo')
+        self.assertEqual(len(registry._plans), 1)
+        registry.subscribe(L.append, 'abc')
+        self.assertEqual(len(registry._plans), 0)
+        registry.notify(abc)
+        self.assertEqual(L, [abc, abc, abc])
+
+    def test_unsubscribe_invalidates_plans(self):
+        L = []
+        class ABC:
+            __component_types__ = ('abc',)
+        abc = ABC()
+        registry = self._makeOne()
+        registry.subscribe(L.append, 'abc')
+        registry.notify(abc)
+        registry.unsubscribe(L.append, 'abc')
+        registry.notify(abc)
+        self.assertEqual(L, [abc])
+
+    def test_notify_plans_emptied_at_size(self):
+        class ABC:
+            __component_types__ = ('abc',)
+        class DEF:
+            __component_types__ = ('def',)
+        registry = self._getTargetClass()(lookup_cache_size=1)
+        registry.subscribe(lambda *arg: None, 'abc')
+        registry.notify(ABC())
+        registry.notify(DEF())
+        self.assertEqual(len(registry._plans), 1)
+
+    def test_notify_plans_disabled(self):
+        L = []
+        class ABC:
+            __component_types__ = ('abc',)
+        registry = self._getTargetClass()(lookup_cache_size=0)
+        registry.subscribe(L.append, 'abc')
+        registry.notify(ABC())
+        self.assertEqual(len(L), 1)
+        self.assertEqual(registry._plans, {})
+
     def test_lookup_default(self):
         registry = self._makeOne()
         result = registry.lookup('a', default=registry)
@@ -388,6 +785,241 @@ class TestRegistry(unittest.TestCase):
         self.assertEqual(result, 'registered')
 
 
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError: # pragma: no cover
+        asyncio = None
+
+class TestRegistryAnotify(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _makeOne(self):
+        from repoze.component import Registry
+        return Registry()
+
+    def _run(self, registry, *objects, **kw):
+        kw['loop'] = self.loop
+        future = registry.anotify(*objects, **kw)
+        return self.loop.run_until_complete(future)
+
+    def _makeWhat(self):
+        class What:
+            __component_types__ = ('abc',)
+        return What()
+
+    def _sleeper(self, L, label, delay):
+        @asyncio.coroutine
+        def subscriber(what):
+            L.append(('start', label))
+            yield asyncio.sleep(delay, loop=self.loop)
+            L.append(('end', label))
+        return subscriber
+
+    def test_no_listeners(self):
+        registry = self._makeOne()
+        self.assertEqual(self._run(registry, self._makeWhat()), None)
+
+    def test_plain_and_coroutine_subscribers(self):
+        L = []
+        registry = self._makeOne()
+        registry.subscribe(self._sleeper(L, 'a', 0.01), 'abc')
+        registry.subscribe(lambda what: L.append('plain'), 'abc')
+        registry.subscribe(self._sleeper(L, 'b', 0), 'abc')
+        self._run(registry, self._makeWhat())
+        self.assertEqual(L, ['plain', ('start', 'a'), ('start', 'b'),
+                             ('end', 'b'), ('end', 'a')])
+
+    def test_concurrency(self):
+        L = []
+        registry = self._makeOne()
+        registry.subscribe(self._sleeper(L, 'a', 0.01), 'abc')
+        registry.subscribe(self._sleeper(L, 'b', 0), 'abc')
+        self._run(registry, self._makeWhat(), concurrency=1)
+        self.assertEqual(L, [('start', 'a'), ('end', 'a'),
+                             ('start', 'b'), ('end', 'b')])
+
+    def test_named(self):
+        L = []
+        registry = self._makeOne()
+        registry.subscribe(self._sleeper(L, 'a', 0), 'abc', name='foo')
+        registry.subscribe(self._sleeper(L, 'b', 0), 'abc')
+        self._run(registry, self._makeWhat(), name='foo')
+        self.assertEqual(L, [('start', 'a'), ('end', 'a')])
+
+    def test_coroutine_raises(self):
+        L = []
+        @asyncio.coroutine
+        def broken(what):
+            raise ValueError('broken')
+        registry = self._makeOne()
+        registry.subscribe(broken, 'abc')
+        registry.subscribe(self._sleeper(L, 'a', 0), 'abc')
+        registry.subscribe(self._sleeper(L, 'b', 0), 'abc')
+        self.assertRaises(ValueError, self._run, registry, self._makeWhat(),
+                          concurrency=1)
+        self.assertEqual(L, [])
+
+    def test_plain_raises(self):
+        L = []
+        def broken(what):
+            raise ValueError('broken')
+        registry = self._makeOne()
+        registry.subscribe(self._sleeper(L, 'a', 0), 'abc')
+        registry.subscribe(broken, 'abc')
+        registry.subscribe(lambda what: L.append('plain'), 'abc')
+        self.assertRaises(ValueError, self._run, registry, self._makeWhat())
+        self.assertEqual(L, [])
+
+    def test_future_subscriber(self):
+        registry = self._makeOne()
+        future = asyncio.Future(loop=self.loop)
+        registry.subscribe(lambda what: future, 'abc')
+        result = registry.anotify(self._makeWhat(), loop=self.loop)
+        self.failIf(result.done())
+        future.set_result(1)
+        self.assertEqual(self.loop.run_until_complete(result), None)
+
+if asyncio is None: # pragma: no cover
+    del TestRegistryAnotify
+
+try:
+    from concurrent import futures
+except ImportError: # pragma: no cover
+    futures = None
+
+class TestRegistryNotifyExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = futures.ThreadPoolExecutor(4)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def _makeOne(self):
+        from repoze.component import Registry
+        return Registry()
+
+    def _makeWhat(self):
+        class What:
+            __component_types__ = ('abc',)
+        return What()
+
+    def test_no_listeners(self):
+        registry = self._makeOne()
+        notification = registry.notify(self._makeWhat(),
+                                       executor=self.executor)
+        self.assertEqual(notification.subscribers, ())
+        self.assertEqual(notification.futures, [])
+        self.failUnless(notification.wait())
+        self.assertEqual(notification.errors(), [])
+
+    def test_unordered(self):
+        import threading
+        event = threading.Event()
+        L = []
+        def first(what):
+            event.wait(5)
+            L.append('first')
+        def second(what):
+            L.append('second')
+            event.set()
+            return 'result'
+        registry = self._makeOne()
+        registry.subscribe(first, 'abc')
+        registry.subscribe(second, 'abc')
+        registry.subscribe(second, 'abc', name='other')
+        what = self._makeWhat()
+        notification = registry.notify(what, executor=self.executor)
+        self.assertEqual(notification.subscribers, (first, second))
+        self.failUnless(notification.wait(5))
+        self.failUnless(notification.done())
+        self.assertEqual(L, ['second', 'first'])
+        self.assertEqual(notification.futures[1].result(), 'result')
+
+    def test_ordered(self):
+        import time
+        L = []
+        def first(what):
+            time.sleep(0.01)
+            L.append('first')
+        def second(what):
+            L.append('second')
+        registry = self._makeOne()
+        registry.subscribe(first, 'abc')
+        registry.subscribe(second, 'abc')
+        notification = registry.notify(self._makeWhat(),
+                                       executor=self.executor, ordered=True)
+        self.failUnless(notification.wait(5))
+        self.assertEqual(L, ['first', 'second'])
+
+    def test_errors_captured(self):
+        L = []
+        def broken(what):
+            raise ValueError('broken')
+        registry = self._makeOne()
+        registry.subscribe(broken, 'abc')
+        registry.subscribe(L.append, 'abc')
+        for ordered in (False, True):
+            notification = registry.notify(self._makeWhat(), ordered=ordered,
+                                           executor=self.executor)
+            errors = notification.errors(5)
+            self.assertEqual(len(errors), 1)
+            self.assertEqual(errors[0][0], broken)
+            self.assertEqual(errors[0][1].__class__, ValueError)
+        self.assertEqual(len(L), 2)
+
+    def test_ordered_executor_shut_down(self):
+        self.executor.shutdown()
+        registry = self._makeOne()
+        registry.subscribe(lambda what: None, 'abc')
+        notification = registry.notify(self._makeWhat(),
+                                       executor=self.executor, ordered=True)
+        errors = notification.errors()
+        self.assertEqual(errors[0][1].__class__, RuntimeError)
+
+    def test_builtin_thread_pool(self):
+        L = []
+        registry = self._makeOne()
+        registry.subscribe(L.append, 'abc')
+        notification = registry.notify(self._makeWhat(), executor='thread',
+                                       max_workers=1)
+        executor = registry._executors['thread']
+        self.failUnless(notification.wait(5))
+        self.assertEqual(len(L), 1)
+        registry.notify(self._makeWhat(), executor='thread').wait(5)
+        self.failUnless(registry._executors['thread'] is executor)
+        registry.shutdown()
+        self.assertEqual(registry._executors, {})
+
+    def test_builtin_process_pool(self):
+        registry = self._makeOne()
+        registry.subscribe(len, 'abc')
+        notification = registry.notify(PicklableWhat('abcd'),
+                                       executor='process', max_workers=1)
+        try:
+            self.failUnless(notification.wait(30))
+            self.assertEqual(notification.futures[0].result(), 4)
+        finally:
+            registry.shutdown()
+
+    def test_process_pool_unpicklable(self):
+        class Executor(futures.ProcessPoolExecutor):
+            def submit(self, fn, *arg, **kw): # pragma: no cover
+                raise AssertionError('should not be called')
+        registry = self._makeOne()
+        registry.subscribe(lambda what: None, 'abc')
+        self.assertRaises(TypeError, registry.notify, PicklableWhat('a'),
+                          executor=Executor(1))
+
+if futures is None: # pragma: no cover
+    del TestRegistryNotifyExecutor
+
 class TestRegistryFunctional(unittest.TestCase):
     def _getTargetClass(self):
         from repoze.component import Registry
@@ -682,6 +1314,362 @@ class TestRegistryFunctional(unittest.TestCase):
         result = registry.resolve('foo', instance1, instance2)
         self.assertEqual(result, 'somevalue')
 
+    def test_register_invalidates_only_affected_lookups(self):
+        registry = self._makeRegistry()
+        look = registry.lookup
+        eq = self.assertEqual
+        eq(look('fight', 'barris', 'luckman'), 'barrisluckmanvalue')
+        eq(look('friend', 'luckman', name='name'), 'luckmanvalue')
+        eq(look('friend', 'barris', name='name', default=None), None)
+        registry.register('friend', 'barrisvalue', 'barris', name='name')
+        eq(registry._lkpcache.get(
+            ('fight', (('barris',), ('luckman',)), '',
+             ((None,), (None,)))), 'barrisluckmanvalue')
+        eq(registry._lkpcache.get(
+            ('friend', (('luckman',),), 'name', ((None,),))), 'luckmanvalue')
+        eq(registry._lkpcache.get(
+            ('friend', (('barris',),), 'name', ((None,),))), None)
+        eq(look('friend', 'barris', name='name'), 'barrisvalue')
+        registry.unregister('friend', 'barrisvalue', 'barris', name='name')
+        eq(look('friend', 'barris', name='name', default=None), None)
+
+    def test_register_invalidates_cached_all_lookups(self):
+        from repoze.component.registry import ALL
+        registry = self._makeRegistry()
+        result = registry.lookup('friend', 'luckman', name=ALL)
+        self.assertEqual(result, ['luckmanvalue'])
+        registry.register('friend', 'luckmanvalue2', 'luckman', name='two')
+        result = registry.lookup('friend', 'luckman', name=ALL)
+        self.assertEqual(result, ['luckmanvalue', 'luckmanvalue2'])
+
+    def test_mapping_mutation_invalidates_lookups(self):
+        registry = self._makeRegistry({'a':1})
+        self.assertEqual(registry.lookup('a'), 1)
+        del registry['a']
+        self.assertEqual(registry.lookup('a', default=None), None)
+        registry['a'] = 2
+        self.assertEqual(registry.lookup('a'), 2)
+        registry.clear()
+        self.assertEqual(registry.lookup('a', default=None), None)
+        self.assertEqual(registry.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+        registry.clear(full=True)
+        self.assertEqual(registry.lookup('fight', 'barris', 'luckman',
+                                         default=None), None)
+
+    def test_stats(self):
+        registry = self._makeRegistry()
+        look = registry.lookup
+        look('fight', 'barris', 'luckman')
+        look('fight', 'barris', 'luckman')
+        look('fight', 'deckard', 'luckman', default=None)
+        look('fight', 'deckard', 'luckman', default=None)
+        look('fight', 'barris', 'luckman', name='other', default=None)
+        stats = registry.stats()
+        self.assertEqual(stats['lookups'], 5)
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['notfound_hits'], 1)
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['invalidations'], 0)
+        self.assertEqual(stats['evictions'], 0)
+        # all three lookups share the same requires shape
+        self.assertEqual(stats['combination_hits'], 2)
+        self.assertEqual(stats['combination_misses'], 1)
+        self.assertEqual(stats['combination_evictions'], 0)
+        # 1 combination before the match, 4 for each failed lookup
+        self.assertEqual(stats['combinations_tried'], 9)
+        self.assertEqual(stats['average_combinations_tried'], 3.0)
+        registry.register('fight', 'deckardluckman', 'deckard', 'luckman')
+        self.assertEqual(registry.stats()['invalidations'], 1)
+        registry.clear(full=True)
+        self.assertEqual(registry.stats()['invalidations'], 3)
+        registry.reset_stats()
+        stats = registry.stats()
+        self.assertEqual(stats['lookups'], 0)
+        self.assertEqual(stats['invalidations'], 0)
+        self.assertEqual(stats['average_combinations_tried'], 0.0)
+
+    def test_batch(self):
+        registry = self._makeRegistry()
+        look = registry.lookup
+        self.assertEqual(look('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+        with registry.batch():
+            registry.register('fight', 'other', 'barris', 'luckman')
+            self.assertEqual(look('fight', 'barris', 'luckman'), 'other')
+            registry.register('fight', 'third', 'barris', 'luckman')
+            self.assertEqual(look('fight', 'barris', 'luckman'), 'third')
+            registry.unregister('fight', 'third', 'barris', 'luckman')
+            self.assertEqual(look('fight', 'barris', 'luckman',
+                                  default=None), None)
+            registry.subscribe('subscriber', 'luckman')
+        self.assertEqual(look('fight', 'barris', 'luckman', default=None),
+                         None)
+        registry.register('fight', 'fourth', 'barris', 'luckman')
+        self.assertEqual(look('fight', 'barris', 'luckman'), 'fourth')
+        self.assertEqual(look('friend', 'luckman', name='name'),
+                         'luckmanvalue')
+
+    def test_batch_nested(self):
+        registry = self._makeOne()
+        with registry.batch():
+            with registry.batch():
+                registry.register('p', 'one', 'a')
+            registry.register('p', 'two', 'b')
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        self.assertEqual(registry.lookup('p', 'b'), 'two')
+        registry.register('p', 'three', 'a')
+        self.assertEqual(registry.lookup('p', 'a'), 'three')
+
+    def test_batch_exception(self):
+        registry = self._makeOne()
+        def fail():
+            with registry.batch():
+                registry.register('p', 'one', 'a')
+                raise ValueError
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        registry.register('p', 'two', 'a')
+        self.assertEqual(registry.lookup('p', 'a'), 'two')
+
+    def test_register_many(self):
+        from repoze.component.registry import ALL
+        registry = self._makeRegistry()
+        self.assertEqual(registry.lookup('p', 'a', default=None), None)
+        registry.register_many([('p', 'one', ('a',)),
+                                ('p', 'two', ('a',), 'two'),
+                                ('q', 'three', ())])
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        self.assertEqual(registry.lookup('p', 'a', name=ALL),
+                         ['one', 'two'])
+        self.assertEqual(registry['q'], 'three')
+        self.assertEqual(registry.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+
+    def test_settrace_lookup(self):
+        registry = self._makeRegistry()
+        traces = []
+        registry.settrace(traces.append)
+        self.assertEqual(registry.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+        registry.lookup('fight', 'barris', 'luckman')
+        self.assertRaises(LookupError, registry.lookup, 'fight', 'deckard',
+                          'luckman', name='other')
+        first, second, third = traces
+        self.assertEqual(first.method, 'lookup')
+        self.assertEqual(first.provides, 'fight')
+        self.assertEqual(first.name, '')
+        self.assertEqual(first.requires, (('barris',), ('luckman',)))
+        self.assertEqual(first.default_requires, ((None,), (None,)))
+        self.assertEqual(first.hit, False)
+        self.assertEqual(first.combinations, 1)
+        self.failUnless(first.elapsed >= 0)
+        self.assertEqual(first.combo, ('barris', 'luckman'))
+        self.assertEqual(second.hit, True)
+        self.assertEqual(second.combinations, 0)
+        self.assertEqual(second.combo, ('barris', 'luckman'))
+        self.assertEqual(third.name, 'other')
+        self.assertEqual(third.hit, False)
+        self.assertEqual(third.combo, None)
+        registry.settrace(None)
+        registry.lookup('fight', 'barris', 'luckman')
+        self.assertEqual(len(traces), 3)
+
+    def test_settrace_resolve(self):
+        registry = self._makeRegistry()
+        traces = []
+        registry.settrace(traces.append)
+        class Deckard(object):
+            __component_types__ = ('deckard',)
+        deckard = Deckard()
+        self.assertEqual(registry.resolve('bladerunner', 'abc', deckard),
+                         'deckardvalue')
+        trace, = traces
+        self.assertEqual(trace.method, 'resolve')
+        self.assertEqual(trace.requires, ((), ('deckard',)))
+        self.assertEqual(trace.default_requires, ((str, None),
+                                                  (Deckard, None)))
+        self.assertEqual(trace.combo, (None, 'deckard'))
+
+    def test_settrace_notify(self):
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        L = []
+        registry.subscribe(L.append, 'abc')
+        traces = []
+        registry.settrace(traces.append)
+        class What(object):
+            __component_types__ = ('abc',)
+        what = What()
+        registry.notify(what)
+        registry.notify(what)
+        self.assertEqual(L, [what, what])
+        first, second = traces
+        self.assertEqual(first.method, 'notify')
+        self.assertEqual(first.provides, _subscribers)
+        self.assertEqual(first.requires, (('abc',),))
+        self.assertEqual(first.hit, False)
+        self.assertEqual(first.combo, ('abc',))
+        self.assertEqual(second.hit, True)
+
+    def test_pickle(self):
+        import pickle
+        from repoze.component.registry import ALL
+        registry = self._makeRegistry({'a':1})
+        registry.register('friend', 'other', 'luckman', name='other')
+        registry.lookup('fight', 'barris', 'luckman')
+        for protocol in (0, 2):
+            loaded = pickle.loads(pickle.dumps(registry, protocol))
+            self.assertEqual(loaded.__class__, registry.__class__)
+            self.assertEqual(loaded.stats()['lookups'], 0)
+            self.failUnless(loaded == registry)
+            self.assertEqual(loaded['a'], 1)
+            self.assertEqual(loaded.lookup('fight', 'barris', 'luckman'),
+                             'barrisluckmanvalue')
+            self.assertEqual(loaded.lookup('friend', 'luckman', name=ALL),
+                             ['luckmanvalue', 'other'])
+            loaded.register('friend', 'third', 'luckman', name='third')
+            self.assertEqual(loaded.lookup('friend', 'luckman', name=ALL),
+                             ['luckmanvalue', 'other', 'third'])
+            self.assertEqual(registry.lookup('friend', 'luckman', name=ALL),
+                             ['luckmanvalue', 'other'])
+
+    def test_pickle_subscribers(self):
+        import pickle
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        registry.subscribe(len, 'deckard')
+        loaded = pickle.loads(pickle.dumps(registry, 2))
+        self.assertEqual(loaded.lookup(_subscribers, 'deckard'), [len])
+
+    def test_pickle_keeps_replaced_registrations_in_all(self):
+        import pickle
+        from repoze.component.registry import ALL
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.register('p', 'two', 'a')
+        loaded = pickle.loads(pickle.dumps(registry, 2))
+        self.assertEqual(loaded.lookup('p', 'a'), 'two')
+        self.assertEqual(loaded.lookup('p', 'a', name=ALL), ['one', 'two'])
+
+    def test_pickle_keeps_reregistered_components_in_all(self):
+        import pickle
+        from repoze.component.registry import ALL
+        registry = self._makeOne()
+        registry.register('p', 'c', name='x')
+        registry.register('p', 'c', name='x')
+        registry.register('q', 'a', name='x')
+        registry.register('q', 'b', name='y')
+        registry.register('q', 'a', name='x')
+        loaded = pickle.loads(pickle.dumps(registry, 2))
+        self.assertEqual(loaded.lookup('p', name=ALL), ['c', 'c'])
+        self.assertEqual(loaded.lookup('q', name=ALL), ['a', 'b', 'a'])
+        self.assertEqual(loaded.lookup('q', name='x'), 'a')
+        self.failUnless(loaded == registry)
+
+    def test_pickle_stores_only_registrations(self):
+        registry = self._makeRegistry({'a':1})
+        registry.lookup('fight', 'barris', 'luckman')
+        state = registry.__getstate__()
+        self.assertEqual(sorted(state.keys()),
+                         ['bases', 'combination_cache_size', 'compact',
+                          'indexed', 'listener_registered',
+                          'lookup_cache_size', 'registrations'])
+        self.assertEqual(sorted(state['registrations']),
+                         [((), 'a', ('', 1), None),
+                          ((None, 'deckard'), 'bladerunner',
+                           ('', 'deckardvalue'), None),
+                          (('barris', 'luckman'), 'fight',
+                           ('', 'barrisluckmanvalue'), None),
+                          (('luckman',), 'friend',
+                           ('name', 'luckmanvalue'), None)])
+
+    def test_copy_is_independent(self):
+        registry = self._makeRegistry({'a':1})
+        copy = registry.copy()
+        copy.register('p', 'one', 'a')
+        copy['b'] = 2
+        registry.unregister('fight', 'barrisluckmanvalue', 'barris',
+                            'luckman')
+        self.assertEqual(registry.lookup('p', 'a', default=None), None)
+        self.assertEqual(registry.get('b'), None)
+        self.assertEqual(copy.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+
+    def test_stats_evictions(self):
+        registry = self._getTargetClass()(lookup_cache_size=1,
+                                          combination_cache_size=1)
+        registry.lookup('a', 'b', default=None)
+        registry.lookup('a', ('b', 'c'), default=None)
+        registry.lookup('a', ('b', 'c', 'd'), default=None)
+        stats = registry.stats()
+        self.assertEqual(stats['evictions'], 2)
+        self.assertEqual(stats['combination_evictions'], 2)
+        registry.clear(full=True)
+        self.assertEqual(registry.stats()['evictions'], 2)
+        registry.reset_stats()
+        stats = registry.stats()
+        self.assertEqual(stats['evictions'], 0)
+        self.assertEqual(stats['combination_evictions'], 0)
+
+    def test_lookup_prefers_earliest_combination(self):
+        registry = self._makeOne()
+        registry.register('p', 'default', None, None)
+        registry.register('p', 'nonefirst', None, 'b')
+        registry.register('p', 'nonesecond', 'a', None)
+        registry.register('p', 'direct', 'z', 'b')
+        look = registry.lookup
+        self.assertEqual(look('p', 'a', 'b'), 'nonesecond')
+        self.assertEqual(look('p', 'c', 'b'), 'nonefirst')
+        self.assertEqual(look('p', 'c', 'c'), 'default')
+        self.assertEqual(look('p', ('a', 'z'), 'b'), 'direct')
+
+    def test_lookup_many(self):
+        registry = self._makeRegistry()
+        result = registry.lookup_many(
+            'fight', ['barris', ['inherits', 'barris'], 'deckard', 'barris'],
+            'luckman', default=None)
+        self.assertEqual(result, ['barrisluckmanvalue', 'barrisluckmanvalue',
+                                  None, 'barrisluckmanvalue'])
+        self.assertEqual(registry.stats()['lookups'], 3)
+
+    def test_lookup_many_named(self):
+        registry = self._makeRegistry()
+        result = registry.lookup_many('friend', ['luckman'], name='name')
+        self.assertEqual(result, ['luckmanvalue'])
+        self.assertRaises(LookupError, registry.lookup_many, 'friend',
+                          ['luckman'])
+
+    def test_resolve_many(self):
+        registry = self._makeRegistry()
+        deckard = Deckard(None)
+        provides(deckard, 'luckman')
+        objects = [Barris(None), Deckard(None), InheritsBarris(None),
+                   Barris(None), DeckardBarris, deckard, OSBarris(None)]
+        result = registry.resolve_many('fight', objects, Luckman(None),
+                                       default=None)
+        self.assertEqual(result, ['barrisluckmanvalue', None,
+                                  'barrisluckmanvalue', 'barrisluckmanvalue',
+                                  'barrisluckmanvalue', None,
+                                  'barrisluckmanvalue'])
+        self.assertEqual(registry.stats()['lookups'], 6)
+
+    def test_resolve_many_instance_types(self):
+        registry = self._makeRegistry()
+        deckard1 = Deckard(None)
+        deckard2 = Deckard(None)
+        provides(deckard2, 'luckman')
+        result = registry.resolve_many('friend', [deckard1, deckard2],
+                                       name='name', default=None)
+        self.assertEqual(result, [None, 'luckmanvalue'])
+
+    def test_resolve_many_no_dict(self):
+        registry = self._makeRegistry()
+        registry.register('length', 'strvalue', str)
+        result = registry.resolve_many('length', ['a', 'b', 1], default=None)
+        self.assertEqual(result, ['strvalue', 'strvalue', None])
+        self.assertEqual(registry.stats()['lookups'], 3)
+
     def test_lookup_2nd_time_returns_same(self):
         registry = self._makeOne()
         registry.register('foo', 'somevalue', 'a', 'b')
@@ -692,6 +1680,1189 @@ class TestRegistryFunctional(unittest.TestCase):
         result = registry.lookup('foo', 'a', 'b')
         self.assertEqual(result, 'somevalue')
 
+    def test_generation(self):
+        registry = self._makeRegistry()
+        generations = [registry.generation]
+        def changed():
+            self.failUnless(registry.generation > generations[-1])
+            generations.append(registry.generation)
+        registry.register('p', 'one', 'a')
+        changed()
+        registry.lookup('p', 'a')
+        self.assertEqual(registry.generation, generations[-1])
+        registry.unregister('p', 'one', 'a')
+        changed()
+        registry.subscribe('s', 'a')
+        changed()
+        registry.unsubscribe('s', 'a')
+        changed()
+        registry['a'] = 1
+        changed()
+        registry.clear()
+        changed()
+        registry.clear(full=True)
+        changed()
+
+    def test_observers(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _subscribers
+        registry = self._makeRegistry()
+        L = []
+        def observer(provides, name, requires):
+            L.append((provides, name, requires))
+        registry.add_observer(observer)
+        registry.register('p', 'one', 'a', name='n')
+        registry.subscribe('s', 'b')
+        registry['c'] = 1
+        registry.unregister('p', 'one', 'a', name='n')
+        self.assertEqual(L, [('p', 'n', ('a',)),
+                             (_subscribers, '', ('b',)),
+                             ('c', '', ()),
+                             ('p', 'n', ('a',))])
+        registry.clear(full=True)
+        self.assertEqual(L[-1], (ALL, ALL, ALL))
+        registry.remove_observer(observer)
+        registry.remove_observer(observer)
+        registry.register('p', 'two', 'a')
+        self.assertEqual(len(L), 5)
+
+    def test_observers_batch(self):
+        registry = self._makeOne()
+        L = []
+        registry.add_observer(lambda *arg: L.append(arg))
+        registry.register_many([('p', 'one', ('a',)), ('p', 'two', ('b',))])
+        self.assertEqual(L, [('p', '', ('a',)), ('p', '', ('b',))])
+
+    def test_lazy_lookup(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import Lazy
+        resolver = DummyResolver()
+        registry = self._makeOne()
+        registry.register('foo', Lazy('one', resolver), 'a')
+        registry.register('foo', Lazy('two', resolver), 'a', name='two')
+        self.assertEqual(resolver.resolved, [])
+        self.assertEqual(registry.lookup('foo', 'a'), 'ONE')
+        self.assertEqual(resolver.resolved, ['one'])
+        registry.register('bar', 'barvalue', 'a') # invalidates
+        self.assertEqual(registry.lookup('foo', 'a'), 'ONE')
+        self.assertEqual(registry.lookup('foo', 'a', name=ALL),
+                         ['ONE', 'TWO'])
+        self.assertEqual(resolver.resolved, ['one', 'two'])
+
+    def test_lazy_resolve(self):
+        from repoze.component.registry import Lazy
+        resolver = DummyResolver()
+        registry = self._makeOne()
+        registry.register('foo', Lazy('one', resolver), Deckard)
+        self.assertEqual(registry.resolve('foo', Deckard(None)), 'ONE')
+
+    def test_lazy_notify(self):
+        from repoze.component.registry import Lazy
+        L = []
+        resolver = DummyResolver({'append':L.append})
+        registry = self._makeOne()
+        registry.subscribe(L.append, 'deckard')
+        registry.subscribe(Lazy('append', resolver), 'deckard')
+        event = Deckard('a')
+        registry.notify(event)
+        self.assertEqual(L, [event, event])
+
+    def test_lazy_load_error(self):
+        from repoze.component.registry import Lazy
+        resolver = DummyResolver({})
+        registry = self._makeOne()
+        registry.register('foo', Lazy('one', resolver), 'a')
+        self.assertRaises(KeyError, registry.lookup, 'foo', 'a')
+        resolver.objects['one'] = 1
+        self.assertEqual(registry.lookup('foo', 'a'), 1)
+
+    def test_lazy_mapping(self):
+        from repoze.component.registry import Lazy
+        registry = self._makeOne()
+        registry['a'] = Lazy('one', DummyResolver())
+        self.assertEqual(registry['a'], 'ONE')
+        self.assertEqual(registry.values(), ['ONE'])
+        self.assertEqual(registry.items(), [('a', 'ONE')])
+
+    def test_lazy_unregister_loaded(self):
+        from repoze.component.registry import Lazy
+        registry = self._makeOne()
+        registry['a'] = Lazy('one', DummyResolver())
+        registry.register('foo', Lazy('two', DummyResolver()), 'a')
+        self.assertRaises(ValueError, registry.unregister, 'a', 'other')
+        registry.unregister('a', registry['a'])
+        registry.unregister('foo', registry.lookup('foo', 'a'), 'a')
+        self.assertEqual(registry.get('a'), None)
+        self.assertEqual(registry.lookup('foo', 'a', default=None), None)
+
+    def test_lazy_unsubscribe_loaded(self):
+        from repoze.component.registry import Lazy
+        L = []
+        def subscriber(event):
+            L.append(event)
+        resolver = DummyResolver({'subscriber':subscriber})
+        registry = self._makeOne()
+        registry.subscribe(L.append, 'deckard')
+        registry.subscribe(Lazy('subscriber', resolver), 'deckard')
+        event = Deckard('a')
+        registry.notify(event)
+        registry.unsubscribe(subscriber, 'deckard')
+        registry.notify(event)
+        self.assertEqual(L, [event, event, event])
+        registry.unsubscribe(L.append, 'deckard')
+        registry.notify(event)
+        self.assertEqual(len(L), 3)
+
+    def test_load_lazy(self):
+        from repoze.component.registry import Lazy
+        resolver = DummyResolver()
+        registry = self._makeRegistry()
+        registry.register('foo', Lazy('one', resolver), 'a')
+        registry.subscribe(Lazy('two', resolver), 'a')
+        registry.load_lazy()
+        self.assertEqual(sorted(resolver.resolved), ['one', 'two'])
+        registry.load_lazy()
+        self.assertEqual(len(resolver.resolved), 2)
+
+    def test_load_lazy_error(self):
+        from repoze.component.registry import Lazy
+        registry = self._makeOne()
+        registry.register('foo', Lazy('one', DummyResolver({})), 'a')
+        self.assertRaises(KeyError, registry.load_lazy)
+
+class TestRegistryBases(unittest.TestCase):
+    def _makeOne(self, *bases, **kw):
+        from repoze.component import Registry
+        return Registry(bases=bases, **kw)
+
+    def _makeBase(self):
+        from repoze.component import Registry
+        base = Registry({'a':1})
+        base.register('view', 'baseview', 'deckard')
+        base.register('view', 'basenamed', 'deckard', name='named')
+        return base
+
+    def test_lookup_in_base(self):
+        overlay = self._makeOne(self._makeBase())
+        self.assertEqual(overlay.lookup('view', 'deckard'), 'baseview')
+        self.assertEqual(overlay.lookup('view', 'deckard', name='named'),
+                         'basenamed')
+        self.assertEqual(overlay.lookup('view', 'luckman', default=None),
+                         None)
+        self.assertRaises(LookupError, overlay.lookup, 'view', 'luckman')
+
+    def test_resolve_in_base(self):
+        overlay = self._makeOne(self._makeBase())
+        self.assertEqual(overlay.resolve('view', Deckard(None)), 'baseview')
+
+    def test_overrides_base(self):
+        base = self._makeBase()
+        overlay = self._makeOne(base)
+        overlay.register('view', 'overlayview', 'deckard')
+        self.assertEqual(overlay.lookup('view', 'deckard'), 'overlayview')
+        self.assertEqual(overlay.lookup('view', 'deckard', name='named'),
+                         'basenamed')
+        self.assertEqual(base.lookup('view', 'deckard'), 'baseview')
+
+    def test_bases_in_order(self):
+        from repoze.component import Registry
+        first = Registry()
+        first.register('view', 'firstview', 'deckard')
+        overlay = self._makeOne(first, self._makeBase())
+        self.assertEqual(overlay.lookup('view', 'deckard'), 'firstview')
+        self.assertEqual(overlay.lookup('view', 'deckard', name='named'),
+                         'basenamed')
+
+    def test_base_changed(self):
+        base = self._makeBase()
+        overlay = self._makeOne(base)
+        self.assertEqual(overlay.lookup('view', 'luckman', default=None),
+                         None)
+        self.assertEqual(overlay.lookup('view', 'deckard'), 'baseview')
+        base.register('view', 'luckmanview', 'luckman')
+        self.assertEqual(overlay.lookup('view', 'luckman'), 'luckmanview')
+        base.unregister('view', 'baseview', 'deckard')
+        self.assertEqual(overlay.lookup('view', 'deckard', default=None),
+                         None)
+        self.assertEqual(overlay.stats()['hits'], 0)
+
+    def test_base_unchanged_uses_cache(self):
+        overlay = self._makeOne(self._makeBase())
+        overlay.lookup('view', 'deckard')
+        overlay.lookup('view', 'deckard')
+        self.assertEqual(overlay.stats()['hits'], 1)
+
+    def test_base_of_base_changed(self):
+        base = self._makeBase()
+        middle = self._makeOne(base)
+        overlay = self._makeOne(middle)
+        self.assertEqual(overlay.lookup('view', 'luckman', default=None),
+                         None)
+        base.register('view', 'luckmanview', 'luckman')
+        self.assertEqual(overlay.lookup('view', 'luckman'), 'luckmanview')
+
+    def test_base_changed_generation(self):
+        base = self._makeBase()
+        overlay = self._makeOne(base)
+        generation = overlay.generation
+        self.assertEqual(overlay.generation, generation)
+        base.register('view', 'luckmanview', 'luckman')
+        self.failUnless(overlay.generation > generation)
+
+    def test_base_cleared(self):
+        base = self._makeBase()
+        overlay = self._makeOne(base)
+        overlay.lookup('view', 'deckard')
+        base.clear(full=True)
+        self.assertEqual(overlay.lookup('view', 'deckard', default=None),
+                         None)
+
+    def test_notify(self):
+        from repoze.component import Registry
+        L = []
+        base = Registry()
+        base.subscribe(lambda event: L.append('base'), 'deckard')
+        overlay = self._makeOne(base)
+        overlay.subscribe(lambda event: L.append('overlay'), 'deckard')
+        overlay.notify(Deckard(None))
+        self.assertEqual(L, ['overlay', 'base'])
+        base.subscribe(lambda event: L.append('base2'), 'deckard')
+        overlay.notify(Deckard(None))
+        self.assertEqual(L, ['overlay', 'base', 'overlay', 'base', 'base2'])
+
+    def test_notify_only_base_subscribers(self):
+        from repoze.component import Registry
+        L = []
+        base = Registry()
+        overlay = self._makeOne(base)
+        overlay.notify(Deckard(None))
+        base.subscribe(L.append, 'deckard')
+        event = Deckard(None)
+        overlay.notify(event)
+        self.assertEqual(L, [event])
+
+    def test_mapping_is_local(self):
+        overlay = self._makeOne(self._makeBase(), b=2)
+        self.assertEqual(overlay.keys(), ['b'])
+        self.assertRaises(KeyError, overlay.__getitem__, 'a')
+
+    def test_freeze(self):
+        base = self._makeBase()
+        overlay = self._makeOne(base)
+        frozen = overlay.freeze()
+        base.register('view', 'luckmanview', 'luckman')
+        self.assertEqual(frozen.lookup('view', 'deckard'), 'baseview')
+        self.assertEqual(frozen.lookup('view', 'luckman', default=None),
+                         None)
+
+    def test_concurrent_base(self):
+        from repoze.component import ConcurrentRegistry
+        L = []
+        base = ConcurrentRegistry()
+        base.register('view', 'baseview', 'deckard')
+        overlay = self._makeOne(base)
+        self.assertEqual(overlay.lookup('view', 'deckard'), 'baseview')
+        self.assertEqual(overlay.lookup('view', 'luckman', default=None),
+                         None)
+        base.register('view', 'luckmanview', 'luckman')
+        base.subscribe(L.append, 'deckard')
+        self.assertEqual(overlay.lookup('view', 'luckman'), 'luckmanview')
+        event = Deckard(None)
+        overlay.notify(event)
+        self.assertEqual(L, [event])
+
+    def test_concurrent_overlay(self):
+        from repoze.component import ConcurrentRegistry
+        from repoze.component import Registry
+        L = []
+        base = Registry()
+        base.register('p', 'old')
+        overlay = ConcurrentRegistry(bases=[base])
+        self.assertEqual(overlay.lookup('p'), 'old')
+        generation = overlay.generation
+        base.register('p', 'new')
+        self.assertEqual(overlay.lookup('p'), 'new')
+        self.failUnless(overlay.generation > generation)
+        base.register('p', 'newer')
+        overlay.register('q', 'value')
+        self.assertEqual(overlay.lookup('p'), 'newer')
+        self.assertEqual(overlay.lookup('q'), 'value')
+        base.subscribe(L.append, 'deckard')
+        event = Deckard(None)
+        overlay.notify(event)
+        self.assertEqual(L, [event])
+
+    def test_concurrent_overlay_of_concurrent_base(self):
+        from repoze.component import ConcurrentRegistry
+        base = ConcurrentRegistry()
+        base.register('p', 'old')
+        overlay = ConcurrentRegistry(bases=[base])
+        snapshot = overlay.freeze()
+        self.assertEqual(overlay.lookup('p'), 'old')
+        self.failUnless(overlay.freeze() is snapshot)
+        base.register('p', 'new')
+        self.assertEqual(overlay.lookup('p'), 'new')
+        self.failIf(overlay.freeze() is snapshot)
+        self.assertEqual(snapshot.lookup('p'), 'old')
+
+    def test_pickle(self):
+        import pickle
+        overlay = self._makeOne(self._makeBase())
+        overlay.register('view', 'overlayview', 'luckman')
+        loaded = pickle.loads(pickle.dumps(overlay, 2))
+        self.assertEqual(loaded.lookup('view', 'deckard'), 'baseview')
+        self.assertEqual(loaded.lookup('view', 'luckman'), 'overlayview')
+        loaded._bases[0].register('view', 'other', 'barris')
+        self.assertEqual(loaded.lookup('view', 'barris'), 'other')
+
+class TestLazy(unittest.TestCase):
+    def _getTargetClass(self):
+        from repoze.component.registry import Lazy
+        return Lazy
+
+    def _makeOne(self, dottedname, resolve=None):
+        return self._getTargetClass()(dottedname, resolve)
+
+    def test_load_dotted(self):
+        from repoze.component.registry import Registry
+        lazy = self._makeOne('repoze.component.registry.Registry')
+        self.failUnless(lazy.load() is Registry)
+
+    def test_load_colon(self):
+        from repoze.component.registry import Registry
+        lazy = self._makeOne('repoze.component.registry:Registry.register')
+        self.assertEqual(lazy.load(), Registry.register)
+
+    def test_load_once(self):
+        resolver = DummyResolver()
+        lazy = self._makeOne('one', resolver)
+        self.assertEqual(lazy.load(), 'ONE')
+        self.assertEqual(lazy.load(), 'ONE')
+        self.assertEqual(resolver.resolved, ['one'])
+
+    def test_repr(self):
+        lazy = self._makeOne('a.b')
+        self.assertEqual(repr(lazy), '<Lazy a.b>')
+
+    def test_pickle(self):
+        import pickle
+        from repoze.component import Registry
+        from repoze.component.registry import Lazy
+        registry = Registry()
+        registry.register('foo', Lazy('repoze.component.registry.ALL'), 'a')
+        registry = pickle.loads(pickle.dumps(registry))
+        from repoze.component.registry import ALL
+        self.failUnless(registry.lookup('foo', 'a') is ALL)
+
+    def test_pickle_bound_resolver(self):
+        import pickle
+        from repoze.component import ConcurrentRegistry
+        from repoze.component import Registry
+        from repoze.component.registry import _subscribers
+        class Declaration(object):
+            # like a configuration declaration, which can't be pickled
+            def resolve(self, dottedname):
+                return Deckard
+            def __reduce__(self):
+                raise pickle.PicklingError('not picklable')
+        for factory in (Registry, ConcurrentRegistry):
+            registry = factory()
+            lazy = self._makeOne('.Deckard', Declaration().resolve)
+            registry.register('foo', lazy, 'a')
+            registry.subscribe(lazy, 'b')
+            loaded = pickle.loads(pickle.dumps(registry, 2))
+            self.failUnless(loaded.lookup('foo', 'a') is Deckard)
+            self.assertEqual(loaded.lookup(_subscribers, 'b'), [Deckard])
+
+    def test_reduce_keeps_resolver_without_dotted_name(self):
+        resolver = DummyResolver()
+        lazy = self._makeOne('one', resolver)
+        self.assertEqual(lazy.__reduce__()[1], ('one', resolver))
+
+class TestMakeCache(unittest.TestCase):
+    def _callFUT(self, size):
+        from repoze.component.registry import makecache
+        return makecache(size)
+
+    def test_sized(self):
+        from repoze.lru import LRUCache
+        cache = self._callFUT(10)
+        self.assertEqual(cache.__class__, LRUCache)
+        self.assertEqual(cache.size, 10)
+
+    def test_negative(self):
+        self.assertRaises(ValueError, self._callFUT, -1)
+
+    def test_unbounded(self):
+        cache = self._callFUT(None)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        cache.invalidate('a')
+        cache.invalidate('a')
+        self.assertEqual(cache.get('a'), None)
+        cache.put('b', 2)
+        cache.clear()
+        self.assertEqual(cache.get('b', 3), 3)
+
+    def test_disabled(self):
+        cache = self._callFUT(0)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('a', 2), 2)
+        cache.invalidate('a')
+        cache.clear()
+
+class TestRegistryFunctionalIndexed(TestRegistryFunctional):
+    def _makeOne(self, dict=None):
+        return self._getTargetClass()(dict, indexed=True)
+
+    def test_pickle_rebuilds_index_lazily(self):
+        import pickle
+        registry = self._makeRegistry()
+        loaded = pickle.loads(pickle.dumps(registry, 2))
+        self.assertEqual(loaded._regindex, None)
+        loaded.register('p', 'one', 'a')
+        self.assertEqual(loaded._regindex, None)
+        self.assertEqual(loaded.lookup('p', 'a'), 'one')
+        self.assertEqual(loaded._regindex[('p', '', 1)], [{'a':set([('a',)])}])
+        self.assertEqual(loaded.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+
+    def test_stats(self):
+        registry = self._makeRegistry()
+        look = registry.lookup
+        look('fight', 'barris', 'luckman')
+        look('fight', 'deckard', 'luckman', default=None)
+        look('fight', ('deckard', 'barris'), 'luckman')
+        stats = registry.stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['combination_hits'], 0)
+        self.assertEqual(stats['combination_misses'], 0)
+        self.assertEqual(stats['combinations_tried'], 2)
+
+    def test_unregister_removes_from_index(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a', name='one')
+        registry.register('p', 'two', 'a', name='two')
+        registry.unregister('p', 'one', 'a', name='one')
+        self.assertEqual(registry._regindex[('p', 'one', 1)], [{}])
+        self.assertEqual(registry.lookup('p', 'a', name='one', default=None),
+                         None)
+        self.assertEqual(registry.lookup('p', 'a', name='two'), 'two')
+        registry.unregister('p', 'two', 'a', name='two')
+        self.assertEqual(registry._regindex[('p', 'two', 1)], [{}])
+        self.assertEqual(registry.lookup('p', 'a', name='two', default=None),
+                         None)
+
+    def test_unregister_all_removes_from_index(self):
+        from repoze.component.registry import ALL
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a', name='one')
+        registry.unregister('p', None, 'a', name=ALL)
+        self.assertEqual(registry._regindex[('p', 'one', 1)], [{}])
+        self.assertEqual(registry._regindex[('p', ALL, 1)], [{}])
+        self.assertEqual(registry.lookup('p', 'a', name=ALL, default=None),
+                         None)
+
+    def test_unregister_nonindexed_registration(self):
+        registry = self._makeOne()
+        registry.data[('a',)] = {('p', ''):'one'}
+        registry._unindex('p', '', ('a',))
+        self.assertEqual(registry._regindex, {})
+        registry.register('p', 'two', 'b')
+        registry._unindex('p', '', ('a',))
+        self.assertEqual(registry._regindex[('p', '', 1)], [{'b':set([('b',)])}])
+
+class TestFrozenRegistry(unittest.TestCase):
+    def _makeOne(self, **kw):
+        from repoze.component import Registry
+        registry = Registry({'a':1}, **kw)
+        registry.register('bladerunner', 'deckardvalue' , None, 'deckard')
+        registry.register('friend', 'luckmanvalue', 'luckman', name='name')
+        registry.register('fight', 'barrisluckmanvalue', 'barris', 'luckman')
+        return registry.freeze()
+
+    def test_class(self):
+        from repoze.component.registry import FrozenRegistry
+        frozen = self._makeOne()
+        self.assertEqual(frozen.__class__, FrozenRegistry)
+
+    def test_subscribers_not_shared(self):
+        from repoze.component import Registry
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _subscribers
+        registry = Registry()
+        registry.subscribe('one', 'a')
+        frozen = registry.freeze()
+        registry.subscribe('two', 'a')
+        self.assertEqual(frozen.lookup(_subscribers, 'a'), ['one'])
+        self.assertEqual(frozen.lookup(_subscribers, 'a', name=ALL),
+                         [['one']])
+        self.assertEqual(registry.lookup(_subscribers, 'a'), ['one', 'two'])
+
+    def test_settrace(self):
+        frozen = self._makeOne()
+        traces = []
+        frozen.settrace(traces.append)
+        frozen.lookup('bladerunner', 'abc', 'deckard')
+        frozen.lookup('fight', 'deckard', default=None)
+        self.assertEqual(traces[0].combo, (None, 'deckard'))
+        self.assertEqual(traces[0].combinations, 3)
+        self.assertEqual(traces[1].combo, None)
+
+    def test_pickle(self):
+        import pickle
+        frozen = self._makeOne(lookup_cache_size=5)
+        frozen.lookup('fight', 'barris', 'luckman')
+        loaded = pickle.loads(pickle.dumps(frozen, 2))
+        self.assertEqual(loaded.__class__, frozen.__class__)
+        self.failUnless(loaded == frozen)
+        self.assertEqual(loaded._lkpcache, {})
+        self.assertEqual(loaded._lkpcachesize, 5)
+        self.assertEqual(loaded.lookup('fight', 'barris', 'luckman'),
+                         'barrisluckmanvalue')
+        self.assertRaises(TypeError, loaded.register, 'a', 'b')
+        self.failUnless(frozen.freeze() is frozen)
+
+    def test_copy(self):
+        frozen = self._makeOne()
+        self.failUnless(frozen.copy() is frozen)
+
+    def test_lookup(self):
+        frozen = self._makeOne()
+        look = frozen.lookup
+        eq = self.assertEqual
+        eq(look('bladerunner', None, 'deckard'), 'deckardvalue')
+        eq(look('bladerunner', None, ['inherits', 'deckard']), 'deckardvalue')
+        eq(look('friend', 'luckman', name='name'), 'luckmanvalue')
+        eq(look('fight', ('deckard', 'barris'), 'luckman'),
+           'barrisluckmanvalue')
+        eq(look('bladerunner', 'luckman', 'deckard'), 'deckardvalue')
+        eq(look('friend', 'luckman', default=None), None)
+        eq(look('nothing', 'luckman', default=None), None)
+        eq(look('a'), 1)
+        self.assertRaises(LookupError, look, 'fight', 'barris', 'barris')
+        # cached
+        eq(look('fight', ('deckard', 'barris'), 'luckman'),
+           'barrisluckmanvalue')
+        eq(look('friend', 'luckman', default=None), None)
+        stats = frozen.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['notfound_hits'], 1)
+        self.assertEqual(stats['misses'], 9)
+
+    def test_lookup_all(self):
+        from repoze.component.registry import ALL
+        frozen = self._makeOne()
+        result = frozen.lookup('friend', 'luckman', name=ALL)
+        self.assertEqual(result, ['luckmanvalue'])
+
+    def test_resolve(self):
+        frozen = self._makeOne()
+        self.assertEqual(frozen.resolve('fight', DeckardBarris, Luckman),
+                         'barrisluckmanvalue')
+        self.assertEqual(frozen.resolve('bladerunner', None, Deckard(None)),
+                         'deckardvalue')
+
+    def test_notify(self):
+        from repoze.component import Registry
+        L = []
+        registry = Registry()
+        registry.subscribe(L.append, 'deckard')
+        frozen = registry.freeze()
+        frozen.notify(Deckard(None))
+        self.assertEqual(len(L), 1)
+
+    def test_mapping(self):
+        frozen = self._makeOne()
+        self.assertEqual(frozen['a'], 1)
+        self.assertEqual(frozen.keys(), ['a'])
+        self.assertEqual(len(frozen), 1)
+        self.failUnless('a' in frozen)
+
+    def test_snapshot_independent(self):
+        from repoze.component import Registry
+        registry = Registry()
+        registry.register('friend', 'luckmanvalue', 'luckman')
+        frozen = registry.freeze()
+        registry.register('friend', 'other', 'luckman')
+        registry.register('other', 'other')
+        self.assertEqual(frozen.lookup('friend', 'luckman'), 'luckmanvalue')
+        self.assertEqual(frozen.lookup('other', default=None), None)
+
+    def test_mutation_raises(self):
+        frozen = self._makeOne()
+        self.assertRaises(TypeError, frozen.register, 'a', 'b')
+        self.assertRaises(TypeError, frozen.unregister, 'a', 1)
+        self.assertRaises(TypeError, frozen.subscribe, None)
+        self.assertRaises(TypeError, frozen.unsubscribe, None)
+        self.assertRaises(TypeError, frozen.__setitem__, 'a', 2)
+        self.assertRaises(TypeError, frozen.__delitem__, 'a')
+        self.assertRaises(TypeError, frozen.clear)
+        self.assertRaises(TypeError, frozen.update, {})
+        self.assertRaises(TypeError, frozen.setdefault, 'a')
+        self.assertRaises(TypeError, frozen.pop, 'a')
+        self.assertRaises(TypeError, frozen.popitem)
+        self.assertEqual(frozen['a'], 1)
+
+    def test_cache_emptied_at_size(self):
+        frozen = self._makeOne(lookup_cache_size=2)
+        frozen.lookup('a')
+        frozen.lookup('friend', 'luckman', name='name')
+        frozen.lookup('bladerunner', None, 'deckard')
+        self.assertEqual(len(frozen._lkpcache), 1)
+        self.assertEqual(frozen.stats()['evictions'], 2)
+
+    def test_cache_disabled(self):
+        frozen = self._makeOne(lookup_cache_size=0)
+        self.assertEqual(frozen.lookup('a'), 1)
+        self.assertEqual(frozen.lookup('a'), 1)
+        self.assertEqual(frozen._lkpcache, {})
+
+    def test_cache_unbounded(self):
+        frozen = self._makeOne(lookup_cache_size=None)
+        frozen.lookup('a')
+        frozen.lookup('friend', 'luckman', name='name')
+        self.assertEqual(len(frozen._lkpcache), 2)
+
+class TestRegistryFunctionalCompact(TestRegistryFunctional):
+    def _makeOne(self, dict=None):
+        return self._getTargetClass()(dict, compact=True)
+
+    def test_registrations_are_compact(self):
+        from repoze.component.registry import _Registrations
+        registry = self._makeRegistry()
+        for info in registry.data.values():
+            self.assertEqual(info.__class__, _Registrations)
+            self.assertEqual(info.all, None)
+
+    def test_pickle_keeps_compact(self):
+        import pickle
+        from repoze.component.registry import _Registrations
+        registry = self._makeRegistry()
+        loaded = pickle.loads(pickle.dumps(registry, 2))
+        self.assertEqual(loaded._compact, True)
+        self.assertEqual(loaded.data[('luckman',)].__class__, _Registrations)
+        self.failUnless(loaded == registry)
+
+    def test_equals_uncompact(self):
+        registry = self._makeRegistry()
+        other = self._getTargetClass()()
+        other.register('bladerunner', 'deckardvalue' , None, 'deckard')
+        other.register('friend', 'luckmanvalue', 'luckman', name='name')
+        other.register('fight', 'barrisluckmanvalue', 'barris', 'luckman')
+        self.failUnless(registry == other)
+        self.failUnless(other == registry)
+
+    def test_many_registrations_use_dict(self):
+        from repoze.component.registry import ALL
+        from repoze.component.registry import _compactlimit
+        registry = self._makeOne()
+        names = [ 'utility%d' % i for i in range(_compactlimit + 1) ]
+        for name in names[:-1]:
+            registry.register('p', name, name=name)
+        self.failIf(isinstance(registry.data[()], dict))
+        registry.register('p', names[-1], name=names[-1])
+        info = registry.data[()]
+        self.failUnless(isinstance(info, dict))
+        self.assertEqual(info[('p', ALL)], names)
+        self.assertEqual(registry.lookup('p', name=names[0]), names[0])
+        registry.unregister('p', names[0], name=names[0])
+        self.assertEqual(registry.lookup('p', name=ALL), names[1:])
+
+    def test_pickle_many_registrations(self):
+        import pickle
+        from repoze.component.registry import _Registrations
+        from repoze.component.registry import _compactlimit
+        registry = self._makeRegistry()
+        for i in range(_compactlimit + 1):
+            registry.register('p', i, name=str(i))
+        loaded = pickle.loads(pickle.dumps(registry, 2))
+        self.failUnless(isinstance(loaded.data[()], dict))
+        self.assertEqual(loaded.data[('luckman',)].__class__, _Registrations)
+        self.failUnless(loaded == registry)
+
+class TestRegistrations(unittest.TestCase):
+    def _getTargetClass(self):
+        from repoze.component.registry import _Registrations
+        return _Registrations
+
+    def _makeOne(self, info=None):
+        return self._getTargetClass()(info)
+
+    def test_add(self):
+        from repoze.component.registry import ALL
+        info = self._makeOne()
+        info.add('p', '', 'one')
+        info.add('p', 'name', 'two')
+        info.add('q', '', 'three')
+        self.assertEqual(info.entries, ('p', '', 'one', 'p', 'name', 'two',
+                                        'q', '', 'three'))
+        self.assertEqual(info.all, None)
+        self.assertEqual(info[('p', '')], 'one')
+        self.assertEqual(info[('p', ALL)], ['one', 'two'])
+        self.assertEqual(info[('q', ALL)], ['three'])
+        self.assertEqual(info.get(('q', 'name')), None)
+        self.assertRaises(KeyError, info.__getitem__, ('r', ALL))
+        self.failUnless(('p', 'name') in info)
+        self.failIf(('q', 'name') in info)
+        self.assertEqual(len(info), 5)
+        self.assertEqual(sorted(info.keys()),
+                         sorted([('p', ''), ('p', 'name'), ('q', ''),
+                                 ('p', ALL), ('q', ALL)]))
+
+    def test_replace(self):
+        from repoze.component.registry import ALL
+        info = self._makeOne()
+        info.add('p', '', 'one')
+        info.add('p', '', 'two')
+        self.assertEqual(info.entries, ('p', '', 'two'))
+        self.assertEqual(info.all, ('p', 'one', 'p', 'two'))
+        self.assertEqual(info[('p', ALL)], ['one', 'two'])
+        info.remove('p', '', 'two')
+        self.assertEqual(info.entries, ())
+        self.assertEqual(info.all, ('p', 'one'))
+
+    def test_remove(self):
+        info = self._makeOne()
+        info.add('p', '', 'one')
+        info.add('p', 'name', 'two')
+        info.remove('p', '', 'one')
+        self.assertEqual(info.entries, ('p', 'name', 'two'))
+        self.assertEqual(info.all, None)
+        self.assertRaises(KeyError, info.remove, 'p', '', 'one')
+
+    def test_remove_not_registered(self):
+        info = self._makeOne()
+        info.add('p', '', 'one')
+        self.assertRaises(ValueError, info.remove, 'p', '', 'two')
+        self.assertEqual(info.entries, ('p', '', 'one'))
+        self.assertEqual(info[('p', '')], 'one')
+
+    def test_remove_prefers_identical(self):
+        from repoze.component.registry import ALL
+        first, second = [], []
+        info = self._makeOne()
+        info.add('p', 'a', first)
+        info.add('p', 'b', second)
+        info.remove('p', 'b', second)
+        self.failUnless(info[('p', ALL)][0] is first)
+
+    def test_from_dict(self):
+        from repoze.component.registry import ALL
+        info = self._makeOne({('p', ''):'one', ('p', ALL):['one']})
+        self.assertEqual(info.entries, ('p', '', 'one'))
+        self.assertEqual(info.all, None)
+        self.assertEqual(info, {('p', ''):'one', ('p', ALL):['one']})
+        self.assertNotEqual(info, {('p', ''):'one'})
+
+class TestConcurrentRegistryFunctional(TestRegistryFunctional):
+    def _getTargetClass(self):
+        from repoze.component import ConcurrentRegistry
+        return ConcurrentRegistry
+
+    def test_register_invalidates_only_affected_lookups(self):
+        registry = self._makeRegistry()
+        look = registry.lookup
+        eq = self.assertEqual
+        eq(look('fight', 'barris', 'luckman'), 'barrisluckmanvalue')
+        eq(look('friend', 'luckman', name='name'), 'luckmanvalue')
+        eq(look('friend', 'barris', name='name', default=None), None)
+        registry.register('friend', 'barrisvalue', 'barris', name='name')
+        cache = registry.freeze()._lkpcache
+        eq(cache.get(('fight', (('barris',), ('luckman',)), '',
+                      ((None,), (None,)))), 'barrisluckmanvalue')
+        eq(cache.get(('friend', (('luckman',),), 'name', ((None,),))),
+           'luckmanvalue')
+        eq(cache.get(('friend', (('barris',),), 'name', ((None,),))), None)
+        eq(look('friend', 'barris', name='name'), 'barrisvalue')
+        registry.unregister('friend', 'barrisvalue', 'barris', name='name')
+        eq(look('friend', 'barris', name='name', default=None), None)
+
+    def test_batch(self):
+        # changes made within a batch are seen when it ends
+        registry = self._makeRegistry()
+        look = registry.lookup
+        with registry.batch():
+            registry.register('fight', 'other', 'barris', 'luckman')
+            self.assertEqual(look('fight', 'barris', 'luckman'),
+                             'barrisluckmanvalue')
+            registry.unregister('fight', 'other', 'barris', 'luckman')
+            registry.subscribe('subscriber', 'luckman')
+        self.assertEqual(look('fight', 'barris', 'luckman', default=None),
+                         None)
+        registry.register('fight', 'fourth', 'barris', 'luckman')
+        self.assertEqual(look('fight', 'barris', 'luckman'), 'fourth')
+
+    def test_stats(self):
+        registry = self._makeRegistry()
+        look = registry.lookup
+        look('fight', 'barris', 'luckman')
+        look('fight', 'barris', 'luckman')
+        look('fight', 'deckard', 'luckman', default=None)
+        stats = registry.stats()
+        self.assertEqual(stats['lookups'], 3)
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+        # statistics belong to a snapshot
+        registry.register('fight', 'deckardluckman', 'deckard', 'luckman')
+        self.assertEqual(registry.stats()['lookups'], 0)
+        # the cached result which was unaffected was carried over
+        look('fight', 'barris', 'luckman')
+        self.assertEqual(registry.stats()['hits'], 1)
+        registry.reset_stats()
+        self.assertEqual(registry.stats()['hits'], 0)
+
+    def test_stats_evictions(self):
+        registry = self._getTargetClass()(lookup_cache_size=1)
+        registry.lookup('a', 'b', default=None)
+        registry.lookup('a', ('b', 'c'), default=None)
+        registry.lookup('a', ('b', 'c', 'd'), default=None)
+        # a snapshot empties its cache when it is full
+        self.assertEqual(len(registry.freeze()._lkpcache), 1)
+
+class TestConcurrentRegistry(unittest.TestCase):
+    def _getTargetClass(self):
+        from repoze.component import ConcurrentRegistry
+        return ConcurrentRegistry
+
+    def _makeOne(self, dict=None, **kw):
+        klass = self._getTargetClass()
+        return klass(dict, **kw)
+
+    def test_write_replaces_snapshot(self):
+        registry = self._makeOne({'a':1})
+        before = registry.freeze()
+        registry.register('p', 'one', 'a')
+        after = registry.freeze()
+        self.failIf(before is after)
+        self.assertEqual(before.lookup('p', 'a', default=None), None)
+        self.assertEqual(after.lookup('p', 'a'), 'one')
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        self.assertEqual(registry['a'], 1)
+
+    def test_read_does_not_replace_snapshot(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        before = registry.freeze()
+        registry.lookup('p', 'a')
+        registry.items()
+        self.failUnless(registry.freeze() is before)
+
+    def test_failed_write_publishes(self):
+        from repoze.component.registry import ALL
+        registry = self._makeOne()
+        before = registry.freeze()
+        self.assertRaises(ValueError, registry.register, 'p', 'one',
+                          name=ALL)
+        self.failIf(registry.freeze() is before)
+
+    def test_carries_over_unaffected_cache_entries(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.register('q', 'two', 'b')
+        registry.lookup('p', 'a')
+        registry.lookup('q', 'b')
+        registry.register('q', 'three', 'b')
+        cache = registry.freeze()._lkpcache
+        self.assertEqual(cache.get(('p', (('a',),), '', ((None,),))), 'one')
+        self.assertEqual(cache.get(('q', (('b',),), '', ((None,),))), None)
+        self.assertEqual(registry.lookup('q', 'b'), 'three')
+
+    def test_snapshot_shares_unchanged_registrations(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.register('p', 'two', 'b')
+        registry.register('q', 'three', 'c')
+        before = registry.freeze()
+        registry.register('p', 'four', 'b')
+        after = registry.freeze()
+        self.failUnless(after.data[('a',)] is before.data[('a',)])
+        self.failIf(after.data[('b',)] is before.data[('b',)])
+        self.failUnless(after._table[('q', '')] is before._table[('q', '')])
+        self.failIf(after._table[('p', '')] is before._table[('p', '')])
+        self.assertEqual(before._table[('p', '')],
+                         {('a',):'one', ('b',):'two'})
+        self.assertEqual(after._table[('p', '')],
+                         {('a',):'one', ('b',):'four'})
+        self.assertEqual(before.lookup('p', 'b'), 'two')
+        self.assertEqual(after.lookup('p', 'b'), 'four')
+
+    def test_snapshot_after_unregister(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.register('q', 'two', 'b')
+        before = registry.freeze()
+        registry.unregister('p', 'one', 'a')
+        after = registry.freeze()
+        self.failIf(('a',) in after.data)
+        self.failIf(('p', '') in after._table)
+        self.assertEqual(before.lookup('p', 'a'), 'one')
+        self.assertEqual(after.lookup('p', 'a', default=None), None)
+        self.assertEqual(after.lookup('q', 'b'), 'two')
+
+    def test_snapshot_subscribers_independent(self):
+        from repoze.component.registry import _subscribers
+        registry = self._makeOne()
+        registry.subscribe('one', 'a')
+        before = registry.freeze()
+        registry.subscribe('two', 'a')
+        after = registry.freeze()
+        self.assertEqual(before.data[('a',)][(_subscribers, '')], ['one'])
+        self.assertEqual(after.data[('a',)][(_subscribers, '')],
+                         ['one', 'two'])
+
+    def test_snapshot_reuses_unchanged_bases(self):
+        from repoze.component import Registry
+        base = Registry()
+        base.register('p', 'one', 'a')
+        registry = self._makeOne(bases=[base])
+        before = registry.freeze()
+        registry.register('q', 'two', 'b')
+        self.failUnless(registry.freeze()._bases[0] is before._bases[0])
+        base.register('p', 'three', 'a')
+        registry.register('q', 'four', 'b')
+        self.failIf(registry.freeze()._bases[0] is before._bases[0])
+        self.assertEqual(registry.lookup('p', 'a'), 'three')
+
+    def test_carries_over_unaffected_plans(self):
+        class A:
+            __component_types__ = ('a',)
+        class B:
+            __component_types__ = ('b',)
+        a, b = A(), B()
+        registry = self._makeOne()
+        L = []
+        registry.subscribe(L.append, 'a')
+        registry.subscribe(L.append, 'b')
+        registry.notify(a)
+        registry.notify(b)
+        self.assertEqual(len(registry.freeze()._plans), 2)
+        registry.unsubscribe(L.append, 'b')
+        plans = registry.freeze()._plans
+        self.assertEqual([ key[0] for key in plans ], [(('a',),)])
+        registry.notify(a)
+        registry.notify(b)
+        self.assertEqual(L, [a, b, a])
+
+    def test_full_clear_carries_nothing_over(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.lookup('p', 'a')
+        registry.clear(full=True)
+        self.assertEqual(len(registry.freeze()._lkpcache), 0)
+        self.assertEqual(registry.lookup('p', 'a', default=None), None)
+        registry.register('p', 'two', 'a')
+        self.assertEqual(registry.lookup('p', 'a'), 'two')
+
+    def test_mapping_writes(self):
+        registry = self._makeOne()
+        registry['a'] = 1
+        registry.update({'b':2})
+        self.assertEqual(registry.setdefault('c', 3), 3)
+        self.assertEqual(registry.pop('a'), 1)
+        del registry['b']
+        self.assertEqual(registry.items(), [('c', 3)])
+        self.assertEqual(registry.lookup('c'), 3)
+
+    def test_settrace_survives_writes(self):
+        registry = self._makeOne()
+        traces = []
+        registry.settrace(traces.append)
+        registry.register('p', 'one', 'a')
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        self.assertEqual(traces[0].combo, ('a',))
+        registry.settrace(None)
+        registry.register('p', 'two', 'a')
+        registry.lookup('p', 'a')
+        self.assertEqual(len(traces), 1)
+
+    def test_batch_publishes_once(self):
+        import threading
+        registry = self._makeOne()
+        registry.register('p', 'zero', 'z')
+        registry.lookup('p', 'z')
+        before = registry.freeze()
+        seen = []
+        with registry.batch():
+            registry.register('p', 'one', 'a')
+            registry.register('p', 'two', 'b')
+            self.failUnless(registry.freeze() is before)
+            # other threads are kept waiting until the batch is done
+            thread = threading.Thread(
+                target=lambda: registry.register('p', 'three', 'c'))
+            thread.start()
+            thread.join(0.05)
+            seen.append(registry.lookup('p', 'c', default=None))
+        thread.join()
+        self.assertEqual(seen, [None])
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+        self.assertEqual(registry.lookup('p', 'b'), 'two')
+        self.assertEqual(registry.lookup('p', 'c'), 'three')
+        # the unaffected cached lookup was carried over
+        self.assertEqual(
+            registry.freeze()._lkpcache.get(('p', (('z',),), '', ((None,),))),
+            'zero')
+
+    def test_fromkeys(self):
+        registry = self._getTargetClass().fromkeys(['a', 'b'], 1)
+        self.failUnless(isinstance(registry, self._getTargetClass()))
+        self.assertEqual(sorted(registry.items()), [('a', 1), ('b', 1)])
+
+    def test_listener_registered(self):
+        registry = self._makeOne()
+        self.assertEqual(registry.listener_registered, False)
+        registry.subscribe(lambda *arg: None, 'a')
+        self.assertEqual(registry.listener_registered, True)
+
+    def test_compares_with_registries(self):
+        from repoze.component import Registry
+        registry = self._makeOne({'a':1})
+        self.assertEqual(registry, {'a':1})
+        self.assertEqual(registry, Registry({'a':1}))
+        self.assertEqual(registry, self._makeOne({'a':1}))
+        self.assertNotEqual(registry, self._makeOne({'a':2}))
+
+    def test_copy_warm(self):
+        registry = self._makeOne()
+        registry.register('p', 'one', 'a')
+        registry.lookup('p', 'a')
+        copy = registry.copy(warm=True)
+        self.assertEqual(copy.lookup('p', 'a'), 'one')
+        self.assertEqual(copy.stats()['hits'], 1)
+        copy.register('p', 'two', 'a')
+        self.assertEqual(copy.lookup('p', 'a'), 'two')
+        self.assertEqual(registry.lookup('p', 'a'), 'one')
+
+    def test_copy_is_independent(self):
+        from repoze.component.registry import ALL
+        registry = self._makeOne(indexed=True)
+        registry.register('p', 'one', 'a')
+        registry.register('p', 'two', 'a', name='two')
+        copy = registry.copy()
+        copy.register('p', 'three', 'a', name='three')
+        registry.unregister('p', 'one', 'a')
+        self.assertEqual(copy.lookup('p', 'a'), 'one')
+        self.assertEqual(copy.lookup('p', 'a', name=ALL),
+                         ['one', 'two', 'three'])
+        self.assertEqual(registry.lookup('p', 'a', name=ALL),
+                         ['two'])
+        self.assertEqual(registry.lookup('p', 'a', name='three',
+                                         default=None), None)
+
+    def test_threads(self):
+        from repoze.component.registry import ALL
+        import threading
+        registry = self._makeOne()
+        registry.register('p', 'value', 'a')
+        errors = []
+        def read():
+            for i in range(200):
+                if registry.lookup('p', 'a') != 'value':
+                    errors.append(i)
+        def write():
+            for i in range(50):
+                registry.register('q', i, 'a', name=str(i))
+        threads = [ threading.Thread(target=read) for i in range(4) ]
+        threads.append(threading.Thread(target=write))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(registry.lookup('q', 'a', name=ALL)), 50)
+
+class TestCombinationTemplate(unittest.TestCase):
+    def _callFUT(self, args, default_list):
+        from repoze.component.registry import combination_template
+        from repoze.component.registry import requires_shape
+        from repoze.component.registry import flatten_requires
+        template = combination_template(requires_shape(args, default_list))
+        flat = flatten_requires(args, default_list)
+        return [ getter(flat) for getter in template ]
+
+    def _expected(self, args, default_list):
+        from repoze.component.registry import augmented_product
+        result = []
+        for combo in augmented_product(args, default_list):
+            if combo not in result:
+                result.append(combo)
+        return result
+
+    def test_withdefaults(self):
+        args = ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+        defaults = (('class1', None), ('class2', None), ('class3', None))
+        self.assertEqual(self._callFUT(args, defaults),
+                         self._expected(args, defaults))
+
+    def test_nodefaults(self):
+        args = ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+        self.assertEqual(self._callFUT(args, None),
+                         self._expected(args, None))
+
+    def test_one_position(self):
+        args = ((1, 2),)
+        defaults = (('class1', None),)
+        self.assertEqual(self._callFUT(args, defaults),
+                         [(1,), (2,), ('class1',), (None,)])
+
+    def test_no_positions(self):
+        self.assertEqual(self._callFUT((), ()), [()])
+
+    def test_same_shape_shares_template(self):
+        from repoze.component.registry import combination_template
+        from repoze.component.registry import requires_shape
+        shape1 = requires_shape((('a', 'b'),), ((1, None),))
+        shape2 = requires_shape((('c', 'd'),), ((2, None),))
+        self.assertEqual(shape1, shape2)
+        self.assertEqual(shape1, ((2,), (2,)))
+        self.assertEqual(len(combination_template(shape1)), 4)
+
+class TestCombinationPrecedence(unittest.TestCase):
+    def _callFUT(self, combo, args, default_list):
+        from repoze.component.registry import combination_precedence
+        return combination_precedence(combo, args, default_list)
+
+    def _assertOrdering(self, args, default_list):
+        from repoze.component.registry import augmented_product
+        order = {}
+        for combo in augmented_product(args, default_list):
+            order.setdefault(combo, len(order))
+        expected = sorted(order, key=order.get)
+        ranked = sorted(order, key=lambda combo: self._callFUT(
+            combo, args, default_list))
+        self.assertEqual(ranked, expected)
+
+    def test_withdefaults(self):
+        args = ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+        defaults = (('class1', None), ('class2', None), ('class3', None))
+        self._assertOrdering(args, defaults)
+
+    def test_overlapping_defaults(self):
+        args = (('a', None), ('b', 'a'))
+        defaults = (('a', None), (None, 'b'))
+        self._assertOrdering(args, defaults)
+
+    def test_nodefaults(self):
+        args = ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+        self._assertOrdering(args, None)
+
+    def test_noargs(self):
+        self.assertEqual(self._callFUT((), (), ()), (0, ()))
+
+    def test_empty_defaults(self):
+        self.assertEqual(self._callFUT((2,), ((1,),), ((),)), None)
+
+    def test_not_produced(self):
+        args = ((1, 2), (3, 4))
+        defaults = (('class1', None), ('class2', None))
+        self.assertEqual(self._callFUT((5, 3), args, defaults), None)
+        self.assertEqual(self._callFUT(('class1', 3), args, None), None)
+        self.assertEqual(self._callFUT((None, 'class2'), args, defaults),
+                         (3, (1, 0)))
+        self.assertEqual(self._callFUT(('class1', 'class2'), args, defaults),
+                         (3, (0, 0)))
+
 class TestSubscribers(unittest.TestCase):
     def _makeOne(self):
         from repoze.component.registry import Subscribers
@@ -705,6 +2876,13 @@ class TestSubscribers(unittest.TestCase):
         inst = self._makeOne()
         self.assertEqual(str(inst), '<subscriber>')
 
+    def test_pickle(self):
+        import pickle
+        from repoze.component.registry import _subscribers
+        for protocol in (0, 2):
+            loaded = pickle.loads(pickle.dumps(_subscribers, protocol))
+            self.failUnless(loaded is _subscribers)
+
 class TestProvidedBy(unittest.TestCase):
     def _callFUT(self, obj):
         from repoze.component import providedby
@@ -792,6 +2970,93 @@ class TestProvidedBy(unittest.TestCase):
         result = self._callFUT(None)
         self.assertEqual(list(result), [type(None), None])
 
+class TestTypeSignature(unittest.TestCase):
+    def setUp(self):
+        from repoze.component.registry import _signatures
+        _signatures.clear()
+
+    def _callFUT(self, obj):
+        from repoze.component.registry import typesignature
+        return typesignature(obj)
+
+    def test_instance_cached_per_class(self):
+        from repoze.component.registry import _signatures
+        class Foo(object):
+            provides('a', 'b')
+        result = self._callFUT(Foo())
+        self.assertEqual(result, (('a', 'b'), (Foo, None)))
+        self.failUnless(_signatures[Foo] is result)
+        self.failUnless(self._callFUT(Foo()) is result)
+
+    def test_oldstyle_instance(self):
+        class Foo:
+            provides('a')
+        result = self._callFUT(Foo())
+        self.assertEqual(result, (('a',), (Foo, None)))
+
+    def test_instance_with_own_types(self):
+        from repoze.component.registry import _signatures
+        class Foo(object):
+            provides('a')
+        foo = Foo()
+        provides(foo, 'b')
+        self.assertEqual(self._callFUT(foo), (('b', 'a'), (Foo, None)))
+        self.failIf(Foo in _signatures)
+        self.assertEqual(self._callFUT(Foo()), (('a',), (Foo, None)))
+
+    def test_class_types_class_attribute(self):
+        class Foo(object):
+            __component_types__ = ('a',)
+        self.assertEqual(self._callFUT(Foo()), (('a',), (Foo, None)))
+
+    def test_class(self):
+        from repoze.component.registry import _signatures
+        class Foo(object):
+            provides('a')
+        self.assertEqual(self._callFUT(Foo), (('a',), (type, None)))
+        self.assertEqual(_signatures, {})
+
+    def test_no_dict(self):
+        self.assertEqual(self._callFUT('abc'), ((), (str, None)))
+        self.assertEqual(self._callFUT(None), ((), (type(None), None)))
+
+    def test_slots(self):
+        from repoze.component.registry import _signatures
+        class Foo(object):
+            __slots__ = ('__component_types__',)
+        foo = Foo()
+        foo.__component_types__ = ('a',)
+        self.assertEqual(self._callFUT(foo), (('a',), (Foo, None)))
+        self.failIf(Foo in _signatures)
+
+    def test_provides_on_class_invalidates(self):
+        from repoze.component.registry import _class_add_types
+        from repoze.component.registry import _class_set_types
+        class Foo(object):
+            provides('a')
+        class Bar(Foo):
+            pass
+        self.assertEqual(self._callFUT(Bar()), (('a',), (Bar, None)))
+        _class_add_types(Foo, ('b',))
+        self.assertEqual(self._callFUT(Bar()), (('b', 'a'), (Bar, None)))
+        _class_set_types(Foo, ('c',))
+        self.assertEqual(self._callFUT(Bar()), (('c',), (Bar, None)))
+
+    def test_emptied_when_full(self):
+        from repoze.component import registry
+        old = registry._maxsignatures
+        registry._maxsignatures = 1
+        try:
+            class Foo(object):
+                pass
+            class Bar(object):
+                pass
+            self._callFUT(Foo())
+            self._callFUT(Bar())
+            self.assertEqual(registry._signatures.keys(), [Bar])
+        finally:
+            registry._maxsignatures = old
+
 class TestDirectlyProvidedBy(unittest.TestCase):
     def _callFUT(self, obj):
         from repoze.component import directlyprovidedby
@@ -1062,8 +3327,34 @@ class OSInheritsBarris(OSBarris):
     def __init__(self, context):
         self.context = context
     
+class PicklableWhat(str):
+    provides('abc')
+
+class DummyResolver(object):
+    def __init__(self, objects=None):
+        self.objects = objects
+        self.resolved = []
+
+    def __call__(self, dottedname):
+        if self.objects is None:
+            result = dottedname.upper()
+        else:
+            result = self.objects[dottedname]
+        self.resolved.append(dottedname)
+        return result
+
 class DummyLRUCache(dict):
+    def __init__(self):
+        self.invalidated = []
+
     def clear(self):
         self.cleared = True
         dict.clear(self)
+
+    def put(self, key, val):
+        self[key] = val
+
+    def invalidate(self, key):
+        self.invalidated.append(key)
+        self.pop(key, None)
         
@@ -27,7 +27,7 @@ except IOError:
 
 requires = ['repoze.lru']
 
-testing_extras = ['nose', 'coverage']
+testing_extras = ['nose', 'coverage', 'trollius', 'futures']
 
 setup(name='repoze.component',
       version=__version__,